@@ -1,10 +1,97 @@
 from django.contrib import admin
+from django.db import connections
+from django.core.cache import cache
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
+from cash_flow_prediction.db_router import read_from_replica
 from cash_flow.models import (NBFCEligibilityCashFlowHead, CollectionAndLoanBookedData, LoanDetail,
                               ProjectionCollectionData, NbfcBranchMaster, NbfcWiseCollectionData, CapitalInflowData,
-                              HoldCashData, UserRatioData, LoanBookedLogs, CollectionLogs, UserPermissionModel)
-
-
-class NBFCEligibilityAdmin(admin.ModelAdmin):
+                              HoldCashData, UserRatioData, LoanBookedLogs, CollectionLogs, UserPermissionModel,
+                              ProjectionCollectionDailyRollup, LoanBookedLogsDailyRollup, CollectionLogsDailyRollup,
+                              DailyBookingAggregate, AvailableBalanceEvent, AvailableBalanceSnapshot,
+                              AvailableBalanceLedger)
+
+
+class ReplicaChangeListAdmin(admin.ModelAdmin):
+    """
+    base model admin serving the changelist pages from the read replica, the actions posted from the changelist
+    and every other admin page stay on the primary
+    """
+    def changelist_view(self, request, extra_context=None):
+        if request.method != 'GET':
+            return super().changelist_view(request, extra_context)
+        return self.render_changelist_view(request, extra_context)
+
+    @read_from_replica
+    def render_changelist_view(self, request, extra_context=None):
+        response = super().changelist_view(request, extra_context)
+        # the template response is rendered lazily, the queries of the page run while rendering
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    paginator using the planner's row estimate from pg_class for the unfiltered changelists of large tables
+    instead of a COUNT(*) over the whole table, filtered changelists and small tables are counted exactly
+    """
+    exact_count_threshold = 100000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        connection = connections[queryset.db]
+        if connection.vendor == 'postgresql' and not queryset.query.where:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE relname = %s',
+                               [queryset.model._meta.db_table])
+                row = cursor.fetchone()
+            if row and row[0] > self.exact_count_threshold:
+                return row[0]
+        return super().count
+
+
+class CachedNbfcListFilter(admin.SimpleListFilter):
+    """
+    nbfc list filter with the choices cached instead of loading every models.NbfcBranchMaster row per page view
+    """
+    title = 'nbfc'
+    parameter_name = 'nbfc'
+
+    def lookups(self, request, model_admin):
+        return cache.get_or_set(
+            'admin_nbfc_filter_choices',
+            lambda: list(NbfcBranchMaster.objects.order_by('id').values_list('id', 'branch_name')),
+            600
+        )
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(nbfc_id=self.value())
+        return queryset
+
+
+class LargeTableAdmin(ReplicaChangeListAdmin):
+    """
+    base model admin for the tables with millions of rows, the changelist uses the estimated count, a single
+    count query and the related nbfc in the same query
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_select_related = ['nbfc']
+    # columns loaded for the changelist page, the change page and the actions load the whole row
+    changelist_only_fields = None
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request)
+        if self.changelist_only_fields and request.method == 'GET' and request.resolver_match and \
+                request.resolver_match.url_name.endswith('_changelist'):
+            queryset = queryset.only(*self.changelist_only_fields, 'nbfc__id', 'nbfc__branch_name')
+        return queryset
+
+
+class NBFCEligibilityAdmin(ReplicaChangeListAdmin):
     model = NBFCEligibilityCashFlowHead
     search_fields = ['nbfc']
     list_display = ['nbfc', 'loan_type', 'min_cibil_score', 'min_loan_tenure', 'max_loan_tenure', 'min_loan_amount',
@@ -16,7 +103,7 @@ class NBFCEligibilityAdmin(admin.ModelAdmin):
 admin.site.register(NBFCEligibilityCashFlowHead, NBFCEligibilityAdmin)
 
 
-class CollectionAndLoanBookedDataAdmin(admin.ModelAdmin):
+class CollectionAndLoanBookedDataAdmin(ReplicaChangeListAdmin):
     model = CollectionAndLoanBookedData
     search_fields = ['nbfc']
     list_display = ['nbfc', 'due_date', 'collection', 'created_at', 'updated_at']
@@ -26,29 +113,33 @@ class CollectionAndLoanBookedDataAdmin(admin.ModelAdmin):
 admin.site.register(CollectionAndLoanBookedData, CollectionAndLoanBookedDataAdmin)
 
 
-class LoanDetailAdmin(admin.ModelAdmin):
+class LoanDetailAdmin(LargeTableAdmin):
     model = LoanDetail
     search_fields = ['nbfc', 'user_id', 'status', 'credit_limit', 'user_type']
     list_display = ['id', 'loan_id', 'loan_type', 'nbfc', 'user_id', 'credit_limit', 'status', 'user_type', 'age',
                     'ckyc', 'ekyc', 'mkyc', 'created_at', 'updated_at']
 
-    list_filter = ['nbfc', 'status', 'user_type', 'created_at', 'updated_at']
+    list_filter = [CachedNbfcListFilter, 'status', 'user_type', 'created_at']
+    changelist_only_fields = ['id', 'loan_id', 'loan_type', 'nbfc', 'user_id', 'credit_limit', 'status', 'user_type',
+                              'age', 'ckyc', 'ekyc', 'mkyc', 'created_at', 'updated_at']
 
 
 admin.site.register(LoanDetail, LoanDetailAdmin)
 
 
-class ProjectionCollectionAdmin(admin.ModelAdmin):
+class ProjectionCollectionAdmin(LargeTableAdmin):
     model = ProjectionCollectionData
     search_fields = ['nbfc']
     list_display = ['nbfc', 'due_date', 'collection_date', 'old_user_amount', 'new_user_amount', 'created_at']
-    list_filter = ['nbfc', 'due_date', 'collection_date', 'created_at']
+    list_filter = [CachedNbfcListFilter, 'due_date', 'collection_date']
+    changelist_only_fields = ['nbfc', 'due_date', 'collection_date', 'old_user_amount', 'new_user_amount',
+                              'created_at']
 
 
 admin.site.register(ProjectionCollectionData, ProjectionCollectionAdmin)
 
 
-class NbfcBranchMasterAdmin(admin.ModelAdmin):
+class NbfcBranchMasterAdmin(ReplicaChangeListAdmin):
     model = NbfcBranchMaster
     search_fields = ['id', 'branch_name']
     list_display = ['id', 'branch_name', 'delay_in_disbursal', 'created_at', 'updated_at']
@@ -58,17 +149,21 @@ class NbfcBranchMasterAdmin(admin.ModelAdmin):
 admin.site.register(NbfcBranchMaster, NbfcBranchMasterAdmin)
 
 
-class NbfcWiseCollectionAdmin(admin.ModelAdmin):
+class NbfcWiseCollectionAdmin(LargeTableAdmin):
     model = NbfcWiseCollectionData
     search_fields = ['nbfc']
     list_display = ['nbfc', 'due_date', 'created_at', 'updated_at']
-    list_filter = ['nbfc', 'due_date', 'created_at', 'updated_at']
+    list_filter = [CachedNbfcListFilter, 'due_date']
+
+    def get_queryset(self, request):
+        # the collection json and curves are only needed on the change page, where they are loaded on access
+        return super().get_queryset(request).defer('collection_json', 'collection_curves')
 
 
 admin.site.register(NbfcWiseCollectionData, NbfcWiseCollectionAdmin)
 
 
-class CapitalInflowAdmin(admin.ModelAdmin):
+class CapitalInflowAdmin(ReplicaChangeListAdmin):
     model = CapitalInflowData
     search_fields = ['nbfc']
     list_display = ['nbfc', 'capital_inflow', 'created_at', 'updated_at']
@@ -78,7 +173,7 @@ class CapitalInflowAdmin(admin.ModelAdmin):
 admin.site.register(CapitalInflowData, CapitalInflowAdmin)
 
 
-class HoldCashAdmin(admin.ModelAdmin):
+class HoldCashAdmin(ReplicaChangeListAdmin):
     model = HoldCashData
     search_fields = ['nbfc']
     list_display = ['nbfc', 'hold_cash', 'created_at', 'updated_at']
@@ -88,7 +183,7 @@ class HoldCashAdmin(admin.ModelAdmin):
 admin.site.register(HoldCashData, HoldCashAdmin)
 
 
-class UserRatioAdmin(admin.ModelAdmin):
+class UserRatioAdmin(ReplicaChangeListAdmin):
     model = UserRatioData
     search_fields = ['nbfc']
     list_display = ['nbfc', 'old_percentage', 'new_percentage', 'created_at', 'updated_at']
@@ -98,7 +193,7 @@ class UserRatioAdmin(admin.ModelAdmin):
 admin.site.register(UserRatioData, UserRatioAdmin)
 
 
-class LoanBookedLogsAdmin(admin.ModelAdmin):
+class LoanBookedLogsAdmin(ReplicaChangeListAdmin):
     model = LoanBookedLogs
     search_fields = ['loan']
     list_display = ['loan', 'log_text', 'amount', 'request_type', 'created_at', 'updated_at']
@@ -108,7 +203,7 @@ class LoanBookedLogsAdmin(admin.ModelAdmin):
 admin.site.register(LoanBookedLogs, LoanBookedLogsAdmin)
 
 
-class CollectionLogsAdmin(admin.ModelAdmin):
+class CollectionLogsAdmin(ReplicaChangeListAdmin):
     model = CollectionLogs
     search_fields = ['collection']
     list_display = ['collection', 'amount', 'log_text', 'created_at', 'updated_at']
@@ -118,7 +213,7 @@ class CollectionLogsAdmin(admin.ModelAdmin):
 admin.site.register(CollectionLogs, CollectionLogsAdmin)
 
 
-class UserPermissionAdmin(admin.ModelAdmin):
+class UserPermissionAdmin(ReplicaChangeListAdmin):
     model = UserPermissionModel
     search_fields = ['user_id', 'email']
     list_display = ['user_id', 'email', 'role', 'is_active']
@@ -126,3 +221,66 @@ class UserPermissionAdmin(admin.ModelAdmin):
 
 
 admin.site.register(UserPermissionModel, UserPermissionAdmin)
+
+
+class ProjectionCollectionDailyRollupAdmin(ReplicaChangeListAdmin):
+    model = ProjectionCollectionDailyRollup
+    list_display = ['nbfc', 'collection_date', 'row_count', 'amount', 'old_user_amount', 'new_user_amount']
+    list_filter = ['nbfc']
+
+
+admin.site.register(ProjectionCollectionDailyRollup, ProjectionCollectionDailyRollupAdmin)
+
+
+class LoanBookedLogsDailyRollupAdmin(ReplicaChangeListAdmin):
+    model = LoanBookedLogsDailyRollup
+    list_display = ['nbfc', 'date', 'request_type', 'row_count', 'amount']
+    list_filter = ['nbfc', 'request_type']
+
+
+admin.site.register(LoanBookedLogsDailyRollup, LoanBookedLogsDailyRollupAdmin)
+
+
+class CollectionLogsDailyRollupAdmin(ReplicaChangeListAdmin):
+    model = CollectionLogsDailyRollup
+    list_display = ['nbfc', 'date', 'row_count', 'amount']
+    list_filter = ['nbfc']
+
+
+admin.site.register(CollectionLogsDailyRollup, CollectionLogsDailyRollupAdmin)
+
+
+class DailyBookingAggregateAdmin(ReplicaChangeListAdmin):
+    model = DailyBookingAggregate
+    list_display = ['date', 'nbfc', 'user_type', 'status', 'loan_count', 'amount', 'credit_limit', 'updated_at']
+    list_filter = ['user_type', 'status']
+
+
+admin.site.register(DailyBookingAggregate, DailyBookingAggregateAdmin)
+
+
+class AvailableBalanceEventAdmin(LargeTableAdmin):
+    model = AvailableBalanceEvent
+    list_display = ['id', 'nbfc', 'user_type', 'date', 'sequence', 'amount', 'request_type', 'loan', 'created_at']
+    list_filter = [CachedNbfcListFilter, 'user_type', 'request_type', 'date']
+    raw_id_fields = ['loan']
+
+
+admin.site.register(AvailableBalanceEvent, AvailableBalanceEventAdmin)
+
+
+class AvailableBalanceSnapshotAdmin(ReplicaChangeListAdmin):
+    model = AvailableBalanceSnapshot
+    list_display = ['date', 'created_at', 'updated_at']
+
+
+admin.site.register(AvailableBalanceSnapshot, AvailableBalanceSnapshotAdmin)
+
+
+class AvailableBalanceLedgerAdmin(ReplicaChangeListAdmin):
+    model = AvailableBalanceLedger
+    list_display = ['nbfc', 'user_type', 'date', 'last_sequence', 'updated_at']
+    list_filter = ['user_type', 'date']
+
+
+admin.site.register(AvailableBalanceLedger, AvailableBalanceLedgerAdmin)
@@ -0,0 +1,121 @@
+import base64
+from datetime import datetime
+
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from django.db.models import Sum, Q, OuterRef, Subquery
+
+from cash_flow.models import LoanDetail, ProjectionCollectionData, DailyBookingAggregate
+from cash_flow_prediction.db_router import read_from_replica
+from utils.common_helper import fetch_file_with_date_and_request_type, stream_csv_response
+
+
+class ExportBookingAmount(APIView):
+    """
+    api view to export booking amount against the predicted cash inflow per nbfc for a range of dates as a
+    streamed csv, date can be passed instead of start_date and end_date for a single day
+    """
+
+    @read_from_replica
+    def get(self, request):
+        payload = request.query_params
+        start_date = payload.get('start_date') or payload.get('date')
+        end_date = payload.get('end_date') or start_date
+
+        if not start_date:
+            return Response({'error': 'Invalid Date'}, status=status.HTTP_406_NOT_ACCEPTABLE)
+        try:
+            start_date = datetime.strptime(start_date, "%Y-%m-%d").date()
+            end_date = datetime.strptime(end_date, "%Y-%m-%d").date()
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        if end_date < start_date:
+            return Response({"error": "end_date can only be greater than equal to the start_date"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        booking_amount = DailyBookingAggregate.objects.filter(
+            nbfc_id=OuterRef('nbfc_id'), date=OuterRef('collection_date')
+        ).order_by().values('nbfc_id')
+        export_rows = ProjectionCollectionData.objects.filter(
+            collection_date__gte=start_date, collection_date__lte=end_date
+        ).values('collection_date', 'nbfc_id', 'nbfc__branch_name').order_by(
+            'collection_date', 'nbfc__branch_name'
+        ).annotate(
+            total_predicted_amount=Sum('amount'),
+            old_booking=Subquery(booking_amount.annotate(
+                old_booking=Sum('amount', filter=Q(user_type='O'))).values('old_booking')),
+            new_booking=Subquery(booking_amount.annotate(
+                new_booking=Sum('amount', filter=Q(user_type='N'))).values('new_booking'))
+        ).values_list('collection_date', 'nbfc__branch_name', 'total_predicted_amount', 'old_booking', 'new_booking')
+
+        # the rows are read after get() returns, so the database chosen by the router is pinned here
+        export_rows = export_rows.using(export_rows.db)
+
+        header = ['Date', 'NBFC', 'Predicted Cash Inflow', 'Booking amount of Old User As Per Existing Logic',
+                  'Booking amount of New User As Per Existing Logic', 'Booking amount of Old User As Per New Logic',
+                  'Booking amount of New User As Per New Logic']
+        rows = (
+            (collection_date, nbfc, predicted_cash_inflow, None, None, old_booking, new_booking)
+            for collection_date, nbfc, predicted_cash_inflow, old_booking, new_booking in
+            export_rows.iterator(chunk_size=500)
+        )
+        return stream_csv_response(header, rows, f'booking_amount_{start_date}_{end_date}.csv')
+
+
+class GetLoanDetailData(APIView):
+
+    @read_from_replica
+    def get(self, request):
+        payload = request.query_params
+        start_date = payload.get('start_date')
+        end_date = payload.get('end_date')
+        if start_date is None or end_date is None:
+            return Response({'error': 'start_date and end_date are required'},
+                            status=status.HTTP_406_NOT_ACCEPTABLE)
+
+        loan_status = payload.get('loan_status', None)
+        if loan_status and loan_status not in ['P', 'I', 'F']:
+            return Response({'error': 'Invalid loan status'}, status=status.HTTP_400_BAD_REQUEST)
+        # pandas is only needed by this rarely used export, it is not loaded by the serving processes until then
+        import pandas as pd
+
+        loan_data_df = pd.DataFrame()
+        if loan_status:
+            loan_data = LoanDetail.objects.filter(status=loan_status, status_date__gte=start_date,
+                                                  status_date__lte=end_date).values()
+            loan_data_df = pd.DataFrame(loan_data)
+        else:
+            loan_data = LoanDetail.objects.filter(status_date__gte=start_date,
+                                                  status_date__lte=end_date).values()
+            loan_data_df = pd.DataFrame(loan_data)
+
+        if loan_data_df.empty:
+            return Response({'message': 'No booking data found'}, status=status.HTTP_404_NOT_FOUND)
+
+        csv_data = loan_data_df.to_csv(index=False)
+        csv_bytes = csv_data.encode('utf-8')
+        base64_data = base64.b64encode(csv_bytes).decode('utf-8')
+
+        return Response({'message': 'Success', 'url': 'data:text/csv;base64,' + base64_data})
+
+
+class GetLogFile(APIView):
+    """
+    api view that fetches the log file from the logs directory based on the date filter and
+    a non-mandatory filter as request_type
+    """
+    def get(self, request):
+        payload = request.query_params
+        date = payload.get('date', None)
+        if not date:
+            return Response({'error': 'date field is required'}, status=status.HTTP_400_BAD_REQUEST)
+        request_type = payload.get('request_type', None)
+        if request_type and request_type not in ['CL', 'LAN', 'LAD']:
+            return Response({'error': 'Invalid request type, has to be from CL, LAN or LAD'},
+                            status=status.HTTP_400_BAD_REQUEST)
+        url = fetch_file_with_date_and_request_type(date, request_type)
+        if not url:
+            return Response({'message': 'No log file found'}, status=status.HTTP_404_NOT_FOUND)
+        return Response({'url': url}, status=status.HTTP_200_OK)
@@ -0,0 +1,34 @@
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views import View
+from rest_framework import exceptions
+
+from cash_flow.api.v1.authenticator import ServerAuthentication
+from utils.balance_stream_helper import stream_balance_events
+
+
+class RealTimeNBFCStream(View):
+    """
+    server sent events stream of the available balance, pushing the changed nbfc's as bookings, unbookings and
+    recomputes happen instead of RealTimeNBFCDetail being polled, to be served by the asgi app as every open stream
+    holds a worker of a wsgi server
+    """
+    async def get(self, request):
+        """
+        get request which takes the optional nbfc_id in the query params
+        """
+        try:
+            ServerAuthentication().authenticate(request)
+        except exceptions.AuthenticationFailed as e:
+            return JsonResponse({'detail': str(e.detail)}, status=401)
+
+        nbfc_id = request.GET.get('nbfc_id') or None
+        if nbfc_id is not None:
+            if not nbfc_id.isdigit():
+                return JsonResponse({'error': 'Invalid nbfc_id'}, status=400)
+            nbfc_id = int(nbfc_id)
+
+        response = StreamingHttpResponse(stream_balance_events(nbfc_id), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # proxies are not to buffer the events
+        response['X-Accel-Buffering'] = 'no'
+        return response
@@ -3,9 +3,10 @@ from rest_framework import routers
 from django.urls import path
 from cash_flow.api.v1.views import (CapitalInflowDataView, HoldCashDataView, UserRatioDataView,
                                     GetCashFlowView, NBFCBranchView, BookNBFCView, NBFCEligibilityViewSet,
-                                    CreatePredictionData, ExportBookingAmount,
-                                    UserPermissionModelViewSet, MigrateView, RealTimeNBFCDetail,
-                                    GetLoanDetailData, GetLogFile)
+                                    CreatePredictionData, UserPermissionModelViewSet, MigrateView,
+                                    RealTimeNBFCDetail, DatabasePoolStats)
+from cash_flow.api.v1.export_views import ExportBookingAmount, GetLoanDetailData, GetLogFile
+from cash_flow.api.v1.stream_views import RealTimeNBFCStream
 
 router = routers.DefaultRouter()
 router.register(r'user-permissions', UserPermissionModelViewSet, basename='user-permissions')
@@ -29,8 +30,10 @@ urlpatterns = [
          name='user-permissions'),
     path('migrate/', MigrateView.as_view(), name='migrate'),
     path('real-time-nbfc-detail/', RealTimeNBFCDetail.as_view(), name='real-time-nbfc-detail'),
+    path('real-time-nbfc-stream/', RealTimeNBFCStream.as_view(), name='real-time-nbfc-stream'),
     path('get-loan-detail-data/', GetLoanDetailData.as_view(), name='get-loan-detail-data'),
     path('get-log-file/', GetLogFile.as_view(), name='get-log-file'),
+    path('db-pool-stats/', DatabasePoolStats.as_view(), name='db-pool-stats'),
 ]
 
 urlpatterns += router.urls
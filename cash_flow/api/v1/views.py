@@ -1,11 +1,10 @@
 import os
-import pandas as pd
-import base64
 from datetime import datetime
 
 from rest_framework.permissions import AllowAny
 from rest_framework.viewsets import ModelViewSet
 from utils.utils import BaseModelViewSet
+from utils.pagination_helper import KeysetPagination
 from rest_framework import status
 from rest_framework.response import Response
 from rest_framework.views import APIView
@@ -14,14 +13,28 @@ from django.core.cache import cache
 from django.db.models import Sum
 
 from cash_flow.models import (HoldCashData, CapitalInflowData, UserRatioData, NbfcBranchMaster,
-                              NBFCEligibilityCashFlowHead, LoanDetail, ProjectionCollectionData,
-                              UserPermissionModel)
+                              NBFCEligibilityCashFlowHead, LoanDetail, UserPermissionModel, DailyBookingAggregate)
 from cash_flow.serializers import NBFCEligibilityCashFlowHeadSerializer, UserPermissionModelSerializer
 from cash_flow.tasks import (populate_available_cash_flow, task_for_loan_booked, populate_json_against_nbfc,
                              task_for_loan_booking, populate_wacm, run_migrate)
 from cash_flow.api.v1.authenticator import CustomAuthentication, ServerAuthentication
-from utils.common_helper import (Common, calculate_age, save_log_response_for_booking_api,
-                                 fetch_file_with_date_and_request_type, create_kyc_filter)
+from cash_flow_prediction.db_router import read_from_replica
+from cash_flow_prediction.db_pool import get_db_pool_stats
+from utils.balance_helper import get_available_balance
+from utils.common_helper import Common, calculate_age, save_log_response_for_booking_api, get_eligible_branches
+from utils.local_cache_helper import get_should_check_branches
+from utils.idempotency_helper import idempotent_response
+from utils.admission_helper import admission_control
+from utils.booking_aggregate_helper import get_status_date_filter
+from utils.etag_helper import (conditional_response, get_nbfc_scope, CASH_FLOW_SCOPE, BRANCH_MASTER_SCOPE,
+                               ELIGIBILITY_SCOPE, AVAILABLE_BALANCE_SCOPE)
+
+
+def get_nbfc_scopes(request) -> list:
+    """
+    :return: the version scopes of the cash flow data of the nbfc_id in the query params
+    """
+    return [get_nbfc_scope(request.query_params.get('nbfc_id')), CASH_FLOW_SCOPE, BRANCH_MASTER_SCOPE]
 
 
 class NBFCBranchView(APIView):
@@ -63,16 +76,19 @@ class NBFCBranchView(APIView):
             error_message = str(e)
             return Response({'error': error_message}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @conditional_response(lambda request: [BRANCH_MASTER_SCOPE])
     def get(self, request):
         """
         api for getting the list of registered NBFC's in the branch master
         :param request: nothing to be passed into params
-        :return: the list of the registered NBFC's in the branch master with corresponding ids
+        :return: a page of the registered NBFC's in the branch master with corresponding ids, see
+        utils.pagination_helper.KeysetPagination for the paging params
         """
-        queryset = NbfcBranchMaster.objects.all()
-        nbfc_dict = dict(queryset.values_list('branch_name', 'id'))
+        paginator = KeysetPagination()
+        branches = paginator.paginate_queryset(NbfcBranchMaster.objects.values('branch_name', 'id'), request, self)
+        nbfc_dict = dict((branch['branch_name'], branch['id']) for branch in branches)
 
-        return Response({'data': nbfc_dict}, status=status.HTTP_200_OK)
+        return Response(paginator.get_paginated_data(nbfc_dict, data_key='data'), status=status.HTTP_200_OK)
 
 
 class CapitalInflowDataView(APIView):
@@ -132,6 +148,7 @@ class CapitalInflowDataView(APIView):
             error_message = str(e)
             return Response({'error': error_message}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @conditional_response(get_nbfc_scopes)
     def get(self, request):
         """
         get request for getting capital inflow data for a particular nbfc_id and due_date
@@ -223,6 +240,7 @@ class HoldCashDataView(APIView):
             error_message = str(e)
             return Response({'error': error_message}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @conditional_response(get_nbfc_scopes)
     def get(self, request):
         """
         get request for getting hold cash data for a particular nbfc_id and due_date
@@ -317,6 +335,7 @@ class UserRatioDataView(APIView):
             error_message = str(e)
             return Response({'error': error_message}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @conditional_response(get_nbfc_scopes)
     def get(self, request):
         """
         get request for getting user ratio data for a particular nbfc_id and due_date
@@ -361,6 +380,8 @@ class GetCashFlowView(BaseModelViewSet):
     """
     authentication_classes = [CustomAuthentication]
 
+    @conditional_response(get_nbfc_scopes)
+    @read_from_replica
     def get(self, request):
         payload = request.query_params
         nbfc_id = payload.get('nbfc_id', None)
@@ -379,7 +400,8 @@ class GetCashFlowView(BaseModelViewSet):
         predicted_cash_inflow = Common.get_predicted_cash_inflow(nbfc_id, due_date)
 
         # loan_booked = task_for_loan_booked(nbfc_id, due_date)
-        loan_booked = LoanDetail.objects.filter(updated_at__date=due_date, is_booked=True, nbfc_id=nbfc_id, status='P').aggregate(Sum('amount'))['amount__sum'] or 0
+        loan_booked = DailyBookingAggregate.objects.filter(date=due_date, nbfc_id=nbfc_id, status='P').aggregate(
+            Sum('amount'))['amount__sum'] or 0
 
         collection_data = Common.get_collection_and_last_day_balance(nbfc_id, due_date)
         collection = collection_data[0]
@@ -433,10 +455,14 @@ class SuccessStatus(APIView):
 class BookNBFCView(APIView):
     authentication_classes = [ServerAuthentication]
 
+    @admission_control('book_nbfc', 'BOOKING_RATE_LIMIT', 'BOOKING_RATE_BURST', 'BOOKING_MAX_IN_FLIGHT',
+                       'BOOKING_MAX_DB_WAIT_MS', log_response=save_log_response_for_booking_api)
+    @idempotent_response(identity_fields=('user_id', 'loan_id', 'request_type'),
+                         log_response=save_log_response_for_booking_api)
     def post(self, request):
         payload = request.data
         assigned_nbfc = payload.get('assigned_nbfc', None)
-        should_check_list = cache.get('should_check', [])
+        should_check_list = get_should_check_branches()
 
         if assigned_nbfc and assigned_nbfc not in should_check_list:
             response = Response({'message': 'no change in nbfc because assigned_nbfc not present in should check '
@@ -530,8 +556,8 @@ class BookNBFCView(APIView):
     def get_nbfc_for_loan_booking(self, assigned_nbfc, user_id, loan_id, user_type, credit_limit, loan_type,
                                   request_type, cibil_score, amount, due_date, common_instance, age, ckyc, ekyc, mkyc):
         today = datetime.now().date()
-        user_loan_status = LoanDetail.objects.filter(user_id=user_id, loan_id=loan_id, updated_at__date=today,
-                                                     is_booked=True).first()
+        user_loan_status = LoanDetail.objects.filter(get_status_date_filter(today, today), user_id=user_id,
+                                                     loan_id=loan_id, is_booked=True).first()
         assigned_nbfc = user_loan_status.nbfc_id if user_loan_status else assigned_nbfc
         # assigned_nbfc line should be removed when we go live in productivity
 
@@ -540,26 +566,13 @@ class BookNBFCView(APIView):
         tenure_days = int(loan_type[1:]) if loan_type.startswith('E') else 45
         eligibility_loan_type = 'E' if loan_type != 'P' else 'P'
 
-        kyc_filter = create_kyc_filter(ckyc, ekyc, mkyc)
-        eligibility_queryset = NBFCEligibilityCashFlowHead.objects.filter(
-            kyc_filter,
-            loan_type=eligibility_loan_type,
-            min_cibil_score__lte=cibil_score,
-            min_loan_tenure__lte=tenure_days,
-            max_loan_tenure__gte=tenure_days,
-            min_loan_amount__lte=amount,
-            max_loan_amount__gte=amount,
-            min_age__lte=age,
-            max_age__gte=age,
-            should_assign=True
-        )
-
-        eligible_branches_list = list(eligibility_queryset.values_list('nbfc', flat=True))
+        eligible_branches_list = get_eligible_branches(eligibility_loan_type, cibil_score, tenure_days, amount, age,
+                                                       ckyc, ekyc, mkyc)
         if not eligible_branches_list:
             return assigned_nbfc, None
 
         # removing append assigned_nbfc in the list as it should be checked using should_assign=True only
-        cached_available_balance = cache.get('available_balance', {})
+        cached_available_balance = get_available_balance()
         eligible_branches_list = set(cached_available_balance.keys()).intersection(eligible_branches_list)
 
         if assigned_nbfc and assigned_nbfc in eligible_branches_list:
@@ -613,7 +626,10 @@ class NBFCEligibilityViewSet(ModelViewSet):
     authentication_classes = [CustomAuthentication]
     queryset = NBFCEligibilityCashFlowHead.objects.all()
     lookup_field = 'nbfc'
+    # newest first as the model ordering, on the primary key as created_at is not unique
+    keyset_ordering = '-id'
 
+    @conditional_response(lambda request: [ELIGIBILITY_SCOPE])
     def list(self, request, *args, **kwargs):
         nbfc_value = request.data.get('nbfc', None)
 
@@ -624,8 +640,9 @@ class NBFCEligibilityViewSet(ModelViewSet):
             # If nbfc is not provided, get all objects
             queryset = self.filter_queryset(self.get_queryset())
 
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
     def create(self, request, *args, **kwargs):
         nbfc = request.data.get('nbfc')
@@ -683,64 +700,6 @@ class CreatePredictionData(APIView):
         return Response({'message': 'Success'}, status=status.HTTP_201_CREATED)
 
 
-class ExportBookingAmount(APIView):
-    """
-    api view to export booking amount
-    """
-
-    def get(self, request):
-        payload = request.query_params
-        date = payload.get('date')
-
-        if not date:
-            return Response({'error': 'Invalid Date'}, status=status.HTTP_406_NOT_ACCEPTABLE)
-        try:
-            old_user_loan_booking_data = LoanDetail.objects.filter(
-                updated_at__date=date, is_booked=True, user_type='O'
-            ).values('nbfc__branch_name').order_by('nbfc__branch_name').annotate(old_booking=Sum('amount'))
-
-            new_user_loan_booking_data = LoanDetail.objects.filter(
-                updated_at__date=date, is_booked=True, user_type='N'
-            ).values('nbfc__branch_name').order_by('nbfc__branch_name').annotate(new_booking=Sum('amount'))
-
-            predicted_cash_inflow = ProjectionCollectionData.objects.filter(collection_date=date).values(
-                'nbfc__branch_name').order_by('nbfc__branch_name').annotate(total_predicted_amount=Sum('amount'))
-
-            df_predicted_cash_inflow = pd.DataFrame(predicted_cash_inflow)
-            df_old_user_loan_booking_data = pd.DataFrame(old_user_loan_booking_data)
-            df_new_user_loan_booking_data = pd.DataFrame(new_user_loan_booking_data)
-
-            if df_predicted_cash_inflow.empty or df_old_user_loan_booking_data.empty or df_new_user_loan_booking_data.empty:
-                return Response({'message': 'No data found for the given date'}, status=status.HTTP_404_NOT_FOUND)
-
-            merged_df = pd.merge(df_predicted_cash_inflow, df_old_user_loan_booking_data, on='nbfc__branch_name',
-                                 how='left')
-            merged_df = pd.merge(merged_df, df_new_user_loan_booking_data, on='nbfc__branch_name', how='left')
-
-            # Create a new dataframe with the desired structure
-            merged_df['Date'] = date
-            merged_df['Booking amount of Old User As Per Existing Logic'] = None
-            merged_df['Booking amount of New User As Per Existing Logic'] = None
-            merged_df.rename(
-                columns={'nbfc__branch_name': 'NBFC', 'old_booking': 'Booking amount of Old User As Per New Logic',
-                         'new_booking': 'Booking amount of New User As Per New Logic', 'total_predicted_amount':
-                             'Predicted Cash Inflow'}, inplace=True)
-            merged_df = merged_df[
-                ['Date', 'NBFC', 'Predicted Cash Inflow', 'Booking amount of Old User As Per Existing Logic',
-                 'Booking amount of New User As Per Existing Logic',
-                 'Booking amount of Old User As Per New Logic',
-                 'Booking amount of New User As Per New Logic']]
-
-            csv_data = merged_df.to_csv(index=False)
-            csv_bytes = csv_data.encode('utf-8')
-            base64_data = base64.b64encode(csv_bytes).decode('utf-8')
-
-            return Response({'message': 'Success', 'url': 'data:text/csv;base64,' + base64_data})
-        except Exception as e:
-            msg = str(e)
-            return Response({'error': msg}, status=status.HTTP_400_BAD_REQUEST)
-
-
 class UserPermissionModelViewSet(ModelViewSet):
     authentication_classes = [CustomAuthentication]
     queryset = UserPermissionModel.objects.all()
@@ -759,8 +718,9 @@ class UserPermissionModelViewSet(ModelViewSet):
             queryset = UserPermissionModel.objects.filter(user_id=user_id)
         else:
             queryset = UserPermissionModel.objects.all()
-        serializer = self.get_serializer(queryset, many=True)
-        return Response(serializer.data)
+        page = self.paginate_queryset(queryset)
+        serializer = self.get_serializer(page, many=True)
+        return self.get_paginated_response(serializer.data)
 
     def partial_update(self, request, *args, **kwargs):
         instance = self.get_object()
@@ -795,6 +755,8 @@ class RealTimeNBFCDetail(APIView):
     """
     authentication_classes = [ServerAuthentication]
 
+    @conditional_response(lambda request: [AVAILABLE_BALANCE_SCOPE])
+    @read_from_replica
     def get(self, request):
         """
         get request which takes the nbfc_id in the query params
@@ -804,7 +766,7 @@ class RealTimeNBFCDetail(APIView):
 
         try:
             loan_booked_data = cache.get('loan_booked_data', {})
-            available_balance_data = cache.get('available_balance', {})
+            available_balance_data = get_available_balance()
 
             if nbfc_id is None or nbfc_id == '':
                 return Response(
@@ -834,54 +796,11 @@ class RealTimeNBFCDetail(APIView):
             return Response({'error': msg}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-class GetLoanDetailData(APIView):
-
-    def get(self, request):
-        payload = request.query_params
-        start_date = payload.get('start_date')
-        end_date = payload.get('end_date')
-        if start_date is None or end_date is None:
-            return Response({'error': 'start_date and end_date are required'},
-                            status=status.HTTP_406_NOT_ACCEPTABLE)
-
-        loan_status = payload.get('loan_status', None)
-        if loan_status and loan_status not in ['P', 'I', 'F']:
-            return Response({'error': 'Invalid loan status'}, status=status.HTTP_400_BAD_REQUEST)
-        loan_data_df = pd.DataFrame()
-        if loan_status:
-            loan_data = LoanDetail.objects.filter(status=loan_status, updated_at__date__gte=start_date,
-                                                  updated_at__date__lte=end_date).values()
-            loan_data_df = pd.DataFrame(loan_data)
-        else:
-            loan_data = LoanDetail.objects.filter(updated_at__date__gte=start_date,
-                                                  updated_at__date__lte=end_date).values()
-            loan_data_df = pd.DataFrame(loan_data)
-
-        if loan_data_df.empty:
-            return Response({'message': 'No booking data found'}, status=status.HTTP_404_NOT_FOUND)
-
-        csv_data = loan_data_df.to_csv(index=False)
-        csv_bytes = csv_data.encode('utf-8')
-        base64_data = base64.b64encode(csv_bytes).decode('utf-8')
-
-        return Response({'message': 'Success', 'url': 'data:text/csv;base64,' + base64_data})
-
-
-class GetLogFile(APIView):
+class DatabasePoolStats(APIView):
     """
-    api view that fetches the log file from the logs directory based on the date filter and
-    a non-mandatory filter as request_type
+    api view to get the database connection pool utilization and wait time metrics of the serving process
     """
+    authentication_classes = [ServerAuthentication]
+
     def get(self, request):
-        payload = request.query_params
-        date = payload.get('date', None)
-        if not date:
-            return Response({'error': 'date field is required'}, status=status.HTTP_400_BAD_REQUEST)
-        request_type = payload.get('request_type', None)
-        if request_type and request_type not in ['CL', 'LAN', 'LAD']:
-            return Response({'error': 'Invalid request type, has to be from CL, LAN or LAD'},
-                            status=status.HTTP_400_BAD_REQUEST)
-        url = fetch_file_with_date_and_request_type(date, request_type)
-        if not url:
-            return Response({'message': 'No log file found'}, status=status.HTTP_404_NOT_FOUND)
-        return Response({'url': url}, status=status.HTTP_200_OK)
+        return Response({'pid': os.getpid(), 'data': get_db_pool_stats()}, status=status.HTTP_200_OK)
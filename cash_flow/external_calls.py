@@ -1,6 +1,6 @@
 from typing import Any
-import requests
 from django.conf import settings
+from utils.circuit_breaker_helper import get_upstream_response
 
 
 def get_common_headers():
@@ -12,9 +12,10 @@ def get_common_headers():
     }
 
 
-def get_collection_poll_response(due_date: str) -> Any:
+def get_collection_poll_response(due_date: str, stream: bool = False) -> Any:
     """
     External api for getting the collection poll data
+    :param stream: if the body is to be read lazily by the caller, see utils.stream_json_helper
     :return: json response
     """
     url = settings.COLLECTION_PREDICTION_POLL_URL
@@ -22,13 +23,14 @@ def get_collection_poll_response(due_date: str) -> Any:
         "date": due_date
     }
     headers = get_common_headers()
-    response = requests.get(url=url, headers=headers, params=params, timeout=200)
+    response = get_upstream_response('collection_poll', url, headers, params, timeout=200, stream=stream)
     return response
 
 
-def get_due_amount_response(due_date: str) -> Any:
+def get_due_amount_response(due_date: str, stream: bool = False) -> Any:
     """
     external call for getting the due amount for different nbfc's
+    :param stream: if the body is to be read lazily by the caller, see utils.stream_json_helper
     :return: json response
     """
     url = settings.DUE_AMOUNT_URL
@@ -36,7 +38,7 @@ def get_due_amount_response(due_date: str) -> Any:
     params = {
         "date": due_date
     }
-    response = requests.get(url=url, headers=headers, params=params, timeout=300)
+    response = get_upstream_response('due_amount', url, headers, params, timeout=300, stream=stream)
     return response
 
 
@@ -47,13 +49,15 @@ def get_nbfc_list() -> Any:
     """
     url = settings.NBFC_LIST_URL
     headers = get_common_headers()
-    response = requests.get(url=url, headers=headers, timeout=300)
+    # the current list, a stored old one would be loaded as if it were new
+    response = get_upstream_response('nbfc_list', url, headers, timeout=300, allow_stale=False)
     return response
 
 
-def get_collection_amount_response(due_date: str) -> Any:
+def get_collection_amount_response(due_date: str, stream: bool = False) -> Any:
     """
     external call for getting the collection amount data for a particular due_date
+    :param stream: if the body is to be read lazily by the caller, see utils.stream_json_helper
     :return: json response
     """
     url = settings.COLLECTION_AMOUNT_URL
@@ -61,7 +65,7 @@ def get_collection_amount_response(due_date: str) -> Any:
     params = {
         "date": due_date
     }
-    response = requests.get(url=url, headers=headers, params=params, timeout=300)
+    response = get_upstream_response('collection_amount', url, headers, params, timeout=300, stream=stream)
     return response
 
 
@@ -75,7 +79,7 @@ def get_loan_booked_data(due_date: str) -> Any:
     params = {
         "date": due_date
     }
-    response = requests.get(url=url, headers=headers, params=params, timeout=300)
+    response = get_upstream_response('loan_booked', url, headers, params, timeout=300)
     return response
 
 
@@ -86,5 +90,6 @@ def get_failed_loan_data() -> Any:
     """
     url = settings.FAILED_LOAN_DATA
     headers = get_common_headers()
-    response = requests.get(url=url, headers=headers, timeout=300)
+    # the loans failed so far, an old list would fail the loans booked again since then
+    response = get_upstream_response('failed_loan_data', url, headers, timeout=300, allow_stale=False)
     return response
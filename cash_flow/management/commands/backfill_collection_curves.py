@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand
+
+from cash_flow.models import NbfcWiseCollectionData
+from utils.ce_curve_helper import encode_collection_curves
+
+
+class Command(BaseCommand):
+    """
+    management command to fill models.NbfcWiseCollectionData.collection_curves for the rows stored before the
+    column existed, the collection_json of a row is cleared once its curves are stored
+    """
+    help = 'Packs the collection_json of models.NbfcWiseCollectionData into collection_curves'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        queryset = NbfcWiseCollectionData.objects.filter(collection_json__isnull=False).only(
+            'id', 'collection_json', 'collection_curves')
+
+        batch = []
+        updated = 0
+        for instance in queryset.iterator(chunk_size=chunk_size):
+            if instance.collection_curves is None:
+                instance.collection_curves = encode_collection_curves(instance.collection_json)
+            instance.collection_json = None
+            batch.append(instance)
+            if len(batch) >= chunk_size:
+                updated += NbfcWiseCollectionData.objects.bulk_update(batch, ['collection_curves', 'collection_json'])
+                batch = []
+        if batch:
+            updated += NbfcWiseCollectionData.objects.bulk_update(batch, ['collection_curves', 'collection_json'])
+
+        self.stdout.write(self.style.SUCCESS(f'{updated} collection curves backfilled'))
@@ -0,0 +1,48 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Min, Max
+from django.db.models.functions import TruncDate
+
+from cash_flow.models import LoanDetail
+
+
+class Command(BaseCommand):
+    """
+    management command to fill models.LoanDetail.booking_date and status_date for the loans saved before the columns
+    existed, from the created_at and updated_at dates they were read by until then, in id ranges of chunk size so
+    every update is a short transaction next to the live bookings
+    """
+    help = 'Fills the booking_date and status_date of models.LoanDetail from created_at and updated_at'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=5000, help='ids updated per transaction')
+        parser.add_argument('--sleep', type=float, default=0, help='seconds to wait between the chunks')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        if chunk_size < 1:
+            raise CommandError('chunk-size can only be greater than equal to 1')
+
+        id_range = LoanDetail.objects.filter(status_date__isnull=True).aggregate(min_id=Min('id'), max_id=Max('id'))
+        booking_id_range = LoanDetail.objects.filter(booking_date__isnull=True).aggregate(
+            min_id=Min('id'), max_id=Max('id'))
+        start_ids = [value for value in (id_range['min_id'], booking_id_range['min_id']) if value is not None]
+        if not start_ids:
+            self.stdout.write(self.style.SUCCESS('no loan to be backfilled'))
+            return
+        start_id = min(start_ids)
+        max_id = max(value for value in (id_range['max_id'], booking_id_range['max_id']) if value is not None)
+
+        status_dates = booking_dates = 0
+        while start_id <= max_id:
+            chunk = LoanDetail.objects.filter(id__gte=start_id, id__lt=start_id + chunk_size)
+            # a loan saved in the meantime already has its columns set by the save and is left as it is
+            status_dates += chunk.filter(status_date__isnull=True).update(status_date=TruncDate('updated_at'))
+            booking_dates += chunk.filter(booking_date__isnull=True).update(booking_date=TruncDate('created_at'))
+            start_id += chunk_size
+            if options['sleep']:
+                time.sleep(options['sleep'])
+
+        self.stdout.write(self.style.SUCCESS(f'{status_dates} status dates and {booking_dates} booking dates '
+                                             f'backfilled'))
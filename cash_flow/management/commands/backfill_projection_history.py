@@ -0,0 +1,65 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from cash_flow.models import ProjectionBackfillCheckpoint
+from utils.backfill_helper import backfill_projection_due_date, close_db_connections
+
+
+class Command(BaseCommand):
+    """
+    management command to rebuild models.NbfcWiseCollectionData and models.ProjectionCollectionData for a range of
+    due dates across a pool of processes, rerunning it resumes from the checkpoints of the previous run
+    """
+    help = 'Backfills the collection and projection data for a range of due dates in parallel'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start-date', required=True, help='first due date in the format of yyyy-mm-dd')
+        parser.add_argument('--end-date', help='last due date in the format of yyyy-mm-dd, defaults to the start date')
+        parser.add_argument('--workers', type=int, default=4,
+                            help='number of processes, each makes one upstream call at a time')
+        parser.add_argument('--calculate-projected-amount', action='store_true',
+                            help='populate the projection collection data as well')
+        parser.add_argument('--restart', action='store_true',
+                            help='drop the checkpoints of the range and backfill every due date again')
+
+    def handle(self, *args, **options):
+        try:
+            start_date = datetime.strptime(options['start_date'], '%Y-%m-%d').date()
+            end_date = datetime.strptime(options['end_date'] or options['start_date'], '%Y-%m-%d').date()
+        except ValueError as e:
+            raise CommandError(str(e))
+        if end_date < start_date:
+            raise CommandError('end_date can only be greater than equal to the start_date')
+        if options['workers'] < 1:
+            raise CommandError('workers can only be greater than equal to 1')
+
+        with_projection = options['calculate_projected_amount']
+        if options['restart']:
+            ProjectionBackfillCheckpoint.objects.filter(due_date__gte=start_date, due_date__lte=end_date).delete()
+
+        due_dates = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+        failed_dates = []
+        # the forked workers must not share the connections of this process
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=options['workers'], initializer=close_db_connections) as executor:
+            futures = {executor.submit(backfill_projection_due_date, due_date, with_projection): due_date
+                       for due_date in due_dates}
+            for future in as_completed(futures):
+                due_date = futures[future]
+                try:
+                    result = future.result()
+                except Exception as e:
+                    failed_dates.append(due_date)
+                    self.stderr.write(f'{due_date}: failed with {e}')
+                    continue
+                if result['failed']:
+                    failed_dates.append(due_date)
+                self.stdout.write(f"{due_date}: {result['done']} nbfc's done, {result['skipped']} already done, "
+                                  f"{result['failed']} failed")
+
+        if failed_dates:
+            raise CommandError(f'{len(failed_dates)} due dates failed, rerun the command to resume them')
+        self.stdout.write(self.style.SUCCESS(f'Backfilled {len(due_dates)} due dates'))
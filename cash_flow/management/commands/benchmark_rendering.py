@@ -0,0 +1,116 @@
+import base64
+import csv
+import io
+import random
+import statistics
+import time
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.text import compress_string
+from rest_framework.renderers import JSONRenderer
+
+from cash_flow_prediction.compression import brotli
+from utils.renderer_helper import FastJSONRenderer
+
+
+def get_real_time_payload(nbfc_count: int) -> dict:
+    """
+    :return: a RealTimeNBFCDetail response without nbfc_id for nbfc_count nbfc's
+    """
+    return {'data': {
+        'loan_booked': {str(nbfc_id): {'O': random.uniform(0, 1e7), 'N': random.uniform(0, 1e7)}
+                        for nbfc_id in range(nbfc_count)},
+        'available_balance': {nbfc_id: {'O': random.uniform(0, 1e8), 'N': random.uniform(0, 1e8),
+                                        'total': random.uniform(0, 2e8)} for nbfc_id in range(nbfc_count)},
+    }}
+
+
+def get_loan_export_payload(row_count: int) -> dict:
+    """
+    :return: a GetLoanDetailData response of row_count loans, the csv travels as a base64 data url
+    """
+    csv_file = io.StringIO()
+    writer = csv.writer(csv_file)
+    writer.writerow(['id', 'created_at', 'updated_at', 'loan_id', 'user_id', 'nbfc_id', 'amount', 'credit_limit',
+                     'loan_type', 'user_type', 'status', 'is_booked', 'cibil_score'])
+    updated_at = datetime(2024, 1, 1)
+    for row_id in range(row_count):
+        updated_at += timedelta(seconds=random.randint(1, 30))
+        writer.writerow([row_id, updated_at, updated_at, 9000000 + row_id, random.randint(1, 10 ** 6),
+                         random.randint(1, 40), random.randint(5, 500) * 100, random.randint(5, 500) * 100,
+                         random.choice('EPA'), random.choice('ON'), random.choice('PIF'), True,
+                         random.randint(300, 900)])
+    base64_data = base64.b64encode(csv_file.getvalue().encode('utf-8')).decode('utf-8')
+    return {'message': 'Success', 'url': 'data:text/csv;base64,' + base64_data}
+
+
+def get_eligibility_page_payload(page_size: int) -> dict:
+    """
+    :return: a page of the NBFCEligibilityViewSet list
+    """
+    created_at = datetime(2024, 1, 1).isoformat()
+    return {'count': page_size * 3, 'next': 'http://localhost/cash-flow/api/v1/nbfc-eligibility/?cursor=cD0xMDA%3D',
+            'previous': None, 'results': [{
+                'id': row_id, 'created_at': created_at, 'updated_at': created_at, 'loan_type': random.choice('EPA'),
+                'min_cibil_score': 600, 'min_loan_tenure': 1, 'max_loan_tenure': 60, 'min_loan_amount': 100.0,
+                'max_loan_amount': 10000.0, 'should_check': True, 'should_assign': True, 'min_age': 18,
+                'max_age': 60, 'ckyc': True, 'ekyc': False, 'mkyc': False, 'nbfc': row_id % 40
+            } for row_id in range(page_size)]}
+
+
+def time_call(func, repeat: int):
+    """
+    :return: (median seconds of a call, value returned by the last call)
+    """
+    timings = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        value = func()
+        timings.append(time.perf_counter() - start_time)
+    return statistics.median(timings), value
+
+
+class Command(BaseCommand):
+    """
+    management command to compare the drf and the orjson renderer and the gzip and brotli compression of the
+    middleware on synthetic payloads shaped like the largest responses of the api
+    """
+    help = 'Measures the serialization time and the compressed size of representative api payloads'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--nbfcs', type=int, default=500, help='nbfc count of the real time detail payload')
+        parser.add_argument('--loans', type=int, default=50000, help='loan count of the loan detail export payload')
+        parser.add_argument('--page-size', type=int, default=100, help='row count of the eligibility page payload')
+        parser.add_argument('--repeat', type=int, default=5, help='runs per measurement, the median is reported')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('repeat can only be greater than equal to 1')
+        random.seed(0)
+        payloads = [
+            ('real-time-nbfc-detail', get_real_time_payload(options['nbfcs'])),
+            ('get-loan-detail-data', get_loan_export_payload(options['loans'])),
+            ('nbfc-eligibility page', get_eligibility_page_payload(options['page_size'])),
+        ]
+        repeat = options['repeat']
+
+        for name, payload in payloads:
+            drf_seconds, body = time_call(lambda: JSONRenderer().render(payload), repeat)
+            fast_seconds, fast_body = time_call(lambda: FastJSONRenderer().render(payload), repeat)
+            self.stdout.write(self.style.MIGRATE_HEADING(f'{name}: {len(body) / 1024:.1f}KB'))
+            self.stdout.write(f'  render   drf {drf_seconds * 1000:.2f}ms, orjson {fast_seconds * 1000:.2f}ms '
+                              f'({drf_seconds / fast_seconds:.1f}x), bodies equal: {body == fast_body}')
+
+            gzip_seconds, gzip_body = time_call(lambda: compress_string(fast_body), repeat)
+            self.stdout.write(f'  gzip     {gzip_seconds * 1000:.2f}ms, {len(gzip_body) / 1024:.1f}KB '
+                              f'({1 - len(gzip_body) / len(fast_body):.1%} saved)')
+            if brotli is None:
+                self.stdout.write('  brotli   not installed')
+                continue
+            brotli_seconds, brotli_body = time_call(
+                lambda: brotli.compress(fast_body, quality=settings.BROTLI_QUALITY), repeat)
+            self.stdout.write(f'  brotli   {brotli_seconds * 1000:.2f}ms, {len(brotli_body) / 1024:.1f}KB '
+                              f'({1 - len(brotli_body) / len(fast_body):.1%} saved) at quality '
+                              f'{settings.BROTLI_QUALITY}')
@@ -0,0 +1,94 @@
+import json
+import statistics
+import subprocess
+import sys
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# code run in a fresh interpreter for every entry point, doing what the process does before serving its first
+# request or task: the asgi app resolves the urls on its first request, worker and beat import the task modules
+ENTRY_POINTS = {
+    'asgi': (
+        'import cash_flow_prediction.asgi\n'
+        'from django.urls import get_resolver\n'
+        'get_resolver().url_patterns\n'
+    ),
+    'worker': (
+        'from cash_flow_prediction.celery import app\n'
+        'app.loader.import_default_modules()\n'
+        'app.finalize()\n'
+    ),
+    'beat': (
+        'from cash_flow_prediction.celery import app\n'
+        'app.loader.import_default_modules()\n'
+        'import django_celery_beat.schedulers\n'
+    ),
+}
+
+MEASURE_TEMPLATE = '''
+import json, resource, sys, time
+start_time = time.perf_counter()
+{code}
+elapsed = time.perf_counter() - start_time
+print(json.dumps({{
+    'seconds': elapsed,
+    'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    'modules': len(sys.modules),
+    'lazy_modules': sorted(name for name in {lazy_modules!r} if name in sys.modules),
+}}))
+'''
+
+# modules to be imported on first use only, loading any of them at startup is reported as a regression
+LAZY_MODULES = ('pandas', 'numpy')
+
+
+def measure_entry_point(code: str) -> dict:
+    """
+    helper function to run the startup code of an entry point in a new interpreter
+    :return: {'seconds': import time, 'max_rss_kb': peak rss, 'modules': count of sys.modules,
+    'lazy_modules': LAZY_MODULES that got imported}
+    """
+    process = subprocess.run([sys.executable, '-c', MEASURE_TEMPLATE.format(code=code, lazy_modules=LAZY_MODULES)],
+                             cwd=settings.BASE_DIR, capture_output=True, text=True)
+    if process.returncode != 0:
+        raise CommandError(process.stderr.strip().splitlines()[-1] if process.stderr.strip() else 'startup failed')
+    return json.loads(process.stdout.strip().splitlines()[-1])
+
+
+class Command(BaseCommand):
+    """
+    management command to measure the startup time and memory of the asgi app, the celery worker and beat, each
+    in its own interpreter, to catch a module level import of a heavy dependency creeping back in
+    """
+    help = 'Measures the import time and peak rss of every entry point and fails if a lazy module is loaded'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--entry-point', choices=list(ENTRY_POINTS), action='append',
+                            help='entry point to be measured, can be repeated, defaults to all')
+        parser.add_argument('--repeat', type=int, default=3, help='runs per entry point, the median time is reported')
+        parser.add_argument('--max-seconds', type=float, help='fail if the median startup time is above it')
+        parser.add_argument('--max-rss-mb', type=float, help='fail if the peak rss is above it')
+
+    def handle(self, *args, **options):
+        if options['repeat'] < 1:
+            raise CommandError('repeat can only be greater than equal to 1')
+
+        failures = []
+        for entry_point in options['entry_point'] or list(ENTRY_POINTS):
+            runs = [measure_entry_point(ENTRY_POINTS[entry_point]) for _ in range(options['repeat'])]
+            seconds = statistics.median(run['seconds'] for run in runs)
+            rss_mb = max(run['max_rss_kb'] for run in runs) / 1024
+            lazy_modules = sorted(set().union(*(run['lazy_modules'] for run in runs)))
+            self.stdout.write(f'{entry_point}: {seconds:.3f}s, {rss_mb:.1f}MB peak rss, '
+                              f'{runs[0]["modules"]} modules, lazy modules loaded: {", ".join(lazy_modules) or "-"}')
+
+            if lazy_modules:
+                failures.append(f'{entry_point} imports {", ".join(lazy_modules)} at startup')
+            if options['max_seconds'] is not None and seconds > options['max_seconds']:
+                failures.append(f'{entry_point} takes {seconds:.3f}s to start')
+            if options['max_rss_mb'] is not None and rss_mb > options['max_rss_mb']:
+                failures.append(f'{entry_point} uses {rss_mb:.1f}MB at startup')
+
+        if failures:
+            raise CommandError('; '.join(failures))
@@ -0,0 +1,42 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+
+from utils.booking_aggregate_helper import check_booking_aggregates, rebuild_booking_aggregates
+
+
+class Command(BaseCommand):
+    """
+    management command to backfill or verify models.DailyBookingAggregate against models.LoanDetail
+    """
+    help = 'Rebuilds (or with --check only verifies) the daily booking aggregates for a range of dates'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start-date', required=True, help='first date in the format of yyyy-mm-dd')
+        parser.add_argument('--end-date', help='last date in the format of yyyy-mm-dd, defaults to the start date')
+        parser.add_argument('--check', action='store_true', help='only report the drift, nothing is written')
+
+    def handle(self, *args, **options):
+        try:
+            start_date = datetime.strptime(options['start_date'], '%Y-%m-%d').date()
+            end_date = datetime.strptime(options['end_date'] or options['start_date'], '%Y-%m-%d').date()
+        except ValueError as e:
+            raise CommandError(str(e))
+        if end_date < start_date:
+            raise CommandError('end_date can only be greater than equal to the start_date')
+
+        if options['check']:
+            drift = check_booking_aggregates(start_date, end_date)
+            for key, stored_values, expected_values in drift:
+                self.stdout.write(f'{key}: stored {stored_values} expected {expected_values}')
+            if drift:
+                raise CommandError(f'{len(drift)} aggregate rows drifted from the loan detail table')
+            self.stdout.write(self.style.SUCCESS('Daily booking aggregates are consistent'))
+            return
+
+        # one day at a time to keep the lock on the loans short
+        day = start_date
+        while day <= end_date:
+            written = rebuild_booking_aggregates(day, day)
+            self.stdout.write(f'{day}: {written} aggregate rows written')
+            day += timedelta(days=1)
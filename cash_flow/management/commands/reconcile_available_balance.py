@@ -0,0 +1,33 @@
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from utils.balance_helper import reconcile_available_balance
+
+
+class Command(BaseCommand):
+    """
+    management command to report the drift between the available balance in the cache, in the balance ledger and
+    recomputed from the database
+    """
+    help = 'Reports the available balance values that differ between the cache, the ledger and the database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='date in the format of yyyy-mm-dd, defaults to the current date')
+        parser.add_argument('--tolerance', type=float, default=0.01, help='allowed absolute difference')
+
+    def handle(self, *args, **options):
+        due_date = None
+        if options['date']:
+            try:
+                due_date = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError as e:
+                raise CommandError(str(e))
+
+        drift = reconcile_available_balance(due_date, options['tolerance'])
+        for nbfc_id, balance_type, cache_value, ledger_value, database_value in drift:
+            self.stdout.write(f'nbfc {nbfc_id} {balance_type}: cache {cache_value}, ledger {ledger_value}, '
+                              f'database {database_value}')
+        if drift:
+            raise CommandError(f'{len(drift)} available balance values drifted')
+        self.stdout.write(self.style.SUCCESS('Available balance is consistent'))
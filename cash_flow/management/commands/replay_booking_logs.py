@@ -0,0 +1,61 @@
+import json
+import time
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from utils.replay_helper import BOOKING_LOG_DIRECTORY, BookingRequestStream, ReplayConfig, replay_booking_requests
+
+
+class Command(BaseCommand):
+    """
+    management command to replay the booking decisions of a day from the book_nbfc logs against the config of the
+    day and optionally against an alternative one, nothing is read from or written to the cache
+    """
+    help = 'Replays a day of book-nbfc requests in memory and reports the per nbfc utilization and the rejects'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', required=True, help='date of the log file in the format of yyyy-mm-dd')
+        parser.add_argument('--log-directory', default=BOOKING_LOG_DIRECTORY)
+        parser.add_argument('--overrides', help='json file of the what-if overrides, see ReplayConfig.with_overrides')
+        parser.add_argument('--base-config', help='json file of a saved config to be used instead of the database')
+        parser.add_argument('--save-config', help='json file to save the config of the date into')
+
+    def handle(self, *args, **options):
+        try:
+            log_date = datetime.strptime(options['date'], '%Y-%m-%d').date()
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        try:
+            stream = BookingRequestStream.from_log_file(log_date, options['log_directory'])
+        except FileNotFoundError as e:
+            raise CommandError(str(e))
+
+        if options['base_config']:
+            with open(options['base_config']) as config_file:
+                base_config = ReplayConfig.from_json(json.load(config_file))
+        else:
+            base_config = ReplayConfig.from_database(log_date)
+        if options['save_config']:
+            with open(options['save_config'], 'w') as config_file:
+                json.dump(base_config.to_json(), config_file, default=str)
+
+        scenarios = [('baseline', base_config)]
+        if options['overrides']:
+            with open(options['overrides']) as overrides_file:
+                scenarios.append(('what-if', base_config.with_overrides(json.load(overrides_file))))
+
+        for name, config in scenarios:
+            start_time = time.perf_counter()
+            report = replay_booking_requests(stream, config)
+            elapsed = time.perf_counter() - start_time
+            self.stdout.write(self.style.MIGRATE_HEADING(
+                f"{name}: {report['requests']} requests replayed in {elapsed:.2f}s, {report['rejected']} rejected, "
+                f"{report['changed']} allocated differently than logged, {report['skipped_lines']} lines skipped"))
+            for nbfc_id, nbfc_report in report['nbfcs'].items():
+                utilization = nbfc_report['utilization']
+                utilization = f'{utilization:.1%}' if utilization is not None else '-'
+                self.stdout.write(f"  nbfc {nbfc_id}: {nbfc_report['loans']} loans, booked "
+                                  f"{nbfc_report['booked']:.2f} of {nbfc_report['available']:.2f} ({utilization}), "
+                                  f"remaining {nbfc_report['remaining']:.2f}")
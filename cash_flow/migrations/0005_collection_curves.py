@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 20:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cash_flow', '0004_kyc_fields'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='nbfcwisecollectiondata',
+            name='collection_curves',
+            field=models.BinaryField(null=True),
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-19 20:05
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cash_flow', '0005_collection_curves'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CollectionLogsDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('date', models.DateField()),
+                ('row_count', models.IntegerField(default=0)),
+                ('amount', models.FloatField(default=0)),
+                ('nbfc', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cash_flow.nbfcbranchmaster')),
+            ],
+            options={
+                'ordering': ('-date',),
+                'unique_together': {('nbfc', 'date')},
+            },
+        ),
+        migrations.CreateModel(
+            name='LoanBookedLogsDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('date', models.DateField()),
+                ('request_type', models.CharField(choices=[('CL', 'Credit Limit'), ('LAN', 'Loan Application'), ('LAD', 'Loan Applied'), ('LF', 'Loan failed'), ('BE', 'Booking Expired')], max_length=3)),
+                ('row_count', models.IntegerField(default=0)),
+                ('amount', models.FloatField(default=0)),
+                ('nbfc', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cash_flow.nbfcbranchmaster')),
+            ],
+            options={
+                'ordering': ('-date',),
+                'unique_together': {('nbfc', 'date', 'request_type')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ProjectionCollectionDailyRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('collection_date', models.DateField()),
+                ('row_count', models.IntegerField(default=0)),
+                ('amount', models.FloatField(default=0)),
+                ('old_user_amount', models.FloatField(default=0)),
+                ('new_user_amount', models.FloatField(default=0)),
+                ('nbfc', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cash_flow.nbfcbranchmaster')),
+            ],
+            options={
+                'ordering': ('-collection_date',),
+                'unique_together': {('nbfc', 'collection_date')},
+            },
+        ),
+    ]
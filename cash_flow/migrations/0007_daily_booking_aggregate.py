@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 20:06
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cash_flow', '0006_daily_rollups'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyBookingAggregate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('date', models.DateField()),
+                ('user_type', models.CharField(choices=[('O', 'Old'), ('N', 'New')], max_length=1)),
+                ('status', models.CharField(choices=[('I', 'Initiated'), ('P', 'Passed'), ('F', 'Failed')], max_length=1, null=True)),
+                ('loan_count', models.IntegerField(default=0)),
+                ('amount', models.FloatField(default=0)),
+                ('credit_limit', models.FloatField(default=0)),
+                ('nbfc', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cash_flow.nbfcbranchmaster')),
+            ],
+            options={
+                'ordering': ('-date',),
+                'unique_together': {('date', 'nbfc', 'user_type', 'status')},
+            },
+        ),
+    ]
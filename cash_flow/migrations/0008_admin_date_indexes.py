@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 20:10
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # the indexes are built concurrently so the large tables are not locked for writes
+    atomic = False
+
+    dependencies = [
+        ('cash_flow', '0007_daily_booking_aggregate'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='loandetail',
+            index=models.Index(fields=['created_at'], name='cash_flow_l_created_bd0b35_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='nbfcwisecollectiondata',
+            index=models.Index(fields=['due_date'], name='cash_flow_n_due_dat_b54b5a_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='projectioncollectiondata',
+            index=models.Index(fields=['collection_date'], name='cash_flow_p_collect_d77f44_idx'),
+        ),
+    ]
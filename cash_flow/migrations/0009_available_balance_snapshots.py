@@ -0,0 +1,46 @@
+# Generated by Django 5.2.18 on 2026-10-19 20:11
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cash_flow', '0008_admin_date_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AvailableBalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('date', models.DateField(unique=True)),
+                ('balance_json', models.JSONField()),
+                ('sequences', models.JSONField(default=dict)),
+            ],
+            options={
+                'ordering': ('-date',),
+            },
+        ),
+        migrations.CreateModel(
+            name='AvailableBalanceEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user_type', models.CharField(choices=[('O', 'Old'), ('N', 'New')], max_length=1)),
+                ('date', models.DateField()),
+                ('sequence', models.PositiveBigIntegerField(null=True)),
+                ('amount', models.FloatField()),
+                ('request_type', models.CharField(choices=[('CL', 'Credit Limit'), ('LAN', 'Loan Application'), ('LAD', 'Loan Applied'), ('LF', 'Loan failed'), ('BE', 'Booking Expired')], max_length=3)),
+                ('loan', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to='cash_flow.loandetail')),
+                ('nbfc', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cash_flow.nbfcbranchmaster')),
+            ],
+            options={
+                'unique_together': {('nbfc', 'user_type', 'date', 'sequence')},
+            },
+        ),
+    ]
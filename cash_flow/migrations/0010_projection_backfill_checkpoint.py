@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 20:16
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cash_flow', '0009_available_balance_snapshots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectionBackfillCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('due_date', models.DateField()),
+                ('with_projection', models.BooleanField(default=False)),
+                ('nbfc', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='cash_flow.nbfcbranchmaster')),
+            ],
+            options={
+                'unique_together': {('due_date', 'nbfc', 'with_projection')},
+            },
+        ),
+    ]
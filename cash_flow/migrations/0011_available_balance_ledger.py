@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-19 20:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cash_flow', '0010_projection_backfill_checkpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AvailableBalanceLedger',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('user_type', models.CharField(choices=[('O', 'Old'), ('N', 'New')], max_length=1)),
+                ('date', models.DateField()),
+                ('last_sequence', models.PositiveBigIntegerField(default=0)),
+                ('nbfc', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='cash_flow.nbfcbranchmaster')),
+            ],
+            options={
+                'unique_together': {('nbfc', 'user_type', 'date')},
+            },
+        ),
+    ]
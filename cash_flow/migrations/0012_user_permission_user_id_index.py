@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 20:26
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cash_flow', '0011_available_balance_ledger'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='userpermissionmodel',
+            name='user_id',
+            field=models.BigIntegerField(db_index=True),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.18 on 2026-10-19 20:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('cash_flow', '0012_user_permission_user_id_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PipelineStageRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('run_id', models.UUIDField(db_index=True)),
+                ('pipeline', models.CharField(max_length=50)),
+                ('stage', models.CharField(max_length=50)),
+                ('status', models.CharField(choices=[('S', 'Succeeded'), ('F', 'Failed'), ('K', 'Skipped')], max_length=1)),
+                ('started_at', models.DateTimeField(null=True)),
+                ('seconds', models.FloatField(null=True)),
+                ('is_stale', models.BooleanField(default=False)),
+                ('error', models.TextField(blank=True, null=True)),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+    ]
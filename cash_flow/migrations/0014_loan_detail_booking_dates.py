@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 20:41
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # the indexes are built concurrently so the large tables are not locked for writes
+    atomic = False
+
+    dependencies = [
+        ('cash_flow', '0013_pipeline_stage_run'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='loandetail',
+            name='booking_date',
+            field=models.DateField(null=True),
+        ),
+        migrations.AddField(
+            model_name='loandetail',
+            name='status_date',
+            field=models.DateField(null=True),
+        ),
+        AddIndexConcurrently(
+            model_name='loandetail',
+            index=models.Index(fields=['user_id', 'loan_id', 'booking_date'], name='cash_flow_l_user_id_37a9ca_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='loandetail',
+            index=models.Index(fields=['status_date', 'status'], name='cash_flow_l_status__1d6eaf_idx'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-19 20:51
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # the index is built concurrently so the bookings keep appending events while it is built
+    atomic = False
+
+    dependencies = [
+        ('cash_flow', '0014_loan_detail_booking_dates'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='availablebalanceevent',
+            index=models.Index(fields=['date'], name='cash_flow_a_date_4d94f1_idx'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-19 21:05
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # the index is built concurrently so the projection table is not locked for writes
+    atomic = False
+
+    dependencies = [
+        ('cash_flow', '0015_available_balance_event_date_index'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='projectioncollectiondata',
+            index=models.Index(fields=['due_date'], name='cash_flow_p_due_dat_43cdd1_idx'),
+        ),
+    ]
@@ -1,5 +1,7 @@
-from django.db import models
-from django.db.models import Q
+from datetime import datetime
+from django.db import models, transaction
+from django.db.models import Q, F
+from utils.etag_helper import bump_etag_version, get_nbfc_scope
 
 LOAN_TYPE_CHOICES = (
         ('P', 'PAYDAY'),
@@ -54,7 +56,7 @@ class UserPermissionModel(CreatedUpdatedAtMixin):
     """
         model to maintain the user permission
     """
-    user_id = models.BigIntegerField()
+    user_id = models.BigIntegerField(db_index=True)
     email = models.EmailField(null=True, blank=True)
     role = models.CharField(null=True, blank=True)
     is_active = models.BooleanField(default=True)
@@ -73,7 +75,8 @@ class NbfcWiseCollectionData(CreatedUpdatedAtMixin):
     """
         model for storing the nbfc id and corresponding collection json against it.
         nbfc : stores the corresponding id for a NBFC
-        collection_json : stores the collection data for a particular nbfc
+        collection_json : stores the collection data for a particular nbfc, only kept for the rows stored before
+        collection_curves existed, it is cleared once they are packed
         format :
         {
             <due_date> : {
@@ -97,11 +100,16 @@ class NbfcWiseCollectionData(CreatedUpdatedAtMixin):
 
     nbfc = models.ForeignKey(NbfcBranchMaster, on_delete=models.CASCADE)
     collection_json = models.JSONField(null=True)
+    # collection_json packed as float64[31][2][53], see utils.ce_curve_helper
+    collection_curves = models.BinaryField(null=True)
     due_date = models.DateField()
 
     class Meta:
         unique_together = ('nbfc', 'due_date')
         ordering = ('-created_at',)
+        indexes = [
+            models.Index(fields=['due_date']),
+        ]
 
 
 class ProjectionCollectionData(CreatedUpdatedAtMixin):
@@ -125,6 +133,10 @@ class ProjectionCollectionData(CreatedUpdatedAtMixin):
 
     class Meta:
         ordering = ('-created_at',)
+        indexes = [
+            models.Index(fields=['collection_date']),
+            models.Index(fields=['due_date']),
+        ]
 
 
 class CollectionAndLoanBookedData(CreatedUpdatedAtMixin):
@@ -224,6 +236,9 @@ class NBFCEligibilityCashFlowHead(CreatedUpdatedAtMixin):
 class LoanDetail(CreatedUpdatedAtMixin):
     """
     model to store the loan detail fields such as loan_id, user_id, nbfc, credit_limit, amount, status
+    booking_date: date the loan was first booked, the booking of a loan is looked up by it
+    status_date: date the status or the is_booked flag of the loan last changed, the loan counts against the
+    available balance of this date, unlike updated_at it does not move when the row is saved without such a change
     """
     nbfc = models.ForeignKey(NbfcBranchMaster, on_delete=models.CASCADE)
     credit_limit = models.FloatField()
@@ -239,6 +254,134 @@ class LoanDetail(CreatedUpdatedAtMixin):
     ckyc = models.BooleanField(default=False)
     ekyc = models.BooleanField(default=False)
     mkyc = models.BooleanField(default=False)
+    booking_date = models.DateField(null=True)
+    status_date = models.DateField(null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at']),
+            models.Index(fields=['user_id', 'loan_id', 'booking_date']),
+            models.Index(fields=['status_date', 'status']),
+        ]
+
+    def save(self, *args, **kwargs):
+        """
+        saves the loan and moves its contribution in models.DailyBookingAggregate in the same transaction, the
+        previous row is locked so concurrent saves of the same loan are applied one after the other, booking_date
+        and status_date are set here
+        """
+        with transaction.atomic():
+            previous_values = None
+            if self.pk:
+                previous_values = LoanDetail.objects.select_for_update().filter(pk=self.pk).values(
+                    *BOOKING_AGGREGATE_FIELDS).first()
+            today = datetime.now().date()
+            changed_fields = set()
+            if self.booking_date is None:
+                self.booking_date = self.created_at.date() if self.created_at else today
+                changed_fields.add('booking_date')
+            if previous_values is None or previous_values['status'] != self.status or \
+                    previous_values['is_booked'] != self.is_booked:
+                self.status_date = today
+                changed_fields.add('status_date')
+            elif self.status_date is None:
+                # a row not yet backfilled keeps the date its contribution is stored under
+                self.status_date = previous_values['status_date'] or previous_values['updated_at'].date()
+                changed_fields.add('status_date')
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = set(kwargs['update_fields']) | changed_fields
+            super().save(*args, **kwargs)
+            DailyBookingAggregate.apply_loan_change(previous_values, self.get_booking_values())
+
+    def get_booking_values(self) -> dict:
+        """
+        :return: the fields deciding the contribution of the loan in models.DailyBookingAggregate
+        """
+        return {field: getattr(self, field) for field in BOOKING_AGGREGATE_FIELDS}
+
+
+# fields of models.LoanDetail deciding its contribution in models.DailyBookingAggregate, updated_at stands in for
+# the status_date of the rows not yet backfilled by the backfill_loan_dates command
+BOOKING_AGGREGATE_FIELDS = ('status_date', 'updated_at', 'nbfc_id', 'user_type', 'status', 'is_booked', 'amount',
+                            'credit_limit')
+
+
+class DailyBookingAggregate(CreatedUpdatedAtMixin):
+    """
+    model to store the running totals of the booked loans (is_booked=True) of models.LoanDetail per status_date,
+    nbfc, user type and status, maintained on every save of a loan so the readers need no scan of the day's
+    loans
+    loan_count: number of booked loans
+    amount: sum of the loan amount
+    credit_limit: sum of the credit limit
+    """
+    date = models.DateField()
+    nbfc = models.ForeignKey(NbfcBranchMaster, on_delete=models.CASCADE)
+    user_type = models.CharField(max_length=1, choices=USER_TYPE_CHOICES)
+    status = models.CharField(max_length=1, choices=LOAN_STATUS_CHOICES, null=True)
+    loan_count = models.IntegerField(default=0)
+    amount = models.FloatField(default=0)
+    credit_limit = models.FloatField(default=0)
+
+    def __str__(self):
+        return f"{self.nbfc} on {self.date} for {self.user_type} users with status {self.status}"
+
+    class Meta:
+        unique_together = ('date', 'nbfc', 'user_type', 'status')
+        ordering = ('-date',)
+
+    @property
+    def booked_value(self) -> float:
+        """
+        :return: the value blocked by the loans, the loan amount for passed loans and the credit limit otherwise
+        """
+        return self.amount if self.status == 'P' else self.credit_limit
+
+    @staticmethod
+    def get_key(booking_values: dict):
+        """
+        :param booking_values: dict of BOOKING_AGGREGATE_FIELDS of a loan
+        :return: the lookup of the aggregate row the loan belongs to, None if the loan is not booked
+        """
+        if not booking_values or not booking_values['is_booked']:
+            return None
+        return {
+            'date': booking_values['status_date'] or booking_values['updated_at'].date(),
+            'nbfc_id': booking_values['nbfc_id'],
+            'user_type': booking_values['user_type'],
+            'status': booking_values['status'],
+        }
+
+    @classmethod
+    def increment(cls, key: dict, loan_count: int, amount: float, credit_limit: float) -> None:
+        """
+        adds the given values to the aggregate row of the key, creating the row if missing
+        """
+        aggregate_instance, _ = cls.objects.get_or_create(**key)
+        cls.objects.filter(id=aggregate_instance.id).update(
+            loan_count=F('loan_count') + loan_count,
+            amount=F('amount') + amount,
+            credit_limit=F('credit_limit') + credit_limit
+        )
+        bump_etag_version(get_nbfc_scope(key['nbfc_id']))
+
+    @classmethod
+    def apply_loan_change(cls, previous_values, current_values) -> None:
+        """
+        moves the contribution of a loan from its previous aggregate row to its current one
+        :param previous_values: dict of BOOKING_AGGREGATE_FIELDS before the change, None for a new loan
+        :param current_values: dict of BOOKING_AGGREGATE_FIELDS after the change, None for an unbooked loan
+        """
+        previous_key = cls.get_key(previous_values)
+        current_key = cls.get_key(current_values)
+        if previous_key and previous_key == current_key and \
+                previous_values['amount'] == current_values['amount'] and \
+                previous_values['credit_limit'] == current_values['credit_limit']:
+            return
+        if previous_key:
+            cls.increment(previous_key, -1, -(previous_values['amount'] or 0), -(previous_values['credit_limit'] or 0))
+        if current_key:
+            cls.increment(current_key, 1, current_values['amount'] or 0, current_values['credit_limit'] or 0)
 
 
 class LoanBookedLogs(CreatedUpdatedAtMixin):
@@ -263,3 +406,157 @@ class CollectionLogs(CreatedUpdatedAtMixin):
 
     class Meta:
         ordering = ('-created_at',)
+
+
+class ProjectionCollectionDailyRollup(CreatedUpdatedAtMixin):
+    """
+    model to store the daily totals of models.ProjectionCollectionData rows archived by the retention task
+    """
+    nbfc = models.ForeignKey(NbfcBranchMaster, on_delete=models.CASCADE)
+    collection_date = models.DateField()
+    row_count = models.IntegerField(default=0)
+    amount = models.FloatField(default=0)
+    old_user_amount = models.FloatField(default=0)
+    new_user_amount = models.FloatField(default=0)
+
+    class Meta:
+        unique_together = ('nbfc', 'collection_date')
+        ordering = ('-collection_date',)
+
+
+class LoanBookedLogsDailyRollup(CreatedUpdatedAtMixin):
+    """
+    model to store the daily totals of models.LoanBookedLogs rows archived by the retention task
+    """
+    nbfc = models.ForeignKey(NbfcBranchMaster, on_delete=models.CASCADE)
+    date = models.DateField()
+    request_type = models.CharField(max_length=3, choices=REQUEST_TYPE)
+    row_count = models.IntegerField(default=0)
+    amount = models.FloatField(default=0)
+
+    class Meta:
+        unique_together = ('nbfc', 'date', 'request_type')
+        ordering = ('-date',)
+
+
+class CollectionLogsDailyRollup(CreatedUpdatedAtMixin):
+    """
+    model to store the daily totals of models.CollectionLogs rows archived by the retention task
+    """
+    nbfc = models.ForeignKey(NbfcBranchMaster, on_delete=models.CASCADE)
+    date = models.DateField()
+    row_count = models.IntegerField(default=0)
+    amount = models.FloatField(default=0)
+
+    class Meta:
+        unique_together = ('nbfc', 'date')
+        ordering = ('-date',)
+
+
+class AvailableBalanceLedger(CreatedUpdatedAtMixin):
+    """
+    model to store the head of the balance event stream of a nbfc for a user type on a date, the row is locked
+    while events are appended to the stream
+    last_sequence: sequence of the latest models.AvailableBalanceEvent of the stream, 0 for an empty stream
+    """
+    nbfc = models.ForeignKey(NbfcBranchMaster, on_delete=models.CASCADE)
+    user_type = models.CharField(max_length=1, choices=USER_TYPE_CHOICES)
+    date = models.DateField()
+    last_sequence = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f"{self.nbfc} balance ledger for {self.user_type} users on {self.date} at {self.last_sequence}"
+
+    class Meta:
+        unique_together = ('nbfc', 'user_type', 'date')
+
+
+class AvailableBalanceEvent(CreatedUpdatedAtMixin):
+    """
+    append only model to store every change applied to the available balance in the cache outside the full
+    recompute, e.g. a booking, an unbooking on loan failure or a booking expiry, replayed on top of
+    models.AvailableBalanceSnapshot
+    amount: signed change in the available balance, negative when cash is blocked
+    sequence: position of the event in the stream of (nbfc, user_type, date), gapless from 1
+    """
+    nbfc = models.ForeignKey(NbfcBranchMaster, on_delete=models.CASCADE)
+    user_type = models.CharField(max_length=1, choices=USER_TYPE_CHOICES)
+    date = models.DateField()
+    sequence = models.PositiveBigIntegerField(null=True)
+    amount = models.FloatField()
+    request_type = models.CharField(max_length=3, choices=REQUEST_TYPE)
+    loan = models.ForeignKey(LoanDetail, on_delete=models.SET_NULL, null=True)
+
+    def __str__(self):
+        return f"{self.nbfc} balance changed by {self.amount} for {self.user_type} users on {self.date}"
+
+    def save(self, *args, **kwargs):
+        if self.pk is not None:
+            raise ValueError('balance events are append only, record a correcting event instead')
+        super().save(*args, **kwargs)
+
+    class Meta:
+        unique_together = ('nbfc', 'user_type', 'date', 'sequence')
+        indexes = [
+            models.Index(fields=['date']),
+        ]
+
+
+class AvailableBalanceSnapshot(CreatedUpdatedAtMixin):
+    """
+    model to store the periodic copy of the available balance map of the cache for a date
+    balance_json: {<nbfc_id>: {"O": value, "N": value, "total": value}}
+    sequences: {<nbfc_id>: {"O": sequence, "N": sequence}} of the latest models.AvailableBalanceEvent of every
+    stream already included in the balance_json
+    """
+    date = models.DateField(unique=True)
+    balance_json = models.JSONField()
+    sequences = models.JSONField(default=dict)
+
+    def __str__(self):
+        return f"available balance snapshot of {self.date}"
+
+    class Meta:
+        ordering = ('-date',)
+
+
+class ProjectionBackfillCheckpoint(CreatedUpdatedAtMixin):
+    """
+    model to store the progress of the backfill_projection_history command, a row is written once the collection
+    data (and the projection when with_projection) of a nbfc for a due date is saved, a row without nbfc marks the
+    whole due date as done
+    """
+    due_date = models.DateField()
+    nbfc = models.ForeignKey(NbfcBranchMaster, on_delete=models.CASCADE, null=True)
+    with_projection = models.BooleanField(default=False)
+
+    def __str__(self):
+        return f"backfill of {self.nbfc} done for the due date {self.due_date}"
+
+    class Meta:
+        unique_together = ('due_date', 'nbfc', 'with_projection')
+
+
+class PipelineStageRun(CreatedUpdatedAtMixin):
+    """
+    model to store the outcome and the timing of every stage of a run of a task pipeline (see utils.pipeline_helper)
+    status: 'S' done, 'F' failed, 'K' skipped as one of its inputs was not done
+    is_stale: if the stage returned the last good response of an upstream instead of a live one
+    """
+    STAGE_STATUS_CHOICES = (
+        ('S', 'Succeeded'),
+        ('F', 'Failed'),
+        ('K', 'Skipped'),
+    )
+
+    run_id = models.UUIDField(db_index=True)
+    pipeline = models.CharField(max_length=50)
+    stage = models.CharField(max_length=50)
+    status = models.CharField(max_length=1, choices=STAGE_STATUS_CHOICES)
+    started_at = models.DateTimeField(null=True)
+    seconds = models.FloatField(null=True)
+    is_stale = models.BooleanField(default=False)
+    error = models.TextField(null=True, blank=True)
+
+    def __str__(self):
+        return f"{self.pipeline} {self.stage} ({self.get_status_display()}) of run {self.run_id}"
@@ -1,8 +1,15 @@
+from celery.signals import worker_ready
+from django.db import transaction
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
-from cash_flow.models import NBFCEligibilityCashFlowHead
+from cash_flow.models import (NBFCEligibilityCashFlowHead, NbfcBranchMaster, ProjectionCollectionData,
+                              CollectionAndLoanBookedData, CapitalInflowData, HoldCashData, UserRatioData, LoanDetail,
+                              DailyBookingAggregate)
 from cash_flow.tasks import populate_should_assign_should_check_cache
+from utils.balance_helper import get_available_balance
+from utils.local_cache_helper import invalidate_two_tier, NBFC_BRANCH_MASTER_KEY, NBFC_ELIGIBILITY_RULES_KEY
+from utils.etag_helper import bump_etag_version, get_nbfc_scope, BRANCH_MASTER_SCOPE, ELIGIBILITY_SCOPE
 
 
 @receiver(post_save, sender=NBFCEligibilityCashFlowHead, dispatch_uid="cache_for_should_assign_and_should_check")
@@ -12,4 +19,57 @@ def create_should_check_and_should_assign(sender, instance, **kwargs):
     signal function to create cache for should check and should assign attribute and cache time =~ 10 years
     :return:
     """
-    populate_should_assign_should_check_cache()
+    invalidate_two_tier(NBFC_ELIGIBILITY_RULES_KEY, delete_shared=True)
+    # computed after the commit, inside the transaction the shared cache would get rows that may still roll back
+    transaction.on_commit(lambda: populate_should_assign_should_check_cache())
+    bump_etag_version(ELIGIBILITY_SCOPE)
+
+
+@receiver(post_save, sender=NbfcBranchMaster, dispatch_uid="invalidate_nbfc_branch_master_cache")
+@receiver(post_delete, sender=NbfcBranchMaster, dispatch_uid="invalidate_nbfc_branch_master_cache")
+def invalidate_nbfc_branch_master(sender, instance, **kwargs):
+    """
+    signal function to evict the cached branch master from the shared cache and the local tier of every process
+    :return:
+    """
+    invalidate_two_tier(NBFC_BRANCH_MASTER_KEY, delete_shared=True)
+    bump_etag_version(BRANCH_MASTER_SCOPE)
+
+
+# the projection and collection tables are only saved row by row, their deletes come with a save of the same nbfc
+@receiver(post_save, sender=ProjectionCollectionData, dispatch_uid="bump_nbfc_etag_version")
+@receiver(post_save, sender=CollectionAndLoanBookedData, dispatch_uid="bump_nbfc_etag_version")
+@receiver(post_save, sender=CapitalInflowData, dispatch_uid="bump_nbfc_etag_version")
+@receiver(post_delete, sender=CapitalInflowData, dispatch_uid="bump_nbfc_etag_version")
+@receiver(post_save, sender=HoldCashData, dispatch_uid="bump_nbfc_etag_version")
+@receiver(post_delete, sender=HoldCashData, dispatch_uid="bump_nbfc_etag_version")
+@receiver(post_save, sender=UserRatioData, dispatch_uid="bump_nbfc_etag_version")
+@receiver(post_delete, sender=UserRatioData, dispatch_uid="bump_nbfc_etag_version")
+def bump_nbfc_etag_version(sender, instance, **kwargs):
+    """
+    signal function to stamp the cash flow data of the nbfc as changed, the dashboard reads of the nbfc get a new
+    ETag instead of a 304
+    :return:
+    """
+    bump_etag_version(get_nbfc_scope(instance.nbfc_id))
+
+
+@receiver(post_delete, sender=LoanDetail, dispatch_uid="remove_deleted_loan_from_booking_aggregate")
+def remove_deleted_loan_from_booking_aggregate(sender, instance, **kwargs):
+    """
+    signal function to take a deleted loan out of models.DailyBookingAggregate, LoanDetail.save only covers the
+    saves, this also runs for the admin and queryset deletes and the cascade from models.NbfcBranchMaster, inside
+    the transaction of the delete
+    :return:
+    """
+    DailyBookingAggregate.apply_loan_change(instance.get_booking_values(), None)
+
+
+@worker_ready.connect(dispatch_uid="warm_available_balance_cache")
+def warm_available_balance_cache(sender, **kwargs):
+    """
+    signal function to restore the available balance cache from the latest snapshot when a celery worker starts,
+    so a flushed cache is back before the first booking instead of on it
+    :return:
+    """
+    get_available_balance()
@@ -2,18 +2,28 @@ import os
 from json import JSONDecodeError
 from datetime import datetime, timedelta
 from dateutil.relativedelta import relativedelta
-from django.db import IntegrityError
+from django.conf import settings
+from django.db import IntegrityError, transaction
 from django.utils import timezone
 from django.core.management import call_command
 from django.core.exceptions import ObjectDoesNotExist
 from django.core.cache import cache
-from django.db.models import Sum, When, Case, F
+from django.db.models import Sum, Q
 from cash_flow.external_calls import (get_due_amount_response, get_collection_poll_response, get_nbfc_list,
                                       get_collection_amount_response, get_loan_booked_data, get_failed_loan_data)
 from cash_flow.models import (NbfcWiseCollectionData, ProjectionCollectionData, NbfcBranchMaster,
                               CollectionAndLoanBookedData, CollectionLogs, LoanDetail, LoanBookedLogs,
-                              NBFCEligibilityCashFlowHead)
+                              NBFCEligibilityCashFlowHead, DailyBookingAggregate, BOOKING_AGGREGATE_FIELDS,
+                              AvailableBalanceEvent)
 from utils.common_helper import Common
+from utils.local_cache_helper import invalidate_two_tier, SHOULD_CHECK_KEY, SHOULD_ASSIGN_KEY
+from utils.balance_helper import (adjust_available_balance, apply_balance_events, set_available_balance,
+                                  snapshot_available_balance, reconcile_available_balance)
+from utils.email_helper import send_email
+from utils.retention_helper import archive_table
+from utils.stream_json_helper import iter_response_items
+from utils.pipeline_helper import run_pipeline
+from utils.reservation_helper import add_loan_reservation, remove_loan_reservation, pop_expired_reservations
 from cash_flow_prediction.celery import celery_error_email, app
 
 
@@ -30,29 +40,46 @@ def populate_json_against_nbfc(self, due_date=None):
         due_date = datetime.strptime(due_date, '%Y-%m-%d')
 
     formatted_due_date = due_date.strftime('%Y-%m-%d')
-    try:
-        collection_poll_data = get_collection_poll_response(formatted_due_date).json()
-    except JSONDecodeError as _:
-        return
+    # the poll payload grows with nbfc's x days x dpd's, it is parsed and written one nbfc at a time
+    collection_poll_response = get_collection_poll_response(formatted_due_date, stream=True)
+    load_nbfc_collection_data(due_date, collection_poll_response)
 
-    if collection_poll_data:
-        nbfc_dict = collection_poll_data.get("data", {})
 
-        for nbfc_id, json_data in nbfc_dict.items():
+def load_nbfc_collection_data(due_date, collection_poll_response, strict: bool = False):
+    """
+    function to write the models.NbfcWiseCollectionData of every nbfc in a streamed collection poll response
+    :param strict: if a failed or malformed response is to be raised, see utils.stream_json_helper
+    """
+    for nbfc_id, json_data in iter_response_items(collection_poll_response, strict=strict):
+        save_nbfc_collection_data(due_date, nbfc_id, json_data)
 
-            try:
-                nbfc_wise_collection_instance = NbfcWiseCollectionData.objects.create(
-                    due_date=due_date,
-                    nbfc_id=nbfc_id,
-                    collection_json=json_data
-                )
-            except IntegrityError:
-                nbfc_wise_collection_instance = NbfcWiseCollectionData.objects.get(
-                    nbfc_id=nbfc_id,
-                    due_date=due_date
-                )
-                nbfc_wise_collection_instance.collection_json = json_data
-            nbfc_wise_collection_instance.save()
+
+def save_nbfc_collection_data(due_date, nbfc_id, json_data: dict):
+    """
+    function to create or update the models.NbfcWiseCollectionData of a nbfc for a due date, only the packed
+    curves are stored, the collection_json of an updated row is cleared
+    :param json_data: collection efficiencies of the nbfc as returned by the collection poll api
+    """
+    # numpy is imported on first use, the web and beat processes load this module without ever needing it
+    from utils.ce_curve_helper import encode_collection_curves
+
+    collection_curves = encode_collection_curves(json_data)
+    try:
+        # in its own savepoint, a failed insert would otherwise break the transaction of a caller (e.g. the backfill)
+        with transaction.atomic():
+            nbfc_wise_collection_instance = NbfcWiseCollectionData.objects.create(
+                due_date=due_date,
+                nbfc_id=nbfc_id,
+                collection_curves=collection_curves
+            )
+    except IntegrityError:
+        nbfc_wise_collection_instance = NbfcWiseCollectionData.objects.get(
+            nbfc_id=nbfc_id,
+            due_date=due_date
+        )
+        nbfc_wise_collection_instance.collection_json = None
+        nbfc_wise_collection_instance.collection_curves = collection_curves
+    nbfc_wise_collection_instance.save()
 
 
 @app.task(bind=True)
@@ -68,76 +95,92 @@ def populate_wacm(self, due_date=None):
         due_date = datetime.strptime(due_date, '%Y-%m-%d')
 
     formatted_due_date = due_date.strftime('%Y-%m-%d')
-    dd_str = str(due_date.day)
-    try:
-        projection_response_data = get_due_amount_response(formatted_due_date).json()
-    except JSONDecodeError as _:
-        return
-    if projection_response_data:
-        projection_response_data = projection_response_data.get('data', {})
-
-    if 'null' in projection_response_data:
-        projection_response_data.pop('null', None)
-
-    nbfc_list = list(projection_response_data.keys())
-    queryset = NbfcWiseCollectionData.objects.filter(nbfc_id__in=nbfc_list, due_date=due_date).order_by(
-        'created_at')
-    queryset = dict((str(nbfc_id), collection_json) for nbfc_id, collection_json in
-                    queryset.values_list('nbfc_id', 'collection_json'))
-
-    for nbfc_id, projection_amount in projection_response_data.items():
-        collection_json = {}
-        if nbfc_id in queryset:
-            collection_json = queryset[nbfc_id]
-
-        ce_new_json = collection_json.get(dd_str, {}).get("New", {})
-        ce_old_json = collection_json.get(dd_str, {}).get("Old", {})
-
-        for dpd_date in range(-7, 46):
-            dpd_date_str = str(dpd_date)
-            collection_date = due_date + timedelta(int(dpd_date))
-            old_ratio = ce_old_json.get(dpd_date_str, 0)
-            new_ratio = ce_new_json.get(dpd_date_str, 0)
-            total_ratio = old_ratio + new_ratio
-            if total_ratio == 0:
-                continue
-            total_amount = total_ratio * projection_amount
-            new_user_amount = new_ratio * projection_amount
-            old_user_amount = old_ratio * projection_amount
+    due_amount_response = get_due_amount_response(formatted_due_date, stream=True)
+    load_nbfc_projection_data(due_date, due_amount_response)
 
-            try:
-                nbfc_instance = NbfcBranchMaster.objects.get(id=nbfc_id)
-            except ObjectDoesNotExist:
-                continue
 
-            existing_objects = ProjectionCollectionData.objects.filter(
+def load_nbfc_projection_data(due_date, due_amount_response, strict: bool = False):
+    """
+    function to write the models.ProjectionCollectionData of every nbfc in a streamed due amount response from its
+    stored collection curves
+    :param strict: if a failed or malformed response is to be raised, see utils.stream_json_helper
+    """
+    day_index = due_date.day - 1
+    for nbfc_id, projection_amount in iter_response_items(due_amount_response, strict=strict):
+        collection_curves = get_stored_collection_curves(due_date, nbfc_id)
+        if collection_curves is None:
+            continue
+        try:
+            nbfc_instance = NbfcBranchMaster.objects.get(id=nbfc_id)
+        except ObjectDoesNotExist:
+            continue
+
+        save_nbfc_projection_data(due_date, nbfc_instance, projection_amount, collection_curves[day_index])
+
+
+def get_stored_collection_curves(due_date, nbfc_id):
+    """
+    function to get the collection curves of a nbfc for a due date from models.NbfcWiseCollectionData
+    :return: array of shape (31, 2, 53), None if the nbfc has no collection data for the due date
+    """
+    from utils.ce_curve_helper import collection_json_to_curves, decode_collection_curves
+
+    row = NbfcWiseCollectionData.objects.filter(nbfc_id=nbfc_id, due_date=due_date).order_by('-created_at').values_list(
+        'collection_curves', 'collection_json').first()
+    if row is None:
+        return None
+    collection_curves, collection_json = row
+    # rows stored before the curves column existed are converted from the json
+    if collection_curves is None:
+        return collection_json_to_curves(collection_json)
+    return decode_collection_curves(collection_curves)
+
+
+def save_nbfc_projection_data(due_date, nbfc_instance, projection_amount: float, ce_curves):
+    """
+    function to spread the projected due amount of a nbfc over the collection dates in models.ProjectionCollectionData
+    :param ce_curves: (user type, dpd) collection efficiency curves of the nbfc for the day of the due date
+    """
+    from utils.ce_curve_helper import get_dpd_for_index, NEW_USER_INDEX, OLD_USER_INDEX
+
+    ce_new_curve = ce_curves[NEW_USER_INDEX]
+    ce_old_curve = ce_curves[OLD_USER_INDEX]
+    ce_total_curve = Common.get_wace_curves(ce_curves)
+
+    for dpd_index in ce_total_curve.nonzero()[0]:
+        collection_date = due_date + timedelta(get_dpd_for_index(dpd_index))
+        total_amount = float(ce_total_curve[dpd_index]) * projection_amount
+        new_user_amount = float(ce_new_curve[dpd_index]) * projection_amount
+        old_user_amount = float(ce_old_curve[dpd_index]) * projection_amount
+
+        existing_objects = ProjectionCollectionData.objects.filter(
+            nbfc=nbfc_instance,
+            due_date=due_date,
+            collection_date=collection_date
+        )
+
+        if existing_objects.exists():
+            latest_object = existing_objects.latest('created_at')
+            latest_object.amount = total_amount
+            latest_object.old_user_amount = old_user_amount
+            latest_object.new_user_amount = new_user_amount
+            latest_object.due_amount = projection_amount
+            latest_object.save()
+
+            # Delete other objects except the latest one
+            existing_objects.exclude(id=latest_object.id).delete()
+        else:
+            # Create a new object if no existing objects found
+            ProjectionCollectionData.objects.create(
                 nbfc=nbfc_instance,
                 due_date=due_date,
-                collection_date=collection_date
+                collection_date=collection_date,
+                amount=total_amount,
+                old_user_amount=old_user_amount,
+                new_user_amount=new_user_amount,
+                due_amount=projection_amount
             )
 
-            if existing_objects.exists():
-                latest_object = existing_objects.latest('created_at')
-                latest_object.amount = total_amount
-                latest_object.old_user_amount = old_user_amount
-                latest_object.new_user_amount = new_user_amount
-                latest_object.due_amount = projection_amount
-                latest_object.save()
-
-                # Delete other objects except the latest one
-                existing_objects.exclude(id=latest_object.id).delete()
-            else:
-                # Create a new object if no existing objects found
-                ProjectionCollectionData.objects.create(
-                    nbfc=nbfc_instance,
-                    due_date=due_date,
-                    collection_date=collection_date,
-                    amount=total_amount,
-                    old_user_amount=old_user_amount,
-                    new_user_amount=new_user_amount,
-                    due_amount=projection_amount
-                )
-
 
 @app.task(bind=True)
 @celery_error_email
@@ -145,9 +188,21 @@ def populate_nbfc_branch_master(self):
     """
     celery task to populate nbfc branch master storing nbfc's with the corresponding id's
     """
+    load_nbfc_branch_master(get_nbfc_list())
+
+
+def load_nbfc_branch_master(nbfc_list_response, strict: bool = False):
+    """
+    function to create or update the models.NbfcBranchMaster of every nbfc in a nbfc list response
+    :param strict: if a failed or malformed response is to be raised instead of skipping the update
+    """
+    if strict:
+        nbfc_list_response.raise_for_status()
     try:
-        nbfc_list_data_response = get_nbfc_list().json()
+        nbfc_list_data_response = nbfc_list_response.json()
     except JSONDecodeError as _:
+        if strict:
+            raise
         return
     if nbfc_list_data_response:
 
@@ -179,41 +234,45 @@ def populate_collection_amount(self, due_date=None):
     if not due_date:
         due_date = datetime.now().date()
     str_due_date = due_date.strftime('%Y-%m-%d')
-    try:
-        collection_amount_response = get_collection_amount_response(str_due_date).json()
-    except JSONDecodeError as _:
-        return
-    if collection_amount_response:
-        collection_amount_data = collection_amount_response.get('data', {})
-        for nbfc_id, collection_amount in collection_amount_data.items():
+    collection_amount_response = get_collection_amount_response(str_due_date, stream=True)
+    load_collection_amount(due_date, collection_amount_response)
 
-            collection_instance = CollectionAndLoanBookedData.objects.filter(
-                nbfc_id=nbfc_id,
-                due_date=due_date
-            ).first()
-
-            if collection_instance:
-                collection_instance.collection = collection_amount
-                collection_instance.save()
-            else:
-                collection_instance = CollectionAndLoanBookedData.objects.create(
-                    nbfc_id=nbfc_id,
-                    due_date=due_date,
-                    collection=collection_amount
-                )
 
-            collection_logs = CollectionLogs.objects.filter(collection=collection_instance).first()
+def load_collection_amount(due_date, collection_amount_response, strict: bool = False):
+    """
+    function to write the collection amount of every nbfc in a streamed collection amount response to
+    models.CollectionAndLoanBookedData and the change to models.CollectionLogs
+    :param strict: if a failed or malformed response is to be raised, see utils.stream_json_helper
+    """
+    for nbfc_id, collection_amount in iter_response_items(collection_amount_response, strict=strict):
 
-            if collection_logs:
-                prev_collection = collection_logs.amount
-                if prev_collection:
-                    collection_amount = collection_amount - prev_collection
+        collection_instance = CollectionAndLoanBookedData.objects.filter(
+            nbfc_id=nbfc_id,
+            due_date=due_date
+        ).first()
 
-            collection_log_instance = CollectionLogs(
-                collection=collection_instance,
-                amount=collection_amount
+        if collection_instance:
+            collection_instance.collection = collection_amount
+            collection_instance.save()
+        else:
+            collection_instance = CollectionAndLoanBookedData.objects.create(
+                nbfc_id=nbfc_id,
+                due_date=due_date,
+                collection=collection_amount
             )
-            collection_log_instance.save()
+
+        collection_logs = CollectionLogs.objects.filter(collection=collection_instance).first()
+
+        if collection_logs:
+            prev_collection = collection_logs.amount
+            if prev_collection:
+                collection_amount = collection_amount - prev_collection
+
+        collection_log_instance = CollectionLogs(
+            collection=collection_instance,
+            amount=collection_amount
+        )
+        collection_log_instance.save()
 
 
 @app.task(bind=True)
@@ -259,6 +318,7 @@ def unbook_failed_loans(self):
             loans = LoanDetail.objects.filter(loan_id__in=failed_loans_list, status='P')
             for loan in loans.iterator(chunk_size=500):
                 loan.status = 'F'
+                loan.save()
                 unbooked_amount = loan.amount
                 loan_log_instance = LoanBookedLogs(
                     loan=loan,
@@ -266,12 +326,7 @@ def unbook_failed_loans(self):
                     request_type='LF',
                     log_text='Unbooking the amount due to loan failure'
                 )
-                nbfc_id = loan.nbfc
-                user_type = loan.user_type
-                available_balance = cache.get('available_balance', {})
-                available_balance[nbfc_id][user_type] += unbooked_amount
-                available_balance[nbfc_id]['total'] += unbooked_amount
-                cache.set('available_balance', available_balance)
+                adjust_available_balance(loan.nbfc_id, loan.user_type, unbooked_amount, 'LF', loan)
                 loan_log_instance.save()
 
 
@@ -281,12 +336,27 @@ def populate_available_cash_flow(self, nbfc=None, due_date=None, include_booking
     """
     celery task to store json of nbfc id against available cash flow in the cache by repeated calculation
     """
+    if not due_date:
+        due_date = datetime.now().date()
+    if nbfc:
+        return compute_available_cash_flow(due_date, nbfc, include_booking).get(nbfc, {}).get('total', 0)
+    # computed inside the ledger lock, a booking committed before the map is written would otherwise be lost
+    set_available_balance(lambda date: compute_available_cash_flow(date, nbfc, include_booking), due_date,
+                          snapshot=True)
+
+
+def get_available_cash_flow_inputs(due_date, nbfc=None) -> dict:
+    """
+    function to read the inputs of the available cash flow of the nbfc's for a date from the database
+    :param due_date: date to be read
+    :param nbfc: id of the only nbfc to be read, all the nbfc's if None
+    :return: {<nbfc_id>: {'prediction': value, 'carry_forward': value, 'capital_inflow': value, 'hold_cash': value,
+    'user_ratio': [old, new]}} for the nbfc's with a projected collection on the date
+    """
     filtered_dict = {}
     if nbfc:
         filtered_dict['nbfc_id'] = nbfc
 
-    if not due_date:
-        due_date = datetime.now().date()
     hold_cash_value = Common.get_hold_cash_value(due_date)
     capital_inflow_value = Common.get_nbfc_capital_inflow(due_date)
 
@@ -300,45 +370,86 @@ def populate_available_cash_flow(self, nbfc=None, due_date=None, include_booking
 
     carry_forward = dict(CollectionAndLoanBookedData.objects.filter(**filtered_dict, due_date=due_date).values_list
                          ('nbfc_id', 'last_day_balance'))
-    cal_data = {}
-    nbfc_loan_booked = task_for_loan_booked(nbfc, due_date, return_type='dict')
 
-    for nbfc_id in prediction_amount_value:
-        hold_cash = hold_cash_value.get(nbfc_id, 0)
-        if hold_cash == 100:
-            continue
+    return {
+        nbfc_id: {
+            'prediction': prediction_cash_inflow,
+            'carry_forward': carry_forward.get(nbfc_id) or 0,
+            'capital_inflow': capital_inflow_value.get(nbfc_id, 0),
+            'hold_cash': hold_cash_value.get(nbfc_id, 0),
+            'user_ratio': list(user_ratio_value.get(nbfc_id, [80, 20]))
+        }
+        for nbfc_id, prediction_cash_inflow in prediction_amount_value.items()
+    }
 
-        prediction_cash_inflow = prediction_amount_value.get(nbfc_id, 0)
-        prev_day_carry_forward = carry_forward.get(nbfc_id, 0)
 
-        capital_inflow = capital_inflow_value.get(nbfc_id, 0)
+def get_available_cash_flow_split(cash_flow_inputs: dict) -> tuple:
+    """
+    function to get the available cash flow of a nbfc from its inputs split by the user ratio
+    :param cash_flow_inputs: inputs of a nbfc as returned by get_available_cash_flow_inputs
+    :return: (old user value, new user value, total value)
+    """
+    available_cash_flow = Common.get_available_cash_flow(cash_flow_inputs['prediction'] or 0,
+                                                         cash_flow_inputs['carry_forward'],
+                                                         cash_flow_inputs['capital_inflow'],
+                                                         cash_flow_inputs['hold_cash'])
+    old_ratio, new_ratio = cash_flow_inputs['user_ratio']
+    return (available_cash_flow * old_ratio) / 100, (available_cash_flow * new_ratio) / 100, available_cash_flow
 
-        available_cash_flow = Common.get_available_cash_flow(prediction_cash_inflow, prev_day_carry_forward,
-                                                             capital_inflow, hold_cash)
 
-        user_ratio = user_ratio_value.get(nbfc_id, [80, 20])
-        old_ratio = user_ratio[0]
-        new_ratio = user_ratio[1]
+def compute_available_cash_flow(due_date, nbfc=None, include_booking=True) -> dict:
+    """
+    function to calculate the available cash flow of the nbfc's for a date from the database
+    :param due_date: date to be calculated
+    :param nbfc: id of the only nbfc to be calculated, all the nbfc's if None
+    :param include_booking: if the amount booked on the date is to be subtracted
+    :return: {<nbfc_id>: {"O": value, "N": value, "total": value}}
+    """
+    cal_data = {}
+    nbfc_loan_booked = task_for_loan_booked(nbfc, due_date, return_type='dict') if include_booking else {}
 
-        old_value = (available_cash_flow * old_ratio) / 100
-        new_value = (available_cash_flow * new_ratio) / 100
+    for nbfc_id, cash_flow_inputs in get_available_cash_flow_inputs(due_date, nbfc).items():
+        if cash_flow_inputs['hold_cash'] == 100:
+            continue
 
-        if include_booking:
-            cal_data[nbfc_id] = {
-                'O': old_value - nbfc_loan_booked.get('O', 0),
-                'N': new_value - nbfc_loan_booked.get('N', 0),
-                'total': available_cash_flow - nbfc_loan_booked.get('total', 0)
-            }
-        else:
-            cal_data[nbfc_id] = {
-                'O': old_value,
-                'N': new_value,
-                'total': available_cash_flow
-            }
+        old_value, new_value, available_cash_flow = get_available_cash_flow_split(cash_flow_inputs)
+        # the booked amounts are keyed by nbfc id unless a single nbfc was asked for
+        nbfc_booked = nbfc_loan_booked if nbfc else nbfc_loan_booked.get(nbfc_id, {})
+        cal_data[nbfc_id] = {
+            'O': old_value - nbfc_booked.get('O', 0),
+            'N': new_value - nbfc_booked.get('N', 0),
+            'total': available_cash_flow - nbfc_booked.get('total', 0)
+        }
+    return cal_data
 
-    if nbfc:
-        return cal_data.get(nbfc, {}).get('total', 0)
-    cache.set('available_balance', cal_data, 600)
+
+@app.task(bind=True)
+@celery_error_email
+def populate_available_balance_snapshot(self):
+    """
+    celery cron to copy the available balance map of the cache into models.AvailableBalanceSnapshot, the map is
+    restored from the latest snapshot and the events recorded after it when the cache is flushed or the key is lost
+    """
+    snapshot_available_balance()
+
+
+@app.task(bind=True)
+@celery_error_email
+def reconcile_available_balance_ledger(self, due_date=None):
+    """
+    celery cron to compare the available balance in the cache, in the balance ledger and recomputed from the
+    database, the drifted values are mailed to settings.CELERY_ERROR_EMAIL_LIST
+    :return: number of drifted values
+    """
+    if isinstance(due_date, str):
+        due_date = datetime.strptime(due_date, '%Y-%m-%d').date()
+    drift = reconcile_available_balance(due_date)
+    if drift:
+        message = '\n'.join(f'nbfc {nbfc_id} {balance_type}: cache {cache_value}, ledger {ledger_value}, '
+                             f'database {database_value}'
+                             for nbfc_id, balance_type, cache_value, ledger_value, database_value in drift)
+        send_email(f'Available balance drift ({settings.ENVIRONMENT})', message, settings.CELERY_ERROR_EMAIL_LIST)
+    return len(drift)
 
 
 @app.task(bind=True)
@@ -354,29 +465,17 @@ def task_for_loan_booked(self, nbfc_id=None, due_date=None, return_type='int'):
 
     if not due_date:
         due_date = datetime.now().date()
-    loan_booked_instance = LoanDetail.objects.filter(updated_at__date=due_date, is_booked=True,
-                                                     **filtered_dict).exclude(status='F')
-    loan_booked_instance = loan_booked_instance.annotate(
-        value=Case(
-            When(status='P', then=F('amount')),
-            default=F('credit_limit')
-        )
-    )
-    loan_booked_instance = loan_booked_instance.values('nbfc_id', 'user_type').order_by('nbfc_id').annotate(
-        total_amount=Sum('value')
-    )
-    loan_booked = loan_booked_instance.values_list('nbfc_id', 'total_amount', 'user_type')
+    loan_booked = DailyBookingAggregate.objects.filter(date=due_date, **filtered_dict).exclude(status='F')
 
     booked_data = {}
-    for i in loan_booked:
-        if i not in booked_data:
-            booked_data[i[0]] = {
-                'O': 0,
-                'N': 0,
-                'total': 0
-            }
-        booked_data[i[0]][i[2]] += i[1]
-        booked_data[i[0]]['total'] += i[1]
+    for aggregate_instance in loan_booked:
+        nbfc_booked_data = booked_data.setdefault(aggregate_instance.nbfc_id, {
+            'O': 0,
+            'N': 0,
+            'total': 0
+        })
+        nbfc_booked_data[aggregate_instance.user_type] += aggregate_instance.booked_value
+        nbfc_booked_data['total'] += aggregate_instance.booked_value
 
     if nbfc_id:
         if return_type == 'int':
@@ -479,7 +578,10 @@ def task_for_loan_booking(self, credit_limit, loan_type, request_type, user_id,
         'mkyc': mkyc
     }
     loan_data |= kyc_data
-    user_loan = LoanDetail.objects.filter(user_id=user_id, loan_id=loan_id,  created_at__date=due_date).exclude(status='F')
+    # the rows not yet backfilled by the backfill_loan_dates command are matched on their created_at date
+    user_loan = LoanDetail.objects.filter(
+        Q(booking_date=due_date) | Q(booking_date__isnull=True, created_at__date=due_date),
+        user_id=user_id, loan_id=loan_id).exclude(status='F')
 
     if user_loan.exists():
         loan = user_loan.first()
@@ -492,18 +594,12 @@ def task_for_loan_booking(self, credit_limit, loan_type, request_type, user_id,
         loan.save()
     if loan_log:
         LoanBookedLogs.objects.create(loan=loan, **loan_log)
+    if current_loan_status == 'I':
+        add_loan_reservation(loan.id)
+    elif current_loan_status == 'P':
+        remove_loan_reservation(loan.id)
     if booked_amount and (is_booked is False or prev_loan_status != current_loan_status):
-        booked_data = cache.get('available_balance', {})
-        if booked_data:
-            booked_value = booked_data.get(nbfc_id, {}).get(user_type)
-            if booked_value is not None:
-                booked_data[nbfc_id][user_type] -= diff_amount
-                booked_data[nbfc_id]['total'] -= diff_amount
-            else:
-                booked_data[nbfc_id].update({user_type: booked_amount, 'total': booked_amount})
-        else:
-            booked_data[nbfc_id] = {user_type: booked_amount, 'total': booked_amount}
-        cache.set('available_balance', booked_data)
+        adjust_available_balance(nbfc_id, user_type, -diff_amount, request_type, loan)
 
 
 @app.task(bind=True)
@@ -527,8 +623,7 @@ def populate_last_day_balance(self, nbfc=None, date=None):
 
     collection_amount_dict = dict(CollectionAndLoanBookedData.objects.filter(due_date=due_date, **filtered_dict).
                                  values_list('nbfc_id', 'collection'))
-    loan_booked_instance = LoanDetail.objects.filter(updated_at__date=due_date, is_booked=True,
-                                                     **filtered_dict, status='P').exclude(status='F')
+    loan_booked_instance = DailyBookingAggregate.objects.filter(date=due_date, **filtered_dict, status='P')
     loan_booked_instance = loan_booked_instance.values('nbfc_id').order_by('nbfc_id').annotate(
         total_amount=Sum('amount')
     )
@@ -584,39 +679,98 @@ def populate_last_day_balance(self, nbfc=None, date=None):
             )
 
 
+def release_booked_loans(loans, log_text):
+    """
+    helper function to unbook the 'I' status loans, crediting their credit limit back to the available balance
+    in the cache and logging the same in models.LoanBookedLogs, a loan is only credited back if this call is the
+    one that flips its is_booked flag so overlapping runs never release a loan twice
+    :param loans: iterable of models.LoanDetail instances to be unbooked
+    :param log_text: text to be stored against the models.LoanBookedLogs
+    """
+    balance_events = []
+    booked_logs = []
+    for loan in loans:
+        with transaction.atomic():
+            booking_values = LoanDetail.objects.select_for_update().filter(
+                id=loan.id, status='I', is_booked=True).values(*BOOKING_AGGREGATE_FIELDS).first()
+            if not booking_values:
+                continue
+            LoanDetail.objects.filter(id=loan.id).update(is_booked=False, status_date=datetime.now().date())
+            DailyBookingAggregate.apply_loan_change(booking_values, None)
+        amount = booking_values['credit_limit']
+        balance_events.append(AvailableBalanceEvent(
+            nbfc_id=booking_values['nbfc_id'],
+            user_type=booking_values['user_type'],
+            date=datetime.now().date(),
+            amount=amount,
+            request_type='BE',
+            loan=loan
+        ))
+        booked_logs.append(LoanBookedLogs(
+            loan=loan,
+            request_type='BE',
+            amount=amount,
+            log_text=log_text
+        ))
+
+    if booked_logs:
+        apply_balance_events(balance_events)
+        LoanBookedLogs.objects.bulk_create(booked_logs, batch_size=100)
+
+
+@app.task(bind=True)
+@celery_error_email
+def release_expired_loan_reservations(self, batch_size=100, max_batches=10):
+    """
+    celery task to release the 'I' (LAN) bookings whose reservation has expired, expired loans are claimed from
+    the reservation sorted set in small batches so the cost is proportional to the number of expiring holds,
+    meant to be scheduled every minute
+    :param batch_size: number of reservations claimed per batch
+    :param max_batches: maximum number of batches processed in a single run
+    """
+    for _ in range(max_batches):
+        loan_ids = pop_expired_reservations(batch_size)
+        if not loan_ids:
+            return
+        loans = LoanDetail.objects.filter(id__in=loan_ids, status='I', is_booked=True)
+        release_booked_loans(loans, 'Unbooking after the reservation expired')
+        if len(loan_ids) < batch_size:
+            return
+
+
 @app.task(bind=True)
 @celery_error_email
 def task_to_validate_loan_booked(self):
     """
-    celery task to validate loan booked
+    celery task to validate loan booked, releases the 'I' bookings that have been inactive for longer than the
+    reservation expiry, kept as a slow safety net for the holds missing from the reservation sorted set
+    (e.g. after a redis flush) as release_expired_loan_reservations handles the regular expiry
     :return:
     """
-    current_time = timezone.now()
-    time_to_be_checked = current_time - timedelta(hours=3)
+    time_to_be_checked = timezone.now() - timedelta(seconds=settings.LOAN_RESERVATION_EXPIRY)
     loans_to_be_unbooked = LoanDetail.objects.filter(updated_at__lte=time_to_be_checked,
                                                      status='I', is_booked=True).order_by('nbfc_id')
-    bulk_update = []
-    for i in loans_to_be_unbooked:
-        user_type = i.user_type
-        nbfc_id = i.nbfc_id
-        amount = i.credit_limit
-        available_balance = cache.get('available_balance', {})
-        value = available_balance.get(nbfc_id, {}).get(user_type, 0)
-        amount += value
-
-        available_balance.setdefault(nbfc_id, {})[user_type] = amount
-        cache.set('available_balance', available_balance)
-
-        lb = LoanBookedLogs(
-            loan=i,
-            request_type='BE',
-            amount=amount,
-            log_text='Unbooking after three hours of inactivity'
-        )
-        bulk_update.append(lb)
+    release_booked_loans(loans_to_be_unbooked.iterator(chunk_size=500),
+                         f'Unbooking after {settings.LOAN_RESERVATION_EXPIRY} seconds of inactivity')
 
-    loans_to_be_unbooked.update(is_booked=False)
-    LoanBookedLogs.objects.bulk_create(bulk_update, batch_size=100)
+
+@app.task(bind=True)
+@celery_error_email
+def archive_append_only_tables(self, table_name=None):
+    """
+    celery cron to roll up into the daily rollup models, archive to compressed files and delete the rows of the
+    append heavy tables older than their window in settings.DATA_RETENTION_DAYS
+    :param table_name: a single table to be archived, all tables are archived if not passed
+    :return: dict of table name against the number of rows deleted
+    """
+    deleted_rows = {}
+    for name, retention_days in settings.DATA_RETENTION_DAYS.items():
+        if table_name and name != table_name:
+            continue
+        if not retention_days:
+            continue
+        deleted_rows[name] = archive_table(name, retention_days)
+    return deleted_rows
 
 
 @app.task(bind=True)
@@ -651,5 +805,83 @@ def populate_should_assign_should_check_cache(self):
         should_assign_branches = set(
             NBFCEligibilityCashFlowHead.objects.filter(should_assign=True).values_list('nbfc_id', flat=True))
         cache.set('should_assign', list(should_assign_branches), timeout=172800)
+        invalidate_two_tier(SHOULD_CHECK_KEY, SHOULD_ASSIGN_KEY)
     except Exception as e:
         print(e)
+
+
+def get_daily_ingestion_stages(today) -> dict:
+    """
+    function to get the stages of the daily ingestion, the upstream feeds are fetched at once into the local store of
+    utils.circuit_breaker_helper and each is loaded once the rows it refers to are written, the available cash flow
+    is only recomputed from a complete set of inputs
+    :return: stages as expected by utils.pipeline_helper.run_pipeline
+    """
+    projection_due_date = today + relativedelta(months=1) - timedelta(days=1)
+    str_projection_due_date = projection_due_date.strftime('%Y-%m-%d')
+    str_today = today.strftime('%Y-%m-%d')
+    return {
+        'fetch_nbfc_list': {
+            'func': lambda inputs: get_nbfc_list(),
+            'inputs': [],
+        },
+        'fetch_collection_poll': {
+            'func': lambda inputs: get_collection_poll_response(str_projection_due_date, stream=True),
+            'inputs': [],
+        },
+        'fetch_due_amount': {
+            'func': lambda inputs: get_due_amount_response(str_projection_due_date, stream=True),
+            'inputs': [],
+        },
+        'fetch_collection_amount': {
+            'func': lambda inputs: get_collection_amount_response(str_today, stream=True),
+            'inputs': [],
+        },
+        'nbfc_branch_master': {
+            'func': lambda inputs: load_nbfc_branch_master(inputs['fetch_nbfc_list'], strict=True),
+            'inputs': ['fetch_nbfc_list'],
+        },
+        'nbfc_collection_data': {
+            'func': lambda inputs: load_nbfc_collection_data(projection_due_date,
+                                                             inputs['fetch_collection_poll'], strict=True),
+            'inputs': ['fetch_collection_poll', 'nbfc_branch_master'],
+        },
+        'nbfc_projection_data': {
+            'func': lambda inputs: load_nbfc_projection_data(projection_due_date, inputs['fetch_due_amount'],
+                                                             strict=True),
+            'inputs': ['fetch_due_amount', 'nbfc_collection_data'],
+        },
+        'collection_amount': {
+            'func': lambda inputs: load_collection_amount(today, inputs['fetch_collection_amount'], strict=True),
+            'inputs': ['fetch_collection_amount', 'nbfc_branch_master'],
+        },
+        'last_day_balance': {
+            'func': lambda inputs: populate_last_day_balance(date=today),
+            'inputs': ['collection_amount'],
+        },
+        'available_cash_flow': {
+            'func': lambda inputs: populate_available_cash_flow(due_date=today),
+            'inputs': ['nbfc_projection_data', 'last_day_balance'],
+        },
+    }
+
+
+@app.task(bind=True)
+@celery_error_email
+def run_daily_ingestion_pipeline(self, date=None):
+    """
+    celery cron replacing the separate morning runs of populate_nbfc_branch_master, populate_json_against_nbfc,
+    populate_wacm, populate_collection_amount, populate_last_day_balance and populate_available_cash_flow, the
+    timing of every stage is stored in models.PipelineStageRun
+    :param date: date to be refreshed, today if not passed
+    :return: {<stage name>: {'status': value, 'seconds': value, 'is_stale': value}}
+    """
+    today = datetime.strptime(date, '%Y-%m-%d').date() if date else datetime.now().date()
+    stage_runs = run_pipeline('daily_ingestion', get_daily_ingestion_stages(today),
+                              settings.INGESTION_PIPELINE_WORKERS)
+    failed_stages = [stage_name for stage_name, stage_run in stage_runs.items() if stage_run.status == 'F']
+    if failed_stages:
+        raise RuntimeError(f'daily ingestion stages failed: {", ".join(failed_stages)}, their dependents were '
+                           f'skipped')
+    return {stage_name: {'status': stage_run.status, 'seconds': stage_run.seconds, 'is_stale': stage_run.is_stale}
+            for stage_name, stage_run in stage_runs.items()}
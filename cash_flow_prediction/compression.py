@@ -0,0 +1,89 @@
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware
+from django.utils.cache import patch_vary_headers
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def get_accepted_encoding(accept_encoding: str):
+    """
+    helper function to pick the content coding of the response from the Accept-Encoding of the request
+    :return: 'br', 'gzip' or None, brotli wins a tie and is only picked when the brotli package is installed
+    """
+    qualities = {}
+    for item in accept_encoding.split(','):
+        coding, _, params = item.partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            name, _, value = param.strip().partition('=')
+            if name == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.strip().lower()] = quality
+
+    available = ('br', 'gzip') if brotli is not None else ('gzip',)
+    ranked = sorted(available, key=lambda coding: -qualities.get(coding, qualities.get('*', 0.0)))
+    best = ranked[0]
+    return best if qualities.get(best, qualities.get('*', 0.0)) > 0 else None
+
+
+class CompressionMiddleware(GZipMiddleware):
+    """
+    middleware compressing the responses of at least settings.RESPONSE_COMPRESSION_MIN_SIZE bytes (streamed ones
+    always) with brotli or gzip as negotiated with the Accept-Encoding of the request, gzip is left to django's
+    GZipMiddleware
+    """
+    def process_response(self, request, response):
+        if not response.streaming and len(response.content) < settings.RESPONSE_COMPRESSION_MIN_SIZE:
+            return response
+        if response.has_header('Content-Encoding'):
+            return response
+
+        encoding = get_accepted_encoding(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        if encoding != 'br':
+            return super().process_response(request, response)
+
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if response.streaming:
+            response.streaming_content = self.compress_stream(response)
+            del response.headers['Content-Length']
+        else:
+            compressed_content = brotli.compress(response.content, quality=settings.BROTLI_QUALITY)
+            if len(compressed_content) >= len(response.content):
+                return response
+            response.content = compressed_content
+            response.headers['Content-Length'] = str(len(response.content))
+
+        # a compressed body can only carry a weak ETag, see GZipMiddleware
+        etag = response.get('ETag')
+        if etag and etag.startswith('"'):
+            response.headers['ETag'] = 'W/' + etag
+        response.headers['Content-Encoding'] = 'br'
+        return response
+
+    @staticmethod
+    def compress_stream(response):
+        """
+        :return: the streaming content of the response compressed with a single brotli stream, every chunk is
+        flushed so the client gets the rows as they are produced
+        """
+        original_iterator = response.streaming_content
+        compressor = brotli.Compressor(quality=settings.BROTLI_QUALITY)
+
+        if response.is_async:
+            async def brotli_wrapper():
+                async for chunk in original_iterator:
+                    yield compressor.process(chunk) + compressor.flush()
+                yield compressor.finish()
+            return brotli_wrapper()
+
+        def brotli_wrapper():
+            for chunk in original_iterator:
+                yield compressor.process(chunk) + compressor.flush()
+            yield compressor.finish()
+        return brotli_wrapper()
@@ -0,0 +1,52 @@
+import logging
+
+from django.db import connections
+from django.http import JsonResponse
+
+try:
+    from psycopg_pool import PoolTimeout
+except ImportError:
+    PoolTimeout = None
+
+logger = logging.getLogger(__name__)
+
+
+def get_db_pool_stats() -> dict:
+    """
+    function to get the connection pool metrics of the current process for every pooled database alias
+    :return: dict of alias against the raw psycopg pool stats along with the derived utilization (share of the
+    max size checked out) and the average wait in ms for a connection
+    """
+    pool_stats = {}
+    for alias in connections:
+        pool = getattr(connections[alias], 'pool', None)
+        if pool is None:
+            continue
+        stats = pool.get_stats()
+        checked_out = stats.get('pool_size', 0) - stats.get('pool_available', 0)
+        requests_num = stats.get('requests_num', 0)
+        stats['utilization'] = round(checked_out / pool.max_size, 4) if pool.max_size else 0
+        stats['avg_wait_ms'] = round(stats.get('requests_wait_ms', 0) / requests_num, 2) if requests_num else 0
+        pool_stats[alias] = stats
+    return pool_stats
+
+
+class DatabasePoolTimeoutMiddleware:
+    """
+    middleware turning a timed out wait for a pooled connection into a fast 503 instead of a 500, so callers
+    can retry later while the pool is saturated
+    """
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        return self.get_response(request)
+
+    def process_exception(self, request, exception):
+        # django re-raises the pool error as its own OperationalError with the original one as the cause
+        if PoolTimeout is None or not isinstance(exception.__cause__ or exception, PoolTimeout):
+            return None
+        logger.warning('database pool exhausted while serving %s: %s', request.path, exception)
+        response = JsonResponse({'error': 'Database is busy, retry later'}, status=503)
+        response['Retry-After'] = '1'
+        return response
@@ -0,0 +1,136 @@
+import logging
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db import connections, DatabaseError, OperationalError
+
+logger = logging.getLogger(__name__)
+
+# set while a reporting view or an admin changelist is being served, reads are routed to the replica only then
+_use_replica = ContextVar('use_replica', default=False)
+
+_replica_state = {
+    'checked_at': None,
+    'usable': False,
+}
+
+REPLICA_LAG_QUERY = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() OR pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END
+"""
+
+
+def get_replica_lag(alias: str) -> float:
+    """
+    :param alias: database alias of the replica
+    :return: seconds the replica is behind the primary, 0 for the databases other than postgres
+    """
+    connection = connections[alias]
+    if connection.vendor != 'postgresql':
+        return 0
+    with connection.cursor() as cursor:
+        cursor.execute(REPLICA_LAG_QUERY)
+        lag = cursor.fetchone()[0]
+    return float(lag or 0)
+
+
+def is_replica_usable() -> bool:
+    """
+    function to check if the replica is configured and within settings.REPLICA_MAX_LAG_SECONDS of the primary,
+    the lag is re-checked at most once every settings.REPLICA_LAG_CHECK_INTERVAL seconds per process
+    """
+    alias = settings.REPLICA_DATABASE_ALIAS
+    if alias not in settings.DATABASES:
+        return False
+
+    now = time.monotonic()
+    checked_at = _replica_state['checked_at']
+    if checked_at is not None and now - checked_at < settings.REPLICA_LAG_CHECK_INTERVAL:
+        return _replica_state['usable']
+
+    try:
+        usable = get_replica_lag(alias) <= settings.REPLICA_MAX_LAG_SECONDS
+    except DatabaseError:
+        usable = False
+    _replica_state['checked_at'] = now
+    _replica_state['usable'] = usable
+    return usable
+
+
+def mark_replica_unusable() -> None:
+    """
+    function to stop routing reads to the replica until the next lag check, its broken connection is closed
+    """
+    _replica_state['checked_at'] = time.monotonic()
+    _replica_state['usable'] = False
+    connections[settings.REPLICA_DATABASE_ALIAS].close()
+
+
+@contextmanager
+def use_replica():
+    """
+    context manager routing the reads made inside it to the replica, writes always go to the primary
+    """
+    token = _use_replica.set(True)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+@contextmanager
+def use_primary():
+    """
+    context manager routing the reads made inside it to the primary, also inside a use_replica block, for the
+    reads that must agree with rows locked or written on the primary
+    """
+    token = _use_replica.set(False)
+    try:
+        yield
+    finally:
+        _use_replica.reset(token)
+
+
+def read_from_replica(func):
+    """
+    decorator for the view methods whose reads can be served by the replica, a call failing with an
+    OperationalError on the replica is run again on the primary and the replica is skipped until the next lag check
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if not is_replica_usable():
+            return func(*args, **kwargs)
+        try:
+            with use_replica():
+                return func(*args, **kwargs)
+        except OperationalError as e:
+            logger.warning('replica query of %s failed, reading from the primary: %s', func.__qualname__, e)
+            mark_replica_unusable()
+            return func(*args, **kwargs)
+    return wrapper
+
+
+class ReplicaRouter:
+    """
+    database router sending the reads of the reporting views and the admin changelists to the replica alias,
+    everything else, all writes and the booking path included, stays on the default database
+    """
+
+    def db_for_read(self, model, **hints):
+        if _use_replica.get() and is_replica_usable():
+            return settings.REPLICA_DATABASE_ALIAS
+        return 'default'
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == 'default'
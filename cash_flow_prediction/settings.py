@@ -81,7 +81,16 @@ THIRD_PARTY_MIDDLEWARE = [
     "corsheaders.middleware.CorsMiddleware",
 ]
 
-MIDDLEWARE = DJANGO_MIDDLEWARE + THIRD_PARTY_MIDDLEWARE
+PROJECT_MIDDLEWARE = [
+    "cash_flow_prediction.db_pool.DatabasePoolTimeoutMiddleware",
+]
+
+# first in the list so the compression runs on the final body, after every other middleware has handled it
+COMPRESSION_MIDDLEWARE = [
+    "cash_flow_prediction.compression.CompressionMiddleware",
+]
+
+MIDDLEWARE = COMPRESSION_MIDDLEWARE + DJANGO_MIDDLEWARE + THIRD_PARTY_MIDDLEWARE + PROJECT_MIDDLEWARE
 
 if DEBUG:
     MIDDLEWARE += ['debug_toolbar.middleware.DebugToolbarMiddleware']
@@ -167,6 +176,42 @@ DATABASES = {
     }
 }
 
+# per process psycopg connection pool, connections are health checked on checkout and a request waiting longer
+# than DB_POOL_TIMEOUT seconds for a free connection fails fast with a 503 (see cash_flow_prediction.db_pool)
+DB_POOL_ENABLED = os.environ.get("DB_POOL_ENABLED", "").lower() in ("1", "true", "yes")
+if DB_POOL_ENABLED:
+    from psycopg_pool import ConnectionPool
+
+    DATABASES["default"]["OPTIONS"] = {
+        "pool": {
+            "min_size": int(os.environ.get("DB_POOL_MIN_SIZE", 2)),
+            "max_size": int(os.environ.get("DB_POOL_MAX_SIZE", 20)),
+            "timeout": float(os.environ.get("DB_POOL_TIMEOUT", 2)),
+            "max_idle": float(os.environ.get("DB_POOL_MAX_IDLE", 300)),
+            "check": ConnectionPool.check_connection,
+        }
+    }
+else:
+    DATABASES["default"]["CONN_MAX_AGE"] = int(os.environ.get("CONN_MAX_AGE", 0))
+    DATABASES["default"]["CONN_HEALTH_CHECKS"] = True
+
+# read replica used by the reporting views and the admin changelists, only added when its host is set
+REPLICA_DATABASE_ALIAS = "replica"
+if os.environ.get("POSTGRES_REPLICA_HOST"):
+    DATABASES[REPLICA_DATABASE_ALIAS] = {
+        **DATABASES["default"],
+        "NAME": os.environ.get("POSTGRES_REPLICA_DB", DATABASES["default"]["NAME"]),
+        "HOST": os.environ.get("POSTGRES_REPLICA_HOST"),
+        "PORT": os.environ.get("POSTGRES_REPLICA_PORT", DATABASES["default"]["PORT"]),
+        "TEST": {"MIRROR": "default"},
+    }
+
+DATABASE_ROUTERS = ["cash_flow_prediction.db_router.ReplicaRouter"]
+
+# reads fall back to the primary while the replica is behind by more than these many seconds
+REPLICA_MAX_LAG_SECONDS = float(os.environ.get("REPLICA_MAX_LAG_SECONDS", 30))
+REPLICA_LAG_CHECK_INTERVAL = float(os.environ.get("REPLICA_LAG_CHECK_INTERVAL", 5))
+
 # rest framework
 DEFAULT_PERMISSION_CLASS = [
     # "rest_framework.permissions.IsAuthenticated",
@@ -176,14 +221,19 @@ DEFAULT_AUTHENTICATION_CLASSES = [
     # "rest_framework.authentication.BasicAuthentication",
 ]
 
+# api responses are rendered with orjson (see utils.renderer_helper), JSON_RENDERER can point it back to
+# rest_framework.renderers.JSONRenderer
+JSON_RENDERER = os.environ.get('JSON_RENDERER', 'utils.renderer_helper.FastJSONRenderer')
+
 REST_FRAMEWORK = {
     "DEFAULT_PERMISSION_CLASSES": DEFAULT_PERMISSION_CLASS,
     "DEFAULT_AUTHENTICATION_CLASSES": DEFAULT_AUTHENTICATION_CLASSES,
     "DEFAULT_SCHEMA_CLASS": "drf_spectacular.openapi.AutoSchema",
     "DEFAULT_RENDERER_CLASSES": [
-        "rest_framework.renderers.JSONRenderer",
+        JSON_RENDERER,
     ],
-    'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
+    # keyset pagination, pages are found by the id of the last row instead of an OFFSET
+    'DEFAULT_PAGINATION_CLASS': 'utils.pagination_helper.KeysetPagination',
     'PAGE_SIZE': 100
 }
 
@@ -288,6 +338,63 @@ LOAN_BOOKED_URL = os.environ.get('LOAN_BOOKED_URL')
 CASH_FLOW_URL = os.environ.get('CASH_FLOW_URL')
 FAILED_LOAN_DATA = os.environ.get('FAILED_LOAN_DATA')
 
+# the calls to these apis go through a circuit breaker per api (see utils.circuit_breaker_helper): it opens after
+# UPSTREAM_BREAKER_FAILURES consecutive failed calls, the calls are then answered with the last good response kept
+# in UPSTREAM_STORE_ROOT and after UPSTREAM_BREAKER_RESET_SECONDS a single call is let through to probe the api,
+# stored responses older than UPSTREAM_STORE_DAYS days are pruned
+UPSTREAM_BREAKER_FAILURES = int(os.environ.get('UPSTREAM_BREAKER_FAILURES', 3))
+UPSTREAM_BREAKER_RESET_SECONDS = int(os.environ.get('UPSTREAM_BREAKER_RESET_SECONDS', 5 * 60))
+UPSTREAM_CONNECT_TIMEOUT = float(os.environ.get('UPSTREAM_CONNECT_TIMEOUT', 10))
+UPSTREAM_STORE_ROOT = os.environ.get('UPSTREAM_STORE_ROOT', os.path.join(BASE_DIR, "upstream_store"))
+UPSTREAM_STORE_DAYS = int(os.environ.get('UPSTREAM_STORE_DAYS', 7))
+
+# stages of tasks.run_daily_ingestion_pipeline run at once, the upstream feeds are fetched concurrently
+INGESTION_PIPELINE_WORKERS = int(os.environ.get('INGESTION_PIPELINE_WORKERS', 4))
+
+# seconds after which an 'I' (LAN) booking is released if the loan is not applied
+LOAN_RESERVATION_EXPIRY = int(os.environ.get('LOAN_RESERVATION_EXPIRY', 3 * 60 * 60))
+
+# days of raw rows kept in the append heavy tables before they are rolled up, archived and deleted,
+# a table is skipped if its value is 0
+DATA_RETENTION_DAYS = {
+    'ProjectionCollectionData': int(os.environ.get('PROJECTION_COLLECTION_RETENTION_DAYS', 400)),
+    'LoanBookedLogs': int(os.environ.get('LOAN_BOOKED_LOGS_RETENTION_DAYS', 90)),
+    'CollectionLogs': int(os.environ.get('COLLECTION_LOGS_RETENTION_DAYS', 30)),
+}
+DATA_RETENTION_CHUNK_SIZE = int(os.environ.get('DATA_RETENTION_CHUNK_SIZE', 1000))
+ARCHIVE_ROOT = os.environ.get('ARCHIVE_ROOT', os.path.join(BASE_DIR, "archive"))
+
+# process local tier kept in front of redis for the read mostly routing data (should_check, branch master and the
+# eligibility rules), entries are evicted over redis pub/sub on a change and expire after the ttl regardless
+LOCAL_CACHE_TTL = int(os.environ.get('LOCAL_CACHE_TTL', 60))
+LOCAL_CACHE_MAX_SIZE = int(os.environ.get('LOCAL_CACHE_MAX_SIZE', 128))
+LOCAL_CACHE_SHARED_TIMEOUT = int(os.environ.get('LOCAL_CACHE_SHARED_TIMEOUT', 24 * 60 * 60))
+
+# seconds a booking response is kept to be replayed to the retries of the same request
+IDEMPOTENCY_WINDOW = int(os.environ.get('IDEMPOTENCY_WINDOW', 5 * 60))
+
+# admission control of the booking api (see utils.admission_helper): every client (authenticated user or client
+# address) gets BOOKING_RATE_LIMIT requests a second with bursts of BOOKING_RATE_BURST, a process serves at most
+# BOOKING_MAX_IN_FLIGHT bookings at once and sheds new ones while the average wait for a pooled connection is above
+# BOOKING_MAX_DB_WAIT_MS, a value of 0 disables the check, the rate limit is off until the proxies are configured
+BOOKING_RATE_LIMIT = float(os.environ.get('BOOKING_RATE_LIMIT', 0))
+BOOKING_RATE_BURST = int(os.environ.get('BOOKING_RATE_BURST', 40))
+BOOKING_MAX_IN_FLIGHT = int(os.environ.get('BOOKING_MAX_IN_FLIGHT', 16))
+BOOKING_MAX_DB_WAIT_MS = float(os.environ.get('BOOKING_MAX_DB_WAIT_MS', 500))
+# space separated addresses or networks of the load balancers in front of the app, the client address is read from
+# X-Forwarded-For only for the requests they pass on, e.g. "10.0.0.0/8 192.168.1.5"
+TRUSTED_PROXIES = os.environ.get('TRUSTED_PROXIES', '').split()
+
+# responses smaller than these many bytes are sent uncompressed, brotli is used at this quality (0-11) when the
+# client accepts it and gzip otherwise (see cash_flow_prediction.compression)
+RESPONSE_COMPRESSION_MIN_SIZE = int(os.environ.get('RESPONSE_COMPRESSION_MIN_SIZE', 1024))
+BROTLI_QUALITY = int(os.environ.get('BROTLI_QUALITY', 5))
+
+# the balance stream sends a keepalive comment after these many seconds without a change, a client with more than
+# BALANCE_STREAM_QUEUE_SIZE undelivered events gets a fresh snapshot instead of the backlog
+BALANCE_STREAM_KEEPALIVE = int(os.environ.get('BALANCE_STREAM_KEEPALIVE', 15))
+BALANCE_STREAM_QUEUE_SIZE = int(os.environ.get('BALANCE_STREAM_QUEUE_SIZE', 100))
+
 # Project Name
 PROJECT_NAME = os.environ.get('PROJECT_NAME')
 
@@ -0,0 +1,202 @@
+import ipaddress
+import logging
+import math
+import threading
+import time
+
+from functools import wraps
+from django.conf import settings
+from django.db import connections
+from rest_framework import status
+from rest_framework.response import Response
+
+logger = logging.getLogger(__name__)
+
+# token bucket refilled at rate tokens a second up to burst, the state lives in a redis hash so every process of
+# every server draws from the same bucket, the redis clock is used so the servers need not agree on the time
+TOKEN_BUCKET_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local redis_time = redis.call('TIME')
+local now = tonumber(redis_time[1]) + tonumber(redis_time[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(bucket[1]) or burst
+local updated_at = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated_at) * rate)
+local allowed = 0
+local retry_after = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+else
+    retry_after = (1 - tokens) / rate
+end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return {allowed, tostring(retry_after)}
+"""
+
+
+def is_trusted_proxy(address: str) -> bool:
+    """
+    :return: if the address is in one of the networks of settings.TRUSTED_PROXIES
+    """
+    try:
+        ip_address = ipaddress.ip_address(address)
+    except ValueError:
+        return False
+    return any(ip_address in ipaddress.ip_network(network, strict=False) for network in settings.TRUSTED_PROXIES)
+
+
+def get_client_address(request) -> str:
+    """
+    :return: address of the client, X-Forwarded-For is only read when the request comes from a trusted proxy and
+    is walked from the right so the client cannot pick the address by sending the header itself
+    """
+    address = request.META.get('REMOTE_ADDR') or 'unknown'
+    if not is_trusted_proxy(address):
+        return address
+    for forwarded_address in reversed(request.META.get('HTTP_X_FORWARDED_FOR', '').split(',')):
+        address = forwarded_address.strip() or address
+        if not is_trusted_proxy(address):
+            break
+    return address
+
+
+def get_client_id(request) -> str:
+    """
+    :return: the caller a request is rate limited as, the authenticated user if any else the client address
+    """
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return f'user:{user.pk}'
+    return f'address:{get_client_address(request)}'
+
+
+def take_rate_limit_token(bucket_name: str, client_id: str, rate: float, burst: int):
+    """
+    helper function to take a token from the bucket of the client
+    :return: (if the request is allowed, seconds until a token is available), a failing redis lets the request
+    through as the limiter is not to turn a cache outage into a booking outage
+    """
+    from django_redis import get_redis_connection
+
+    try:
+        redis_connection = get_redis_connection('default')
+        allowed, retry_after = redis_connection.eval(
+            TOKEN_BUCKET_SCRIPT, 1, f'rate_limit:{bucket_name}:{client_id}', rate, burst)
+    except NotImplementedError:
+        return True, 0.0
+    except Exception as e:
+        logger.warning('rate limiter unavailable, letting %s through: %s', client_id, e)
+        return True, 0.0
+    return bool(allowed), float(retry_after)
+
+
+class InFlightLimiter:
+    """
+    count of the requests being served by the process, a request arriving at the limit is refused instead of
+    queueing behind the others
+    """
+    def __init__(self):
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    def acquire(self, limit: int) -> bool:
+        with self._lock:
+            if self.in_flight >= limit:
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+
+
+class DatabaseWaitMonitor:
+    """
+    average wait in ms for a pooled connection over the last sampling interval, from the counters of the psycopg
+    pool of the process, 0 when the pool is not enabled
+    """
+    def __init__(self, interval: float = 1.0):
+        self.interval = interval
+        self.wait_ms = 0.0
+        self._last_sample = None
+        self._sampled_at = 0.0
+        self._lock = threading.Lock()
+
+    def get_wait_ms(self) -> float:
+        now = time.monotonic()
+        if now - self._sampled_at < self.interval:
+            return self.wait_ms
+        with self._lock:
+            if now - self._sampled_at < self.interval:
+                return self.wait_ms
+            self._sampled_at = now
+            pool = getattr(connections['default'], 'pool', None)
+            if pool is None:
+                return self.wait_ms
+            stats = pool.get_stats()
+            sample = (stats.get('requests_num', 0), stats.get('requests_wait_ms', 0))
+            if self._last_sample is not None:
+                requests_num = sample[0] - self._last_sample[0]
+                self.wait_ms = (sample[1] - self._last_sample[1]) / requests_num if requests_num > 0 else 0.0
+            self._last_sample = sample
+            return self.wait_ms
+
+
+def admission_control(bucket_name: str, rate_setting: str, burst_setting: str, in_flight_setting: str,
+                      db_wait_setting: str, log_response=None):
+    """
+    decorator for the post method of an api view putting a per client token bucket and a per process limit on
+    the in-flight requests and the database wait in front of it, a refused request gets an immediate 429 (rate
+    limited) or 503 (overloaded) with a Retry-After instead of adding to the load
+    :param bucket_name: name of the token bucket shared by every process
+    :param rate_setting: name of the setting of the tokens added a second, 0 disables the rate limit
+    :param burst_setting: name of the setting of the bucket size
+    :param in_flight_setting: name of the setting of the requests a process serves at once, 0 disables the limit
+    :param db_wait_setting: name of the setting of the average pool wait in ms above which requests are shed,
+    0 disables the check
+    :param log_response: callable(payload, response) called for the refused requests
+    """
+    in_flight_limiter = InFlightLimiter()
+    database_wait_monitor = DatabaseWaitMonitor()
+
+    def refuse(request, view_name: str, status_code: int, message: str, retry_after: float):
+        response = Response({'error': message}, status=status_code)
+        response['Retry-After'] = str(max(1, math.ceil(retry_after)))
+        logger.warning('%s refused a request of %s: %s', view_name, get_client_id(request), message)
+        if log_response:
+            log_response(request.data, response)
+        return response
+
+    def decorator(func):
+        @wraps(func)
+        def wrapper(view, request, *args, **kwargs):
+            view_name = type(view).__name__
+            rate = getattr(settings, rate_setting)
+            if rate:
+                allowed, retry_after = take_rate_limit_token(bucket_name, get_client_id(request), rate,
+                                                             getattr(settings, burst_setting))
+                if not allowed:
+                    return refuse(request, view_name, status.HTTP_429_TOO_MANY_REQUESTS,
+                                  'Rate limit exceeded, retry later', retry_after)
+
+            max_db_wait = getattr(settings, db_wait_setting)
+            if max_db_wait and database_wait_monitor.get_wait_ms() > max_db_wait:
+                return refuse(request, view_name, status.HTTP_503_SERVICE_UNAVAILABLE,
+                              'Database is busy, retry later', database_wait_monitor.interval)
+
+            max_in_flight = getattr(settings, in_flight_setting)
+            if not max_in_flight:
+                return func(view, request, *args, **kwargs)
+            if not in_flight_limiter.acquire(max_in_flight):
+                return refuse(request, view_name, status.HTTP_503_SERVICE_UNAVAILABLE,
+                              'Too many requests in flight, retry later', 1)
+            try:
+                return func(view, request, *args, **kwargs)
+            finally:
+                in_flight_limiter.release()
+        return wrapper
+    return decorator
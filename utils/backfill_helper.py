@@ -0,0 +1,89 @@
+import logging
+
+from datetime import date
+from json import JSONDecodeError
+from django.db import connections, transaction
+from cash_flow.external_calls import get_collection_poll_response, get_due_amount_response
+from cash_flow.models import NbfcBranchMaster, ProjectionBackfillCheckpoint
+from cash_flow.tasks import save_nbfc_collection_data, save_nbfc_projection_data, get_stored_collection_curves
+from utils.ce_curve_helper import collection_json_to_curves
+
+logger = logging.getLogger(__name__)
+
+
+def close_db_connections() -> None:
+    """
+    initializer of the backfill worker processes, the connections inherited over the fork are not to be shared
+    """
+    connections.close_all()
+
+
+def get_upstream_data(response_getter, due_date: date) -> dict:
+    """
+    :return: the 'data' of the upstream response for the due date without the 'null' nbfc, {} if it is not json
+    """
+    try:
+        response_data = response_getter(due_date.strftime('%Y-%m-%d')).json() or {}
+    except JSONDecodeError as _:
+        return {}
+    response_data = response_data.get('data', {}) or {}
+    response_data.pop('null', None)
+    return response_data
+
+
+def backfill_projection_due_date(due_date: date, with_projection: bool = False) -> dict:
+    """
+    worker function of the backfill_projection_history command doing what tasks.populate_json_against_nbfc and
+    (with_projection) tasks.populate_wacm do for a due date, with a checkpoint per nbfc so a rerun only redoes the
+    nbfc's that were not finished
+    :return: {'due_date': value, 'done': nbfc's written, 'skipped': nbfc's already checkpointed,
+    'failed': nbfc's that could not be written}
+    """
+    result = {'due_date': due_date, 'done': 0, 'skipped': 0, 'failed': 0}
+    checkpoints = ProjectionBackfillCheckpoint.objects.filter(
+        due_date=due_date, with_projection__in=[True] if with_projection else [True, False])
+    checkpointed_nbfcs = set(checkpoints.values_list('nbfc_id', flat=True))
+    if None in checkpointed_nbfcs:
+        result['skipped'] = len(checkpointed_nbfcs) - 1
+        return result
+
+    collection_data = get_upstream_data(get_collection_poll_response, due_date)
+    projection_data = get_upstream_data(get_due_amount_response, due_date) if with_projection else {}
+    branch_master = dict((str(branch.id), branch) for branch in NbfcBranchMaster.objects.all())
+    day_index = due_date.day - 1
+
+    for nbfc_id in sorted(set(collection_data) | set(projection_data)):
+        nbfc_instance = branch_master.get(nbfc_id)
+        if nbfc_instance is None:
+            logger.warning('backfill of %s skipped nbfc %s missing in the branch master', due_date, nbfc_id)
+            continue
+        if nbfc_instance.id in checkpointed_nbfcs:
+            result['skipped'] += 1
+            continue
+
+        try:
+            with transaction.atomic():
+                json_data = collection_data.get(nbfc_id)
+                if json_data is not None:
+                    save_nbfc_collection_data(due_date, nbfc_instance.id, json_data)
+                    ce_curves = collection_json_to_curves(json_data)
+                else:
+                    ce_curves = get_stored_collection_curves(due_date, nbfc_instance.id) if with_projection else None
+
+                projection_amount = projection_data.get(nbfc_id)
+                if projection_amount is not None and ce_curves is not None:
+                    save_nbfc_projection_data(due_date, nbfc_instance, projection_amount, ce_curves[day_index])
+
+                ProjectionBackfillCheckpoint.objects.get_or_create(
+                    due_date=due_date, nbfc=nbfc_instance, with_projection=with_projection)
+        except Exception as e:
+            logger.exception('backfill of %s failed for nbfc %s: %s', due_date, nbfc_id, e)
+            result['failed'] += 1
+            continue
+        result['done'] += 1
+
+    # an empty upstream response is not marked done, it may be a transient failure of the upstream
+    if not result['failed'] and (collection_data or projection_data):
+        ProjectionBackfillCheckpoint.objects.get_or_create(due_date=due_date, nbfc=None,
+                                                           with_projection=with_projection)
+    return result
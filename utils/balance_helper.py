@@ -0,0 +1,371 @@
+import json
+import logging
+
+from datetime import datetime
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Q
+from django_redis import get_redis_connection
+from redis.exceptions import LockError
+from cash_flow_prediction.db_router import use_primary
+from cash_flow.models import AvailableBalanceEvent, AvailableBalanceLedger, AvailableBalanceSnapshot, NbfcBranchMaster
+from utils.etag_helper import bump_etag_version, AVAILABLE_BALANCE_SCOPE
+
+logger = logging.getLogger(__name__)
+
+AVAILABLE_BALANCE_KEY = 'available_balance'
+# hash of the sequence of every stream already included in the cached map, "<nbfc_id>:<O/N>": sequence
+AVAILABLE_BALANCE_SEQUENCES_KEY = 'available_balance_sequences'
+AVAILABLE_BALANCE_RESTORE_LOCK = 'available_balance_restore_lock'
+# field of the balance hash holding the date the map was computed for, also tells an empty map from a missing one
+BALANCE_DATE_FIELD = 'date'
+BALANCE_USER_TYPES = ('O', 'N')
+# channel the nbfc's whose balance changed are published on, [<nbfc_id>] or null when the whole map was replaced
+BALANCE_CHANGES_CHANNEL = 'available_balance_changes'
+# applies the committed events to the map of their date, an event at or below the sequence the map was written
+# with is already in it and skipped, so a map replaced between the commit and this call is never counted twice
+# KEYS: balance hash, sequences hash, ARGV: date, channel, message, then nbfc_id, user_type, sequence, amount per event
+APPLY_BALANCE_EVENTS_SCRIPT = """
+if redis.call('HGET', KEYS[1], 'date') ~= ARGV[1] then
+    return 0
+end
+local applied = 0
+for i = 4, #ARGV, 4 do
+    local stream = ARGV[i] .. ':' .. ARGV[i + 1]
+    if tonumber(ARGV[i + 2]) > tonumber(redis.call('HGET', KEYS[2], stream) or '0') then
+        redis.call('HINCRBYFLOAT', KEYS[1], stream, ARGV[i + 3])
+        redis.call('HINCRBYFLOAT', KEYS[1], ARGV[i] .. ':total', ARGV[i + 3])
+        applied = applied + 1
+    end
+end
+if applied > 0 then
+    redis.call('PUBLISH', ARGV[2], ARGV[3])
+end
+return applied
+"""
+
+
+def get_balance_hash_key() -> str:
+    """
+    :return: the redis key of the available balance hash, {"<nbfc_id>:<O/N/total>": value, "date": yyyy-mm-dd}
+    """
+    return cache.make_key(AVAILABLE_BALANCE_KEY)
+
+
+def get_balance_sequences_key() -> str:
+    """
+    :return: the redis key of the hash of the stream sequences included in the available balance hash
+    """
+    return cache.make_key(AVAILABLE_BALANCE_SEQUENCES_KEY)
+
+
+def read_balance_map(due_date=None):
+    """
+    helper function to read the available balance map from the cache as is, without restoring a missing one
+    :param due_date: if given, a map computed for another date is treated as missing
+    :return: {<nbfc_id>: {"O": value, "N": value, "total": value}}, None if the cache has no map
+    """
+    balance_hash = get_redis_connection('default').hgetall(get_balance_hash_key())
+    balance_date = balance_hash.pop(BALANCE_DATE_FIELD.encode(), None)
+    if balance_date is None or (due_date and balance_date.decode() != str(due_date)):
+        return None
+
+    available_balance = {}
+    for field, value in balance_hash.items():
+        nbfc_id, balance_type = field.decode().split(':')
+        available_balance.setdefault(int(nbfc_id), {})[balance_type] = float(value)
+    return available_balance
+
+
+def read_nbfc_balances(nbfc_ids) -> dict:
+    """
+    helper function to read the available balance of a few nbfc's from the cache in a single round trip
+    :return: {<nbfc_id>: {"O": value, "N": value, "total": value}}, the values missing in the cache are left out
+    """
+    fields = [f'{nbfc_id}:{balance_type}' for nbfc_id in nbfc_ids for balance_type in BALANCE_USER_TYPES + ('total',)]
+    if not fields:
+        return {}
+    nbfc_balances = {}
+    for field, value in zip(fields, get_redis_connection('default').hmget(get_balance_hash_key(), fields)):
+        if value is not None:
+            nbfc_id, balance_type = field.split(':')
+            nbfc_balances.setdefault(int(nbfc_id), {})[balance_type] = float(value)
+    return nbfc_balances
+
+
+def write_balance_map(available_balance: dict, due_date, ledger_heads: list) -> None:
+    """
+    helper function to replace the available balance map of the cache in a single transaction, the key does not
+    expire as a lapsed key would drop every branch from booking
+    :param ledger_heads: locked models.AvailableBalanceLedger instances of the date, their sequences are the events
+    included in the map
+    """
+    balance_hash = {
+        f'{nbfc_id}:{balance_type}': value
+        for nbfc_id, nbfc_balance in available_balance.items() for balance_type, value in nbfc_balance.items()
+    }
+    balance_hash[BALANCE_DATE_FIELD] = str(due_date)
+    sequences = {
+        f'{ledger_head.nbfc_id}:{ledger_head.user_type}': ledger_head.last_sequence for ledger_head in ledger_heads
+    }
+    key = get_balance_hash_key()
+    sequences_key = get_balance_sequences_key()
+    pipeline = get_redis_connection('default').pipeline(transaction=True)
+    pipeline.delete(key, sequences_key)
+    pipeline.hset(key, mapping=balance_hash)
+    if sequences:
+        pipeline.hset(sequences_key, mapping=sequences)
+    pipeline.publish(BALANCE_CHANGES_CHANNEL, json.dumps(None))
+    pipeline.execute()
+    bump_etag_version(AVAILABLE_BALANCE_SCOPE)
+
+
+def lock_ledger(due_date) -> list:
+    """
+    helper function to lock the ledger heads of every stream of the date, to be called inside a transaction, no
+    event can be appended to the date until the transaction ends, the heads of every nbfc are created first so a
+    stream started during the transaction cannot slip past the lock
+    :return: list of the locked models.AvailableBalanceLedger instances
+    """
+    AvailableBalanceLedger.objects.bulk_create([
+        AvailableBalanceLedger(nbfc_id=nbfc_id, user_type=user_type, date=due_date)
+        for nbfc_id in NbfcBranchMaster.objects.values_list('id', flat=True) for user_type in BALANCE_USER_TYPES
+    ], ignore_conflicts=True)
+    # same order as apply_balance_events so a recompute and an appender never wait on each other
+    return list(AvailableBalanceLedger.objects.select_for_update().filter(date=due_date).order_by(
+        'nbfc_id', 'user_type'))
+
+
+def set_available_balance(compute_balance, due_date=None, snapshot: bool = False) -> dict:
+    """
+    helper function to store a fully recomputed available balance map in the cache, the map is computed while the
+    ledger of the date is locked so no event is committed between the read of the database and the write of the map
+    :param compute_balance: callable(due_date) returning {<nbfc_id>: {"O": value, "N": value, "total": value}}
+    :param due_date: date the map is computed for, defaults to the current date
+    :param snapshot: if a models.AvailableBalanceSnapshot of the map is to be written in the same lock
+    :return: the stored available balance map
+    """
+    if not due_date:
+        due_date = datetime.now().date()
+    with transaction.atomic():
+        ledger_heads = lock_ledger(due_date)
+        available_balance = compute_balance(due_date)
+        write_balance_map(available_balance, due_date, ledger_heads)
+        if snapshot:
+            save_snapshot(available_balance, due_date, ledger_heads)
+    return available_balance
+
+
+def get_available_balance() -> dict:
+    """
+    helper function to get the available balance map of the current date from the cache, on a cache miss (or a
+    map of another date) the map is restored by a single caller holding the restore lock while the others wait
+    :return: {<nbfc_id>: {"O": value, "N": value, "total": value}}
+    """
+    # a map of another date is a miss, after midnight the events of the day would never be applied to it
+    today = datetime.now().date()
+    available_balance = read_balance_map(today)
+    if available_balance is not None:
+        return available_balance
+
+    try:
+        with cache.lock(AVAILABLE_BALANCE_RESTORE_LOCK, timeout=60, blocking_timeout=10):
+            available_balance = read_balance_map(today)
+            if available_balance is None:
+                available_balance = restore_available_balance(today)
+    except LockError:
+        logger.warning('timed out waiting for the available balance to be restored')
+        available_balance = read_balance_map(today)
+    return available_balance or {}
+
+
+def apply_committed_events(balance_events: list) -> None:
+    """
+    helper function to apply saved balance events to the cached available balance map, called once they are
+    committed, an event already included in the map or of a date the map is not for is skipped, a missing map is
+    left to the next read to restore with the events
+    :param balance_events: list of models.AvailableBalanceEvent instances with their sequences
+    """
+    for due_date in sorted(set(balance_event.date for balance_event in balance_events)):
+        date_events = [balance_event for balance_event in balance_events if balance_event.date == due_date]
+        event_args = []
+        for balance_event in date_events:
+            event_args += [balance_event.nbfc_id, balance_event.user_type, balance_event.sequence,
+                           balance_event.amount]
+        nbfc_ids = sorted(set(balance_event.nbfc_id for balance_event in date_events))
+        applied = get_redis_connection('default').eval(
+            APPLY_BALANCE_EVENTS_SCRIPT, 2, get_balance_hash_key(), get_balance_sequences_key(), str(due_date),
+            BALANCE_CHANGES_CHANNEL, json.dumps(nbfc_ids), *event_args)
+        if applied:
+            bump_etag_version(AVAILABLE_BALANCE_SCOPE)
+
+
+def apply_balance_events(balance_events: list) -> None:
+    """
+    helper function to append the balance events to their ledger streams and apply them to the cached available
+    balance map, the events get the next sequences of their streams while the heads are locked and are applied to
+    the cache once the transaction commits, so a rolled back booking never reaches the cache
+    :param balance_events: list of unsaved models.AvailableBalanceEvent instances
+    """
+    if not balance_events:
+        return
+
+    stream_keys = sorted(set((event.nbfc_id, event.user_type, event.date) for event in balance_events))
+    with transaction.atomic():
+        ledger_heads = {}
+        # locked in (nbfc_id, user_type, date) order, as lock_ledger does, so no two lockers wait on each other
+        for nbfc_id, user_type, date in stream_keys:
+            ledger_head, _ = AvailableBalanceLedger.objects.get_or_create(nbfc_id=nbfc_id, user_type=user_type,
+                                                                          date=date)
+            ledger_heads[(nbfc_id, user_type, date)] = AvailableBalanceLedger.objects.select_for_update().get(
+                id=ledger_head.id)
+
+        for balance_event in balance_events:
+            ledger_head = ledger_heads[(balance_event.nbfc_id, balance_event.user_type, balance_event.date)]
+            ledger_head.last_sequence += 1
+            balance_event.sequence = ledger_head.last_sequence
+        AvailableBalanceEvent.objects.bulk_create(balance_events, batch_size=100)
+        AvailableBalanceLedger.objects.bulk_update(ledger_heads.values(), ['last_sequence'])
+        transaction.on_commit(lambda: apply_committed_events(balance_events))
+
+
+def adjust_available_balance(nbfc_id: int, user_type: str, amount: float, request_type: str, loan=None) -> None:
+    """
+    helper function to change the available balance of a nbfc for a user type by amount, recording the change
+    :param nbfc_id: id of the nbfc
+    :param user_type: 'O' or 'N'
+    :param amount: signed change, negative when cash is blocked by a booking
+    :param request_type: request type of models.REQUEST_TYPE causing the change
+    :param loan: models.LoanDetail instance causing the change
+    """
+    apply_balance_events([AvailableBalanceEvent(
+        nbfc_id=nbfc_id,
+        user_type=user_type,
+        date=datetime.now().date(),
+        amount=amount,
+        request_type=request_type,
+        loan=loan
+    )])
+
+
+def apply_balance_event(available_balance: dict, nbfc_id: int, user_type: str, amount: float) -> None:
+    """
+    helper function to apply a single change to an available balance map in place
+    """
+    nbfc_balance = available_balance.setdefault(nbfc_id, {})
+    nbfc_balance[user_type] = nbfc_balance.get(user_type, 0) + amount
+    nbfc_balance['total'] = nbfc_balance.get('total', 0) + amount
+
+
+def save_snapshot(available_balance: dict, due_date, ledger_heads: list):
+    """
+    helper function to write the models.AvailableBalanceSnapshot of a map along with the sequence of every stream
+    """
+    sequences = {}
+    for ledger_head in ledger_heads:
+        sequences.setdefault(str(ledger_head.nbfc_id), {})[ledger_head.user_type] = ledger_head.last_sequence
+    snapshot_instance, _ = AvailableBalanceSnapshot.objects.update_or_create(
+        date=due_date,
+        defaults={'balance_json': available_balance, 'sequences': sequences}
+    )
+    return snapshot_instance
+
+
+def snapshot_available_balance(due_date=None):
+    """
+    helper function to copy the available balance map of the cache into models.AvailableBalanceSnapshot, the
+    ledger of the date is locked so the map and the sequences stored with it agree
+    :param due_date: date the balance belongs to, defaults to the current date
+    :return: the snapshot instance, None if the cache has no map for the date
+    """
+    if not due_date:
+        due_date = datetime.now().date()
+    with transaction.atomic():
+        ledger_heads = lock_ledger(due_date)
+        available_balance = read_balance_map(due_date)
+        if available_balance is None:
+            return None
+        return save_snapshot(available_balance, due_date, ledger_heads)
+
+
+def replay_ledger(due_date):
+    """
+    helper function to rebuild the available balance map of a date from its snapshot and the events appended to
+    every stream after the sequence stored in it, only the streams that moved are read
+    :return: {<nbfc_id>: {"O": value, "N": value, "total": value}}, None if the date has no snapshot yet
+    """
+    snapshot_instance = AvailableBalanceSnapshot.objects.filter(date=due_date).first()
+    if snapshot_instance is None:
+        return None
+
+    # json object keys are strings, the cached map is keyed by the integer nbfc id
+    available_balance = {int(nbfc_id): balance for nbfc_id, balance in snapshot_instance.balance_json.items()}
+    stream_filter = Q()
+    for nbfc_id, user_type, last_sequence in AvailableBalanceLedger.objects.filter(date=due_date).values_list(
+            'nbfc_id', 'user_type', 'last_sequence'):
+        snapshot_sequence = snapshot_instance.sequences.get(str(nbfc_id), {}).get(user_type, 0)
+        if last_sequence > snapshot_sequence:
+            stream_filter |= Q(nbfc_id=nbfc_id, user_type=user_type, sequence__gt=snapshot_sequence)
+    if not stream_filter:
+        return available_balance
+
+    balance_events = AvailableBalanceEvent.objects.filter(stream_filter, date=due_date).order_by(
+        'nbfc_id', 'user_type', 'sequence').values_list('nbfc_id', 'user_type', 'amount')
+    for nbfc_id, user_type, amount in balance_events:
+        apply_balance_event(available_balance, nbfc_id, user_type, amount)
+    return available_balance
+
+
+def restore_available_balance(due_date=None) -> dict:
+    """
+    helper function to rebuild the cached available balance map from the snapshot of the date replaying the events
+    recorded after it, a full recompute is done if the date has no snapshot yet, every read is made on the primary
+    as the map is stored with the sequences of the heads locked there, a lagging replica would lose the events it
+    has not received yet (the reporting views restoring the map read from the replica)
+    :param due_date: date the balance belongs to, defaults to the current date
+    :return: the restored available balance map
+    """
+    if not due_date:
+        due_date = datetime.now().date()
+
+    with use_primary():
+        with transaction.atomic():
+            ledger_heads = lock_ledger(due_date)
+            available_balance = replay_ledger(due_date)
+            if available_balance is not None:
+                write_balance_map(available_balance, due_date, ledger_heads)
+                logger.info('available balance restored from the snapshot of %s', due_date)
+                return available_balance
+
+        from cash_flow.tasks import populate_available_cash_flow
+        populate_available_cash_flow(due_date=due_date)
+    return read_balance_map(due_date) or {}
+
+
+def reconcile_available_balance(due_date=None, tolerance: float = 0.01) -> list:
+    """
+    helper function to compare the available balance of every nbfc in the cache, in the ledger (snapshot plus the
+    events after it) and recomputed from the database tables
+    :param due_date: date to be reconciled, defaults to the current date
+    :param tolerance: allowed absolute difference for float rounding
+    :return: list of (nbfc_id, balance type, cache value, ledger value, database value) for every value that
+    drifted, None stands for a value missing in that source
+    """
+    from cash_flow.tasks import compute_available_cash_flow
+
+    if not due_date:
+        due_date = datetime.now().date()
+    sources = [
+        read_balance_map(due_date) or {},
+        replay_ledger(due_date) or {},
+        compute_available_cash_flow(due_date),
+    ]
+
+    drift = []
+    for nbfc_id in sorted(set().union(*sources)):
+        for balance_type in BALANCE_USER_TYPES + ('total',):
+            values = [source.get(nbfc_id, {}).get(balance_type) for source in sources]
+            present = [value for value in values if value is not None]
+            if len(present) != len(values) or max(present) - min(present) > tolerance:
+                drift.append((nbfc_id, balance_type, *values))
+    return drift
@@ -0,0 +1,181 @@
+import asyncio
+import json
+import logging
+import os
+import threading
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from utils.balance_helper import BALANCE_CHANGES_CHANNEL, get_available_balance, read_balance_map, read_nbfc_balances
+
+logger = logging.getLogger(__name__)
+
+# put in the queue of a subscriber that fell behind, its backlog is dropped and a full snapshot is sent instead
+RESYNC = object()
+# pending messages merged into a single read of the cache by the listener
+MAX_COALESCED_MESSAGES = 100
+
+
+class BalanceStreamSubscriber:
+    """
+    a connected stream client, events are put in its queue from the listener thread through the event loop of the
+    request serving it
+    """
+    def __init__(self, nbfc_id: int = None):
+        self.nbfc_id = nbfc_id
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize=settings.BALANCE_STREAM_QUEUE_SIZE)
+
+    def put(self, event) -> None:
+        """
+        to be called on the event loop of the subscriber
+        """
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+
+    def filter(self, available_balance: dict) -> dict:
+        """
+        :return: the part of the balance map the subscriber asked for
+        """
+        if self.nbfc_id is None:
+            return available_balance
+        return {nbfc_id: balance for nbfc_id, balance in available_balance.items() if nbfc_id == self.nbfc_id}
+
+
+_subscribers = set()
+_subscribers_lock = threading.Lock()
+_listener_state = {
+    'pid': None,
+    # set once the subscription of the process is up, the first snapshot is not to be read before it
+    'subscribed': threading.Event(),
+}
+
+
+def broadcast(event_type: str, available_balance: dict) -> None:
+    """
+    function to hand an event to every subscriber interested in one of its nbfc's
+    """
+    with _subscribers_lock:
+        subscribers = list(_subscribers)
+    for subscriber in subscribers:
+        data = subscriber.filter(available_balance)
+        if not data and event_type != 'snapshot':
+            continue
+        try:
+            subscriber.loop.call_soon_threadsafe(subscriber.put, {'type': event_type, 'data': data})
+        except RuntimeError:
+            # the loop of a request that is going away
+            pass
+
+
+def broadcast_changes(nbfc_ids) -> None:
+    """
+    function to read the current balance of the changed nbfc's once for all the subscribers of the process, the
+    values are read after the change was published so a subscriber always ends on the latest ones
+    :param nbfc_ids: set of nbfc ids, None when the whole map was replaced
+    """
+    with _subscribers_lock:
+        if not _subscribers:
+            return
+    if nbfc_ids is None:
+        broadcast('snapshot', read_balance_map() or {})
+    else:
+        broadcast('balance', read_nbfc_balances(sorted(nbfc_ids)))
+
+
+def _listen_for_balance_changes() -> None:
+    """
+    loop of the listener thread holding the single pub/sub subscription of the process, the messages pending at
+    once are merged so a burst of bookings costs one read, a full snapshot is sent whenever the subscription is
+    reestablished as changes may have been missed while it was down
+    """
+    from django_redis import get_redis_connection
+
+    reconnecting = False
+    while True:
+        try:
+            pubsub = get_redis_connection('default').pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(BALANCE_CHANGES_CHANNEL)
+            _listener_state['subscribed'].set()
+            if reconnecting:
+                broadcast_changes(None)
+            reconnecting = True
+            for message in pubsub.listen():
+                nbfc_ids = set()
+                for _ in range(MAX_COALESCED_MESSAGES):
+                    changed_nbfcs = json.loads(message['data'])
+                    if changed_nbfcs is None or nbfc_ids is None:
+                        nbfc_ids = None
+                    else:
+                        nbfc_ids.update(changed_nbfcs)
+                    message = pubsub.get_message(timeout=0)
+                    if message is None:
+                        break
+                broadcast_changes(nbfc_ids)
+        except NotImplementedError:
+            logger.warning('cache backend has no pub/sub, the balance stream only sends the initial snapshot')
+            _listener_state['subscribed'].set()
+            return
+        except Exception as e:
+            logger.warning('balance stream listener failed, reconnecting: %s', e)
+            time.sleep(1)
+
+
+def start_balance_listener() -> None:
+    """
+    function to start the listener thread once per process, forked workers start their own
+    """
+    pid = os.getpid()
+    if _listener_state['pid'] == pid:
+        return
+    with _subscribers_lock:
+        if _listener_state['pid'] == pid:
+            return
+        _listener_state['pid'] = pid
+        _listener_state['subscribed'] = threading.Event()
+        threading.Thread(target=_listen_for_balance_changes, name='balance-stream', daemon=True).start()
+
+
+def format_event(event_id: int, event_type: str, data: dict) -> str:
+    """
+    :return: a server sent event, the nbfc ids are json object keys and become strings
+    """
+    return f'id: {event_id}\nevent: {event_type}\ndata: {json.dumps(data)}\n\n'
+
+
+async def stream_balance_events(nbfc_id: int = None):
+    """
+    async generator of the server sent events of the available balance, a 'snapshot' event with the whole map
+    (or the nbfc) first and after a resync, then a 'balance' event with the current values of the nbfc's whenever
+    they change, a comment is sent every settings.BALANCE_STREAM_KEEPALIVE seconds without a change
+    :param nbfc_id: if passed, only the balance of the nbfc is streamed
+    """
+    start_balance_listener()
+    if not _listener_state['subscribed'].is_set():
+        await asyncio.to_thread(_listener_state['subscribed'].wait, 5)
+    subscriber = BalanceStreamSubscriber(nbfc_id)
+    with _subscribers_lock:
+        _subscribers.add(subscriber)
+    try:
+        # subscribed before the snapshot is read, a change in between arrives after it with the latest values
+        event_id = 1
+        yield format_event(event_id, 'snapshot', subscriber.filter(await sync_to_async(get_available_balance)()))
+        while True:
+            try:
+                event = await asyncio.wait_for(subscriber.queue.get(), timeout=settings.BALANCE_STREAM_KEEPALIVE)
+            except asyncio.TimeoutError:
+                yield ': keepalive\n\n'
+                continue
+            event_id += 1
+            if event is RESYNC:
+                event = {'type': 'snapshot',
+                         'data': subscriber.filter(await sync_to_async(get_available_balance)())}
+            yield format_event(event_id, event['type'], event['data'])
+    finally:
+        with _subscribers_lock:
+            _subscribers.discard(subscriber)
@@ -0,0 +1,90 @@
+from datetime import date
+from django.db import transaction
+from django.db.models import Sum, Count, Q
+from django.db.models.functions import Coalesce, TruncDate
+from cash_flow.models import LoanDetail, DailyBookingAggregate
+from utils.etag_helper import bump_etag_version, CASH_FLOW_SCOPE
+
+AGGREGATE_KEY_FIELDS = ('date', 'nbfc_id', 'user_type', 'status')
+AGGREGATE_VALUE_FIELDS = ('loan_count', 'amount', 'credit_limit')
+
+
+def get_status_date_filter(start_date: date, end_date: date) -> Q:
+    """
+    :return: filter of the models.LoanDetail rows whose status_date is in the dates, the rows not yet backfilled
+    are matched on their updated_at date as in models.DailyBookingAggregate.get_key
+    """
+    return Q(status_date__gte=start_date, status_date__lte=end_date) | Q(
+        status_date__isnull=True, updated_at__date__gte=start_date, updated_at__date__lte=end_date)
+
+
+def compute_booking_aggregates(start_date: date, end_date: date) -> dict:
+    """
+    helper function to compute the models.DailyBookingAggregate rows from the raw models.LoanDetail table
+    :param start_date: first date to be computed
+    :param end_date: last date to be computed
+    :return: dict of (date, nbfc_id, user_type, status) against (loan_count, amount, credit_limit)
+    """
+    queryset = LoanDetail.objects.filter(get_status_date_filter(start_date, end_date), is_booked=True).values(
+        'nbfc_id', 'user_type', 'status', booking_status_date=Coalesce('status_date', TruncDate('updated_at')))
+    queryset = queryset.order_by().annotate(
+        total_loans=Count('id'),
+        total_amount=Coalesce(Sum('amount'), 0.0),
+        total_credit_limit=Coalesce(Sum('credit_limit'), 0.0)
+    )
+    return {
+        (row['booking_status_date'], row['nbfc_id'], row['user_type'], row['status']):
+            (row['total_loans'], row['total_amount'], row['total_credit_limit'])
+        for row in queryset
+    }
+
+
+def get_stored_booking_aggregates(start_date: date, end_date: date) -> dict:
+    """
+    helper function to get the stored models.DailyBookingAggregate rows in the format of compute_booking_aggregates
+    """
+    queryset = DailyBookingAggregate.objects.filter(date__gte=start_date, date__lte=end_date).exclude(loan_count=0)
+    return {
+        tuple(row[:len(AGGREGATE_KEY_FIELDS)]): tuple(row[len(AGGREGATE_KEY_FIELDS):])
+        for row in queryset.values_list(*AGGREGATE_KEY_FIELDS, *AGGREGATE_VALUE_FIELDS)
+    }
+
+
+def check_booking_aggregates(start_date: date, end_date: date, tolerance: float = 0.01) -> list:
+    """
+    helper function to compare the stored aggregates against the raw models.LoanDetail table
+    :param start_date: first date to be checked
+    :param end_date: last date to be checked
+    :param tolerance: allowed absolute difference in the amounts for float rounding
+    :return: list of (key, stored values, expected values) for every row that drifted
+    """
+    expected = compute_booking_aggregates(start_date, end_date)
+    stored = get_stored_booking_aggregates(start_date, end_date)
+
+    drift = []
+    for key in sorted(set(expected) | set(stored), key=str):
+        expected_values = expected.get(key, (0, 0.0, 0.0))
+        stored_values = stored.get(key, (0, 0.0, 0.0))
+        if expected_values[0] != stored_values[0] or any(
+                abs(e - s) > tolerance for e, s in zip(expected_values[1:], stored_values[1:])):
+            drift.append((key, stored_values, expected_values))
+    return drift
+
+
+def rebuild_booking_aggregates(start_date: date, end_date: date) -> int:
+    """
+    helper function to replace the stored aggregates of the dates with the ones computed from the raw table,
+    the loans of the dates are locked so no booking lands in between the delete and the insert
+    :return: number of aggregate rows written
+    """
+    with transaction.atomic():
+        list(LoanDetail.objects.select_for_update().filter(
+            get_status_date_filter(start_date, end_date)).values_list('id', flat=True))
+        expected = compute_booking_aggregates(start_date, end_date)
+        DailyBookingAggregate.objects.filter(date__gte=start_date, date__lte=end_date).delete()
+        DailyBookingAggregate.objects.bulk_create([
+            DailyBookingAggregate(**dict(zip(AGGREGATE_KEY_FIELDS, key)), **dict(zip(AGGREGATE_VALUE_FIELDS, values)))
+            for key, values in expected.items()
+        ], batch_size=500)
+        bump_etag_version(CASH_FLOW_SCOPE)
+    return len(expected)
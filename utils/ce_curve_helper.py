@@ -0,0 +1,71 @@
+import numpy as np
+
+DPD_START = -7
+DPD_END = 45
+DPD_SLOTS = DPD_END - DPD_START + 1
+DAYS_IN_MONTH = 31
+
+# order of the user types along the second axis of the curves array, names as sent in the collection poll json
+CE_USER_TYPES = ('New', 'Old')
+NEW_USER_INDEX = CE_USER_TYPES.index('New')
+OLD_USER_INDEX = CE_USER_TYPES.index('Old')
+
+CE_CURVES_SHAPE = (DAYS_IN_MONTH, len(CE_USER_TYPES), DPD_SLOTS)
+CE_CURVES_DTYPE = np.dtype('<f8')
+
+
+def dpd_json_to_curve(dpd_json: dict) -> np.ndarray:
+    """
+    helper function to convert the collection efficiencies of one user type into a fixed length float array
+    :param dpd_json: {<dpd>: ce} with the dpd as a string or an int
+    :return: array of 53 values indexed as [dpd + 7], missing values are 0
+    """
+    curve = np.zeros(DPD_SLOTS, dtype=CE_CURVES_DTYPE)
+    for dpd, ce in (dpd_json or {}).items():
+        dpd_index = int(dpd) - DPD_START
+        if 0 <= dpd_index < DPD_SLOTS and ce:
+            curve[dpd_index] = ce
+    return curve
+
+
+def collection_json_to_curves(collection_json: dict) -> np.ndarray:
+    """
+    helper function to convert the nested collection poll json of a nbfc into a fixed shape float array
+    :param collection_json: {<day of month>: {"New": {<dpd>: ce}, "Old": {<dpd>: ce}}} as stored in
+    models.NbfcWiseCollectionData.collection_json
+    :return: array of shape (31, 2, 53) indexed as [day - 1, user type, dpd + 7], missing values are 0
+    """
+    curves = np.zeros(CE_CURVES_SHAPE, dtype=CE_CURVES_DTYPE)
+    for day, user_type_json in (collection_json or {}).items():
+        day_index = int(day) - 1
+        if not 0 <= day_index < DAYS_IN_MONTH:
+            continue
+        for user_index, user_type in enumerate(CE_USER_TYPES):
+            curves[day_index, user_index] = dpd_json_to_curve(user_type_json.get(user_type))
+    return curves
+
+
+def encode_collection_curves(collection_json: dict) -> bytes:
+    """
+    helper function to get the binary value stored in models.NbfcWiseCollectionData.collection_curves
+    :param collection_json: the collection poll json of a nbfc
+    :return: 31 * 2 * 53 little endian float64 values
+    """
+    return collection_json_to_curves(collection_json).tobytes()
+
+
+def decode_collection_curves(collection_curves) -> np.ndarray:
+    """
+    helper function to read the binary models.NbfcWiseCollectionData.collection_curves without copying it
+    :param collection_curves: bytes or memoryview as returned by the db driver
+    :return: read only array of shape (31, 2, 53)
+    """
+    return np.frombuffer(collection_curves, dtype=CE_CURVES_DTYPE).reshape(CE_CURVES_SHAPE)
+
+
+def get_dpd_for_index(dpd_index: int) -> int:
+    """
+    :param dpd_index: position along the last axis of the curves array
+    :return: the delay in payment days represented by the position
+    """
+    return DPD_START + int(dpd_index)
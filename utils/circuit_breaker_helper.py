@@ -0,0 +1,168 @@
+import io
+import logging
+import os
+import re
+import tempfile
+import time
+
+from datetime import datetime
+from django.conf import settings
+from django.core.cache import cache
+import requests
+
+logger = logging.getLogger(__name__)
+
+CIRCUIT_BREAKER_KEY = 'circuit_breaker'
+
+
+class CircuitOpenError(requests.RequestException):
+    """
+    raised for a call to an upstream whose circuit is open when no good response of the same request is stored
+    """
+
+
+class StoredBody(io.BufferedReader):
+    """
+    body of a stored response, readable in place of the urllib3 stream of a live one
+    """
+    decode_content = False
+
+
+def get_store_path(name: str, params: dict = None) -> str:
+    """
+    :return: path of the last good response of the upstream for the params, e.g. due_amount-2024-05-31.json
+    """
+    parts = [name] + [str(value) for _, value in sorted((params or {}).items())]
+    return os.path.join(settings.UPSTREAM_STORE_ROOT, re.sub(r'[^\w.-]', '_', '-'.join(parts)) + '.json')
+
+
+def build_stored_response(path: str, url: str, stream: bool, is_stale: bool) -> requests.Response:
+    """
+    :return: a 200 response with the stored body, is_stale and fetched_at tell the caller where it comes from
+    """
+    response = requests.Response()
+    response.status_code = 200
+    response.url = url
+    response.headers['Content-Type'] = 'application/json'
+    response.raw = StoredBody(io.FileIO(path))
+    response.is_stale = is_stale
+    response.fetched_at = datetime.fromtimestamp(os.path.getmtime(path))
+    if not stream:
+        response.content
+        response.raw.close()
+    return response
+
+
+def store_response(name: str, params: dict, response: requests.Response) -> str:
+    """
+    helper function to write the body of a live response to the store chunk by chunk, the file is replaced
+    atomically so a concurrent reader keeps the previous one, responses of the upstream older than
+    settings.UPSTREAM_STORE_DAYS are pruned
+    :return: path of the stored body
+    """
+    path = get_store_path(name, params)
+    os.makedirs(settings.UPSTREAM_STORE_ROOT, exist_ok=True)
+    file_descriptor, temp_path = tempfile.mkstemp(dir=settings.UPSTREAM_STORE_ROOT, prefix=f'.{name}-')
+    try:
+        with os.fdopen(file_descriptor, 'wb') as temp_file:
+            for chunk in response.iter_content(chunk_size=64 * 1024):
+                temp_file.write(chunk)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+    finally:
+        response.close()
+
+    oldest_kept = time.time() - settings.UPSTREAM_STORE_DAYS * 24 * 60 * 60
+    for file_name in os.listdir(settings.UPSTREAM_STORE_ROOT):
+        file_path = os.path.join(settings.UPSTREAM_STORE_ROOT, file_name)
+        if file_name.startswith(f'{name}-') and file_path != path and os.path.getmtime(file_path) < oldest_kept:
+            os.remove(file_path)
+    return path
+
+
+class CircuitBreaker:
+    """
+    breaker of an upstream endpoint shared by every worker through the cache: closed it lets the calls through,
+    it opens after settings.UPSTREAM_BREAKER_FAILURES consecutive failures (connection error, timeout or 5xx) and
+    answers from the store without calling the upstream, settings.UPSTREAM_BREAKER_RESET_SECONDS after opening the
+    next call is let through as a probe (half open) that closes it on success and opens it again on failure
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.failures_key = f'{CIRCUIT_BREAKER_KEY}:{name}:failures'
+        self.opened_at_key = f'{CIRCUIT_BREAKER_KEY}:{name}:opened_at'
+        self.probe_key = f'{CIRCUIT_BREAKER_KEY}:{name}:probe'
+
+    def allow_request(self) -> bool:
+        """
+        :return: if the upstream is to be called, only one caller at a time gets to probe an open circuit
+        """
+        opened_at = cache.get(self.opened_at_key)
+        if opened_at is None:
+            return True
+        if time.time() - opened_at < settings.UPSTREAM_BREAKER_RESET_SECONDS:
+            return False
+        return cache.add(self.probe_key, time.time(), timeout=settings.UPSTREAM_BREAKER_RESET_SECONDS)
+
+    def record_success(self) -> None:
+        if cache.get(self.opened_at_key) is not None:
+            logger.info('circuit of %s closed', self.name)
+        cache.delete_many([self.failures_key, self.opened_at_key, self.probe_key])
+
+    def record_failure(self) -> None:
+        cache.add(self.failures_key, 0, timeout=None)
+        failures = cache.incr(self.failures_key)
+        if failures >= settings.UPSTREAM_BREAKER_FAILURES:
+            if cache.get(self.opened_at_key) is None:
+                logger.warning('circuit of %s opened after %s consecutive failures', self.name, failures)
+            cache.set(self.opened_at_key, time.time(), timeout=None)
+            cache.delete(self.probe_key)
+
+
+def get_upstream_response(name: str, url: str, headers: dict, params: dict = None, timeout: float = 300,
+                          stream: bool = False, allow_stale: bool = True) -> requests.Response:
+    """
+    helper function to make a get call to an upstream feed through its circuit breaker, a good response is kept
+    as the last good one for the params and returned from the store, a failed call or a call made while the circuit
+    is open returns that last good one with is_stale set instead
+    :param name: name of the upstream endpoint, the breaker and the stored responses are kept per name
+    :param timeout: seconds to wait for the next byte of the response, connecting waits for
+    settings.UPSTREAM_CONNECT_TIMEOUT
+    :param stream: if the body is to be read lazily by the caller, see utils.stream_json_helper
+    :param allow_stale: False for the feeds of current state (e.g. the failed loans) where an old response would be
+    acted on as if it were new, nothing is stored for them and a failure is raised instead
+    :return: response, is_stale and fetched_at are set on a 200 one
+    :raise CircuitOpenError: if the circuit is open and nothing is stored for the params (or allow_stale is False)
+    """
+    circuit_breaker = CircuitBreaker(name)
+    error = None
+    if circuit_breaker.allow_request():
+        try:
+            response = requests.get(url=url, headers=headers, params=params, stream=True,
+                                    timeout=(settings.UPSTREAM_CONNECT_TIMEOUT, timeout))
+            if response.status_code < 500:
+                if response.status_code != 200 or not allow_stale:
+                    circuit_breaker.record_success()
+                    response.is_stale = False
+                    if not stream:
+                        response.content
+                    return response
+                # the body is read here, a timeout while downloading it counts against the upstream as well
+                path = store_response(name, params, response)
+                circuit_breaker.record_success()
+                return build_stored_response(path, response.url, stream, is_stale=False)
+            response.close()
+            error = requests.HTTPError(f'{name} answered with {response.status_code}', response=response)
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+            error = e
+        circuit_breaker.record_failure()
+        logger.warning('call to %s failed: %s', name, error)
+
+    path = get_store_path(name, params)
+    if not allow_stale or not os.path.exists(path):
+        raise error or CircuitOpenError(f'circuit of {name} is open and no response is stored for {params}')
+    response = build_stored_response(path, url, stream, is_stale=True)
+    logger.warning('serving the response of %s from %s for %s', name, response.fetched_at, params)
+    return response
@@ -1,14 +1,22 @@
+import csv
 import json
 import os
 import base64
 import glob
 
 from datetime import date, timedelta, datetime
+from typing import TYPE_CHECKING
 from django.db.models import Q
-from django.core.cache import cache
+from django.http import StreamingHttpResponse
 from cash_flow.models import (CollectionAndLoanBookedData, ProjectionCollectionData,
-                              CapitalInflowData, HoldCashData, NbfcBranchMaster,
-                              UserRatioData)
+                              CapitalInflowData, HoldCashData,
+                              UserRatioData, NbfcWiseCollectionData)
+from utils.balance_helper import get_available_balance
+from utils.local_cache_helper import get_nbfc_branch_master, get_eligibility_rules
+
+# numpy is imported inside the curve helpers, the booking path of the web processes never needs it
+if TYPE_CHECKING:
+    import numpy as np
 
 
 class Common:
@@ -23,16 +31,78 @@ class Common:
         :return: a json containing ce's we for all dps ( Delay in payment date) for a particular due_date
         Weighted Average Collection Efficiency= [(%of loans given to new user * CE)+(%of loans given to old user * CE)]
         """
-        wace_dict = {}
-        for dpd in range(-7, 46):
-            ce_avg = 0
-            str_dpd = str(dpd)
-            ce_avg += ce_json_new.get(str_dpd, 0)
-            ce_avg += ce_json_old.get(str_dpd, 0)
+        import numpy as np
+        from utils.ce_curve_helper import dpd_json_to_curve, get_dpd_for_index
+
+        ce_curves = np.stack([dpd_json_to_curve(ce_json_new), dpd_json_to_curve(ce_json_old)])
+        wace_curve = Common.get_wace_curves(ce_curves)
+        return {str(get_dpd_for_index(dpd_index)): float(ce) for dpd_index, ce in enumerate(wace_curve)}
 
-            wace_dict[str_dpd] = ce_avg
+    @staticmethod
+    def get_wace_curves(ce_curves: 'np.ndarray', user_weights: 'np.ndarray' = None) -> 'np.ndarray':
+        """
+        helper function to find the (WACE) weighted average collection efficiency for any number of nbfc's and due
+        dates in a single matrix operation
+        :param ce_curves: array of shape (..., 2, 53) holding the New and Old user curves, e.g. the
+        (nbfc, due_date, 2, 53) array returned by Common.get_ce_curves
+        :param user_weights: array broadcastable to (..., 2) holding the New and Old user share, e.g. the array
+        returned by Common.get_user_mix_weights, weights of 1 are used for both user types if not passed
+        :return: array of shape (..., 53) with the weighted curves
+        """
+        import numpy as np
 
-        return wace_dict
+        if user_weights is None:
+            return ce_curves.sum(axis=-2)
+        user_weights = np.asarray(user_weights, dtype=ce_curves.dtype)
+        return (user_weights[..., np.newaxis, :] @ ce_curves)[..., 0, :]
+
+    @staticmethod
+    def get_ce_curves(nbfc_ids: list, due_dates: list) -> 'np.ndarray':
+        """
+        helper function to load the New and Old user collection efficiency curves of many nbfc's and due dates from
+        models.NbfcWiseCollectionData in a single query
+        :param nbfc_ids: list of nbfc ids, the order of the first axis
+        :param due_dates: list of due dates, the order of the second axis
+        :return: array of shape (len(nbfc_ids), len(due_dates), 2, 53), missing curves are 0
+        """
+        import numpy as np
+        from utils.ce_curve_helper import (CE_USER_TYPES, CE_CURVES_DTYPE, DPD_SLOTS, collection_json_to_curves,
+                                           decode_collection_curves)
+
+        nbfc_index = {nbfc_id: i for i, nbfc_id in enumerate(nbfc_ids)}
+        due_date_index = {due_date: i for i, due_date in enumerate(due_dates)}
+        ce_curves = np.zeros((len(nbfc_ids), len(due_dates), len(CE_USER_TYPES), DPD_SLOTS), dtype=CE_CURVES_DTYPE)
+
+        queryset = NbfcWiseCollectionData.objects.filter(nbfc_id__in=nbfc_ids, due_date__in=due_dates).values_list(
+            'nbfc_id', 'due_date', 'collection_curves', 'collection_json')
+        for nbfc_id, due_date, collection_curves, collection_json in queryset:
+            if collection_curves is not None:
+                curves = decode_collection_curves(collection_curves)
+            else:
+                curves = collection_json_to_curves(collection_json)
+            ce_curves[nbfc_index[nbfc_id], due_date_index[due_date]] = curves[due_date.day - 1]
+        return ce_curves
+
+    @staticmethod
+    def get_user_mix_weights(nbfc_ids: list, due_dates: list) -> 'np.ndarray':
+        """
+        helper function to get the New and Old user share from models.UserRatioData as weights for
+        Common.get_wace_curves
+        :param nbfc_ids: list of nbfc ids, the order of the first axis
+        :param due_dates: list of due dates, the order of the second axis
+        :return: array of shape (len(nbfc_ids), len(due_dates), 2) holding fractions, 80 old to 20 new by default
+        """
+        import numpy as np
+        from utils.ce_curve_helper import CE_USER_TYPES, CE_CURVES_DTYPE, NEW_USER_INDEX, OLD_USER_INDEX
+
+        user_weights = np.empty((len(nbfc_ids), len(due_dates), len(CE_USER_TYPES)), dtype=CE_CURVES_DTYPE)
+        for j, due_date in enumerate(due_dates):
+            user_ratio_value = Common.get_user_ratio(due_date)
+            for i, nbfc_id in enumerate(nbfc_ids):
+                old_percentage, new_percentage = user_ratio_value.get(nbfc_id, (80, 20))
+                user_weights[i, j, NEW_USER_INDEX] = new_percentage / 100
+                user_weights[i, j, OLD_USER_INDEX] = old_percentage / 100
+        return user_weights
 
     @staticmethod
     def get_collection_and_last_day_balance(nbfc_id: int, due_date: date) -> [float, float]:
@@ -154,9 +224,12 @@ class Common:
         :return: the nbfc id as an integer field, it will return -1 in case of no nbfc is found
         """
 
-        delay_in_disbursal = dict(NbfcBranchMaster.objects.filter(id__in=branches_list, delay_in_disbursal__isnull=False
-                                    ).order_by('delay_in_disbursal').values_list('id', 'delay_in_disbursal'))
-        available_credit_line = cache.get('available_balance', {})
+        branch_master = get_nbfc_branch_master()
+        delay_in_disbursal = {
+            i: branch_master[i]['delay_in_disbursal'] for i in branches_list
+            if i in branch_master and branch_master[i]['delay_in_disbursal'] is not None
+        }
+        available_credit_line = get_available_balance()
         selected_credit_line = [
             i if available_credit_line.get(i, {}).get(user_type, 0) >= sanctioned_amount else None
             for i in branches_list
@@ -292,6 +365,9 @@ def calculate_age(dob):
     return age
 
 
+BOOKING_LOG_REQUEST_FIELDS = ('assigned_nbfc', 'loan_type', 'user_type', 'cibil_score', 'credit_limit', 'amount')
+
+
 def save_log_response_for_booking_api(payload, response):
     """
     This helper function saves the log response in the log file every time the cash flow API is being hit.
@@ -310,9 +386,12 @@ def save_log_response_for_booking_api(payload, response):
         'ekyc': payload.get('ekyc'),
         'mkyc': payload.get('mkyc')
     }
+    # the inputs of the booking decision, read back by utils.replay_helper
+    request_data = {field: payload.get(field) for field in BOOKING_LOG_REQUEST_FIELDS}
     log_entry = (f"current_time:{current_time} ---> request_type:{payload.get('request_type', None)} ---> "
                  f"loan_id:{payload.get('loan_id', None)} ---> "f"user_id:{payload.get('user_id', None)} ---> "
                  f"dob:{payload.get('dob', None)} ---> kyc_data:{json.dumps(kyc_data)} ---> "
+                 f"request_data:{json.dumps(request_data, default=str)} ---> "
                  f"response_data:{json.dumps(response.data)} ---> "f"status_code:{response.status_code}")
 
     with open(log_file_path, "a") as file:
@@ -359,3 +438,52 @@ def create_kyc_filter(ckyc=False, ekyc=False, mkyc=False) -> Q:
     kyc_filter |= Q(ekyc=True) if ekyc is True else Q(ekyc=None)
     kyc_filter |= Q(mkyc=True) if mkyc is True else Q(mkyc=None)
     return kyc_filter
+
+
+def get_eligible_branches(loan_type: str, cibil_score: int, tenure_days: int, amount: float, age: int,
+                          ckyc=False, ekyc=False, mkyc=False) -> list:
+    """
+    helper function to match the cached eligibility rules against a loan, with the same conditions as querying
+    models.NBFCEligibilityCashFlowHead with create_kyc_filter and should_assign=True
+    :return: list of the eligible nbfc ids
+    """
+    amount = float(amount)
+    return [
+        rule['nbfc_id'] for rule in get_eligibility_rules()
+        if rule['should_assign'] and rule['loan_type'] == loan_type
+        and ((ckyc is True and rule['ckyc']) or (ekyc is True and rule['ekyc']) or (mkyc is True and rule['mkyc']))
+        and rule['min_cibil_score'] <= cibil_score
+        and rule['min_loan_tenure'] <= tenure_days <= rule['max_loan_tenure']
+        and rule['min_loan_amount'] <= amount <= rule['max_loan_amount']
+        and rule['min_age'] is not None and rule['max_age'] is not None
+        and rule['min_age'] <= age <= rule['max_age']
+    ]
+
+
+class EchoBuffer:
+    """
+    pseudo buffer for csv.writer returning the written line instead of storing it
+    """
+    def write(self, value):
+        return value
+
+
+def stream_csv_response(header: list, rows, file_name: str) -> StreamingHttpResponse:
+    """
+    helper function to stream the rows as a csv attachment one line at a time so the memory used stays bounded
+    irrespective of the number of rows
+    :param header: list of column names
+    :param rows: iterable of lists/tuples, preferably lazy like QuerySet.iterator()
+    :param file_name: name of the downloaded file
+    :return: StreamingHttpResponse
+    """
+    writer = csv.writer(EchoBuffer())
+
+    def csv_lines():
+        yield writer.writerow(header)
+        for row in rows:
+            yield writer.writerow(row)
+
+    response = StreamingHttpResponse(csv_lines(), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{file_name}"'
+    return response
@@ -0,0 +1,104 @@
+import hashlib
+import time
+
+from datetime import datetime
+from functools import wraps
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+
+ETAG_VERSION_KEY = 'etag_version'
+
+# scopes of the version stamps, a change to the data behind a scope bumps its stamp
+CASH_FLOW_SCOPE = 'cash_flow'
+BRANCH_MASTER_SCOPE = 'branch_master'
+ELIGIBILITY_SCOPE = 'eligibility'
+AVAILABLE_BALANCE_SCOPE = 'available_balance'
+
+
+def get_nbfc_scope(nbfc_id) -> str:
+    """
+    :return: the scope of the cash flow data of a single nbfc, CASH_FLOW_SCOPE covers the changes to many nbfc's
+    """
+    return f'{CASH_FLOW_SCOPE}:{nbfc_id}'
+
+
+def bump_etag_version(*scopes) -> None:
+    """
+    helper function to stamp the scopes with the current time once the running transaction commits, a reader can
+    not see the new stamp before the data it stands for
+    """
+    def bump():
+        stamp = time.time()
+        cache.set_many({f'{ETAG_VERSION_KEY}:{scope}': stamp for scope in scopes}, timeout=None)
+
+    transaction.on_commit(bump)
+
+
+def get_etag_versions(scopes: list) -> list:
+    """
+    helper function to read the stamps of the scopes, a scope missing in the cache (never bumped or evicted) is
+    stamped now as its data may have changed since any stamp a client holds
+    :return: list of the stamps in the order of the scopes
+    """
+    keys = [f'{ETAG_VERSION_KEY}:{scope}' for scope in scopes]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            cache.add(key, time.time(), timeout=None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def is_not_modified(request, etag: str, last_modified) -> bool:
+    """
+    :return: if the validators of the request match the current ones, If-None-Match takes precedence over
+    If-Modified-Since and is compared weakly as in rfc 9110, the compression middleware sends the tags as weak ones
+    """
+    if_none_match = request.headers.get('If-None-Match')
+    if if_none_match is not None:
+        return if_none_match.strip() == '*' or etag in [value.strip().removeprefix('W/')
+                                                        for value in if_none_match.split(',')]
+    if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since') or '')
+    return last_modified is not None and if_modified_since is not None and last_modified <= if_modified_since
+
+
+def conditional_response(get_scopes):
+    """
+    decorator for the get method of an api view, the ETag and Last-Modified of the response are built from the
+    stamps of the scopes the data comes from, a request sending back current validators gets an empty 304 without
+    running the view
+    :param get_scopes: callable(request) returning the list of scopes the response depends on
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(view, request, *args, **kwargs):
+            # the stamps are read before the view, a change racing with it only makes the next request miss
+            versions = get_etag_versions(get_scopes(request))
+            # the current date is part of the validators as the views default to the data of today
+            start_of_day = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+            etag_source = f'{type(view).__name__}|{request.get_full_path()}|{start_of_day.date()}|{versions}'
+            # the body is part of the tag as well, a few list apis read their filters from it
+            etag = f'"{hashlib.sha256(etag_source.encode() + request.body).hexdigest()[:32]}"'
+            # a stamp of the current second is not sent, a later change in the same second would keep the date
+            last_modified = int(max(versions + [start_of_day.timestamp()]))
+            if last_modified >= int(time.time()):
+                last_modified = None
+
+            if is_not_modified(request, etag, last_modified):
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            else:
+                response = func(view, request, *args, **kwargs)
+                if response.status_code != status.HTTP_200_OK:
+                    return response
+
+            response['ETag'] = etag
+            if last_modified is not None:
+                response['Last-Modified'] = http_date(last_modified)
+            # the dashboard is to revalidate on every poll instead of using a cached body
+            response['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
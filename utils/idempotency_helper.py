@@ -0,0 +1,86 @@
+import hashlib
+import json
+
+from functools import wraps
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+IDEMPOTENCY_KEY_HEADER = 'Idempotency-Key'
+IDEMPOTENT_REPLAY_HEADER = 'Idempotent-Replayed'
+IDEMPOTENCY_IN_FLIGHT_TIMEOUT = 30
+
+
+def get_payload_fingerprint(payload) -> str:
+    """
+    :return: sha256 of the payload, to tell a retry of a request from a different request reusing its key
+    """
+    if hasattr(payload, 'dict'):
+        payload = payload.dict()
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def get_idempotency_key(request, view_name: str, identity_fields: tuple):
+    """
+    helper function to build the cache key identifying a request, from the Idempotency-Key header if sent else
+    from the identity fields of the payload
+    :return: the cache key, None if the request has no header and misses any of the identity fields
+    """
+    header_value = request.headers.get(IDEMPOTENCY_KEY_HEADER)
+    if header_value:
+        return f"idempotency:{view_name}:key:{hashlib.sha256(header_value.encode()).hexdigest()}"
+
+    identity = [request.data.get(field) for field in identity_fields]
+    if any(value in (None, '') for value in identity):
+        return None
+    return f"idempotency:{view_name}:" + ':'.join(str(value) for value in identity)
+
+
+def idempotent_response(identity_fields: tuple, log_response=None):
+    """
+    decorator for the post method of an api view, a retry of a request within settings.IDEMPOTENCY_WINDOW seconds
+    gets the stored response of the first one from the cache without running the view again, a retry arriving
+    while the first one is still being served gets a 409
+    :param identity_fields: payload fields identifying a request when the Idempotency-Key header is not sent
+    :param log_response: callable(payload, response) called for the responses served from the cache
+    """
+    def decorator(func):
+        @wraps(func)
+        def wrapper(view, request, *args, **kwargs):
+            idempotency_key = get_idempotency_key(request, type(view).__name__, identity_fields)
+            if idempotency_key is None:
+                return func(view, request, *args, **kwargs)
+
+            fingerprint = get_payload_fingerprint(request.data)
+            stored_response = cache.get(idempotency_key)
+            if stored_response and stored_response['fingerprint'] == fingerprint:
+                response = Response(stored_response['data'], status=stored_response['status'])
+                response[IDEMPOTENT_REPLAY_HEADER] = 'true'
+                if log_response:
+                    log_response(request.data, response)
+                return response
+
+            in_flight_key = f"{idempotency_key}:in_flight"
+            if not cache.add(in_flight_key, fingerprint, IDEMPOTENCY_IN_FLIGHT_TIMEOUT):
+                response = Response({'message': 'the same request is already being processed, retry later'},
+                                    status=status.HTTP_409_CONFLICT)
+                response['Retry-After'] = '1'
+                if log_response:
+                    log_response(request.data, response)
+                return response
+
+            try:
+                response = func(view, request, *args, **kwargs)
+                # server errors are not stored so the retry runs the view again
+                if response.status_code < 500:
+                    cache.set(idempotency_key, {
+                        'fingerprint': fingerprint,
+                        'data': response.data,
+                        'status': response.status_code
+                    }, settings.IDEMPOTENCY_WINDOW)
+                return response
+            finally:
+                cache.delete(in_flight_key)
+        return wrapper
+    return decorator
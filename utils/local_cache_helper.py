@@ -0,0 +1,201 @@
+import json
+import logging
+import os
+import threading
+import time
+
+from collections import OrderedDict
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from cash_flow.models import NbfcBranchMaster, NBFCEligibilityCashFlowHead
+
+logger = logging.getLogger(__name__)
+
+SHOULD_CHECK_KEY = 'should_check'
+SHOULD_ASSIGN_KEY = 'should_assign'
+NBFC_BRANCH_MASTER_KEY = 'nbfc_branch_master'
+NBFC_ELIGIBILITY_RULES_KEY = 'nbfc_eligibility_rules'
+LOCAL_CACHE_INVALIDATION_CHANNEL = 'local_cache_invalidation'
+
+ELIGIBILITY_RULE_FIELDS = ('nbfc_id', 'loan_type', 'min_cibil_score', 'min_loan_tenure', 'max_loan_tenure',
+                           'min_loan_amount', 'max_loan_amount', 'min_age', 'max_age', 'ckyc', 'ekyc', 'mkyc',
+                           'should_check', 'should_assign')
+
+_MISSING = object()
+
+
+class LocalLRUCache:
+    """
+    process local lru cache with a ttl per entry, the ttl bounds the staleness when an invalidation message is missed
+    """
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._versions = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return default
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def version(self, key) -> int:
+        """
+        :return: number of times the key has been invalidated, used to drop a value loaded before an invalidation
+        """
+        with self._lock:
+            return self._versions.get(key, 0)
+
+    def set(self, key, value, version: int = None) -> None:
+        with self._lock:
+            if version is not None and version != self._versions.get(key, 0):
+                return
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def delete(self, *keys) -> None:
+        with self._lock:
+            for key in keys:
+                self._data.pop(key, None)
+                self._versions[key] = self._versions.get(key, 0) + 1
+
+    def clear(self) -> None:
+        with self._lock:
+            for key in self._data:
+                self._versions[key] = self._versions.get(key, 0) + 1
+            self._data.clear()
+
+
+local_cache = LocalLRUCache(settings.LOCAL_CACHE_MAX_SIZE, settings.LOCAL_CACHE_TTL)
+
+_listener_state = {
+    'pid': None,
+}
+_listener_lock = threading.Lock()
+
+
+def _listen_for_invalidations() -> None:
+    """
+    loop of the listener thread evicting the keys published on LOCAL_CACHE_INVALIDATION_CHANNEL, the local tier is
+    cleared whenever the subscription is (re)established as messages may have been missed while it was down
+    """
+    from django_redis import get_redis_connection
+
+    while True:
+        try:
+            pubsub = get_redis_connection('default').pubsub(ignore_subscribe_messages=True)
+            pubsub.subscribe(LOCAL_CACHE_INVALIDATION_CHANNEL)
+            local_cache.clear()
+            for message in pubsub.listen():
+                local_cache.delete(*json.loads(message['data']))
+        except NotImplementedError:
+            logger.warning('cache backend has no pub/sub, local cache entries expire by the ttl only')
+            return
+        except Exception as e:
+            logger.warning('local cache invalidation listener failed, reconnecting: %s', e)
+            local_cache.clear()
+            time.sleep(1)
+
+
+def start_invalidation_listener() -> None:
+    """
+    function to start the invalidation listener thread once per process, forked workers start their own
+    """
+    pid = os.getpid()
+    if _listener_state['pid'] == pid:
+        return
+    with _listener_lock:
+        if _listener_state['pid'] == pid:
+            return
+        _listener_state['pid'] = pid
+        threading.Thread(target=_listen_for_invalidations, name='local-cache-invalidation', daemon=True).start()
+
+
+def get_two_tier(key: str, loader=None, default=None, timeout: int = None, prepare=None):
+    """
+    helper function to read a key through the process local tier, then the shared cache and finally the loader
+    :param key: cache key
+    :param loader: callable returning the value when the shared cache misses too, the value is then written to the
+    shared cache for timeout seconds, if None the default is returned without being stored locally
+    :param default: value returned when the key is missing in both tiers and there is no loader
+    :param timeout: timeout of the shared cache entry written from the loader
+    :param prepare: callable converting the shared value into the form kept locally, e.g. a list into a frozenset
+    """
+    start_invalidation_listener()
+    value = local_cache.get(key, _MISSING)
+    if value is not _MISSING:
+        return value
+
+    version = local_cache.version(key)
+    value = cache.get(key, _MISSING)
+    if value is _MISSING:
+        if loader is None:
+            return default
+        value = loader()
+        cache.set(key, value, timeout)
+    if prepare is not None:
+        value = prepare(value)
+    local_cache.set(key, value, version=version)
+    return value
+
+
+def invalidate_two_tier(*keys, delete_shared: bool = False) -> None:
+    """
+    helper function to evict the keys from the local tier of every process once the running transaction commits,
+    a process reloading the keys after the eviction can not read the rows as they were before the change
+    :param keys: cache keys to be evicted
+    :param delete_shared: if the keys are to be deleted from the shared cache as well, False when the caller has
+    just written the new values there
+    """
+    def invalidate():
+        if delete_shared:
+            cache.delete_many(keys)
+        local_cache.delete(*keys)
+        try:
+            from django_redis import get_redis_connection
+            get_redis_connection('default').publish(LOCAL_CACHE_INVALIDATION_CHANNEL, json.dumps(keys))
+        except NotImplementedError:
+            pass
+        except Exception as e:
+            # the other processes drop their copies at the ttl at the latest
+            logger.warning('failed to publish the local cache invalidation of %s: %s', keys, e)
+
+    transaction.on_commit(invalidate)
+
+
+def get_should_check_branches() -> frozenset:
+    """
+    :return: ids of the branches to be checked before booking, as populated by
+    tasks.populate_should_assign_should_check_cache
+    """
+    return get_two_tier(SHOULD_CHECK_KEY, default=frozenset(), prepare=frozenset)
+
+
+def get_nbfc_branch_master() -> dict:
+    """
+    :return: {<nbfc_id>: {'branch_name': value, 'is_enable': value, 'delay_in_disbursal': value}}
+    """
+    return get_two_tier(NBFC_BRANCH_MASTER_KEY, loader=lambda: {
+        branch['id']: branch for branch in
+        NbfcBranchMaster.objects.values('id', 'branch_name', 'is_enable', 'delay_in_disbursal')
+    }, timeout=settings.LOCAL_CACHE_SHARED_TIMEOUT)
+
+
+def get_eligibility_rules() -> list:
+    """
+    :return: list of the models.NBFCEligibilityCashFlowHead rows as dicts of ELIGIBILITY_RULE_FIELDS
+    """
+    return get_two_tier(NBFC_ELIGIBILITY_RULES_KEY, loader=lambda: list(
+        NBFCEligibilityCashFlowHead.objects.values(*ELIGIBILITY_RULE_FIELDS)
+    ), timeout=settings.LOCAL_CACHE_SHARED_TIMEOUT)
@@ -0,0 +1,45 @@
+from rest_framework.pagination import CursorPagination
+from rest_framework.response import Response
+
+
+class KeysetPagination(CursorPagination):
+    """
+    cursor pagination seeking on an indexed unique column instead of an offset, so every page costs the same
+    however deep it is, the view can set keyset_ordering to change the column or the direction
+    the total count is returned along with the page unless skip_count=true is passed
+    """
+    ordering = 'id'
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+    skip_count_query_param = 'skip_count'
+
+    def get_ordering(self, request, queryset, view):
+        ordering = getattr(view, 'keyset_ordering', None) or self.ordering
+        return (ordering,) if isinstance(ordering, str) else tuple(ordering)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if request.query_params.get(self.skip_count_query_param, '').lower() not in ('1', 'true'):
+            self.count = queryset.count()
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_data(self, data, data_key: str = 'results') -> dict:
+        """
+        :return: the page as {'count': value, 'next': url, 'previous': url, <data_key>: data}, count is left out
+        when skipped
+        """
+        paginated_data = {'count': self.count} if self.count is not None else {}
+        paginated_data.update({
+            'next': self.get_next_link(),
+            'previous': self.get_previous_link(),
+            data_key: data
+        })
+        return paginated_data
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+    def get_paginated_response_schema(self, schema):
+        response_schema = super().get_paginated_response_schema(schema)
+        response_schema['properties'] = {'count': {'type': 'integer', 'example': 123}, **response_schema['properties']}
+        return response_schema
@@ -0,0 +1,108 @@
+import logging
+import time
+import uuid
+
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from django.db import connections
+from django.utils import timezone
+from cash_flow.models import PipelineStageRun
+
+logger = logging.getLogger(__name__)
+
+
+def get_stage_order(stages: dict) -> list:
+    """
+    :param stages: {<stage name>: {'func': callable(inputs), 'inputs': [stage names]}}
+    :return: list of the stage names with every stage after its inputs
+    :raise ValueError: if a stage has an unknown input or the stages have a cycle
+    """
+    order = []
+    visiting = set()
+
+    def visit(name, path):
+        if name in order:
+            return
+        if name not in stages:
+            raise ValueError(f'unknown input {name} of the stage {path[-1]}')
+        if name in visiting:
+            raise ValueError(f'cycle in the stages: {" -> ".join(path + [name])}')
+        visiting.add(name)
+        for input_name in stages[name]['inputs']:
+            visit(input_name, path + [name])
+        order.append(name)
+
+    for stage_name in stages:
+        visit(stage_name, [])
+    return order
+
+
+def run_stage(func, inputs: dict):
+    """
+    function run in a pipeline thread, the database connections the stage opened in the thread are closed after it
+    :return: (value returned by the stage, exception raised by it, start time, seconds taken)
+    """
+    started_at = timezone.now()
+    start_time = time.perf_counter()
+    value, error = None, None
+    try:
+        value = func(inputs)
+    except Exception as e:
+        error = e
+    finally:
+        connections.close_all()
+    return value, error, started_at, time.perf_counter() - start_time
+
+
+def run_pipeline(pipeline_name: str, stages: dict, max_workers: int) -> dict:
+    """
+    helper function to run the stages of a pipeline as soon as all their inputs are done, up to max_workers at once,
+    a stage whose input failed or was skipped is skipped so nothing runs on partly updated data, every stage is
+    recorded in models.PipelineStageRun as it ends
+    :param stages: {<stage name>: {'func': callable(inputs), 'inputs': [stage names]}}, func gets the values returned
+    by its inputs as {<stage name>: value}
+    :return: {<stage name>: models.PipelineStageRun}
+    """
+    order = get_stage_order(stages)
+    run_id = uuid.uuid4()
+    stage_runs = {}
+    values = {}
+    pending = list(order)
+    futures = {}
+
+    def record(stage_name, status, started_at=None, seconds=None, is_stale=False, error=None):
+        stage_runs[stage_name] = PipelineStageRun.objects.create(
+            run_id=run_id, pipeline=pipeline_name, stage=stage_name, status=status, started_at=started_at,
+            seconds=seconds, is_stale=is_stale, error=error)
+        logger.info('%s %s %s in %ss', pipeline_name, stage_name, stage_runs[stage_name].get_status_display(),
+                    seconds)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=pipeline_name) as executor:
+            while pending or futures:
+                for stage_name in list(pending):
+                    inputs = stages[stage_name]['inputs']
+                    if any(stage_runs[input_name].status != 'S' for input_name in inputs if input_name in stage_runs):
+                        pending.remove(stage_name)
+                        record(stage_name, 'K')
+                    elif all(input_name in values for input_name in inputs):
+                        pending.remove(stage_name)
+                        future = executor.submit(run_stage, stages[stage_name]['func'],
+                                                 {input_name: values[input_name] for input_name in inputs})
+                        futures[future] = stage_name
+
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    stage_name = futures.pop(future)
+                    value, error, started_at, seconds = future.result()
+                    if error is not None:
+                        logger.error('%s %s failed', pipeline_name, stage_name, exc_info=error)
+                        record(stage_name, 'F', started_at, seconds, error=f'{type(error).__name__}: {error}')
+                        continue
+                    values[stage_name] = value
+                    record(stage_name, 'S', started_at, seconds, is_stale=getattr(value, 'is_stale', False))
+    finally:
+        # the fetched responses hold their body open until they are read, the ones never read are closed here
+        for value in values.values():
+            if hasattr(value, 'close'):
+                value.close()
+    return stage_runs
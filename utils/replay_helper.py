@@ -0,0 +1,275 @@
+import copy
+import json
+import math
+import os
+
+from datetime import datetime
+
+import numpy as np
+
+from cash_flow.models import NbfcBranchMaster, NBFCEligibilityCashFlowHead
+from cash_flow.tasks import get_available_cash_flow_inputs, get_available_cash_flow_split
+from cash_flow_prediction.db_router import use_replica
+from utils.local_cache_helper import ELIGIBILITY_RULE_FIELDS
+
+BOOKING_LOG_DIRECTORY = 'logs'
+USER_TYPE_CODES = {'O': 0, 'N': 1}
+TOTAL_INDEX = 2
+LOAN_TYPE_CODES = {'E': 0, 'P': 1}
+KYC_BITS = {'ckyc': 1, 'ekyc': 2, 'mkyc': 4}
+# the view leaves the loans of the test nbfc where they are without any eligibility check
+TEST_NBFC_ID = 5
+
+BOOKING_REQUEST_DTYPE = np.dtype([
+    ('loan_id', np.int64),
+    ('user_type', np.int8),
+    ('loan_type', np.int8),
+    ('tenure_days', np.int16),
+    ('cibil_score', np.int32),
+    ('amount', np.float64),
+    ('age', np.int16),
+    ('kyc', np.uint8),
+    ('assigned_nbfc', np.int64),
+    ('logged_nbfc', np.int64),
+])
+
+
+def parse_booking_log_line(line: str):
+    """
+    helper function to convert a line of the book_nbfc logs into a row of BOOKING_REQUEST_DTYPE
+    :return: tuple of the row, None if the line is not a booking decision (a rejected payload, the test nbfc) or was
+    written before the request data was logged
+    """
+    fields = dict(part.partition(':')[::2] for part in line.rstrip('\n').split(' ---> '))
+    try:
+        request_data = json.loads(fields['request_data'])
+        response_data = json.loads(fields['response_data'])
+        kyc_data = json.loads(fields['kyc_data'])
+        status_code = int(fields['status_code'])
+    except (KeyError, ValueError):
+        return None
+
+    decision = response_data.get('data') if isinstance(response_data, dict) else None
+    assigned_nbfc = request_data.get('assigned_nbfc')
+    if status_code not in (200, 406) or not isinstance(decision, dict) or 'updated_nbfc' not in decision \
+            or assigned_nbfc == TEST_NBFC_ID:
+        return None
+
+    try:
+        loan_type = request_data['loan_type']
+        credit_limit = float(request_data['credit_limit'])
+        amount = float(request_data['amount']) if request_data.get('amount') else credit_limit
+        request_date = datetime.strptime(fields['current_time'][:10], '%Y-%m-%d').date()
+        dob = datetime.strptime(fields['dob'], '%Y-%m-%d').date()
+        loan_id = fields.get('loan_id')
+        row = (
+            int(loan_id) if loan_id not in (None, 'None', '') else -1,
+            USER_TYPE_CODES[request_data.get('user_type') or 'O'],
+            LOAN_TYPE_CODES['E' if loan_type != 'P' else 'P'],
+            int(loan_type[1:]) if loan_type.startswith('E') else 45,
+            int(request_data['cibil_score']),
+            amount if fields.get('request_type') == 'LAD' else credit_limit,
+            request_date.year - dob.year - ((request_date.month, request_date.day) < (dob.month, dob.day)),
+            sum(bit for kyc, bit in KYC_BITS.items() if kyc_data.get(kyc) is True),
+            int(assigned_nbfc) if assigned_nbfc else -1,
+            int(decision['updated_nbfc']) if decision['updated_nbfc'] else -1,
+        )
+    except (KeyError, ValueError, TypeError):
+        return None
+    return row
+
+
+class BookingRequestStream:
+    """
+    array backed stream of the booking decisions of a day parsed from the book_nbfc logs, one row of
+    BOOKING_REQUEST_DTYPE per request in the order they were served
+    """
+    def __init__(self, requests: np.ndarray, skipped: int = 0):
+        self.requests = requests
+        self.skipped = skipped
+
+    def __len__(self):
+        return len(self.requests)
+
+    @classmethod
+    def from_lines(cls, lines):
+        rows = []
+        skipped = 0
+        for line in lines:
+            row = parse_booking_log_line(line)
+            if row is None:
+                skipped += 1
+                continue
+            rows.append(row)
+        return cls(np.array(rows, dtype=BOOKING_REQUEST_DTYPE), skipped)
+
+    @classmethod
+    def from_log_file(cls, log_date, log_directory: str = BOOKING_LOG_DIRECTORY):
+        log_file_path = os.path.join(log_directory, f"book_nbfc-logs-{log_date.strftime('%Y-%m-%d')}.txt")
+        with open(log_file_path) as log_file:
+            return cls.from_lines(log_file)
+
+
+class ReplayConfig:
+    """
+    in memory copy of everything a booking decision depends on for a date, the cash flow inputs of every nbfc, the
+    eligibility rules and the delay in disbursal used to prefer a nbfc
+    """
+    def __init__(self, cash_flow_inputs: dict, eligibility_rules: list, delay_in_disbursal: dict):
+        self.cash_flow_inputs = cash_flow_inputs
+        self.eligibility_rules = eligibility_rules
+        self.delay_in_disbursal = delay_in_disbursal
+
+    @classmethod
+    def from_database(cls, due_date):
+        with use_replica():
+            return cls(
+                get_available_cash_flow_inputs(due_date),
+                list(NBFCEligibilityCashFlowHead.objects.values(*ELIGIBILITY_RULE_FIELDS)),
+                dict(NbfcBranchMaster.objects.values_list('id', 'delay_in_disbursal')),
+            )
+
+    @classmethod
+    def from_json(cls, config_json: dict):
+        # json object keys are strings, the nbfc's are keyed by their integer id
+        return cls(
+            {int(nbfc_id): inputs for nbfc_id, inputs in config_json['cash_flow_inputs'].items()},
+            config_json['eligibility_rules'],
+            {int(nbfc_id): delay for nbfc_id, delay in config_json['delay_in_disbursal'].items()},
+        )
+
+    def to_json(self) -> dict:
+        return {
+            'cash_flow_inputs': self.cash_flow_inputs,
+            'eligibility_rules': self.eligibility_rules,
+            'delay_in_disbursal': self.delay_in_disbursal,
+        }
+
+    def with_overrides(self, overrides: dict):
+        """
+        :param overrides: {'hold_cash': {<nbfc_id>: value}, 'user_ratio': {<nbfc_id>: [old, new]},
+        'capital_inflow': {<nbfc_id>: value}, 'delay_in_disbursal': {<nbfc_id>: value},
+        'eligibility': {<nbfc_id>: {<eligibility rule field>: value}}}, every key is optional
+        :return: a new config with the overrides applied
+        """
+        config = ReplayConfig(*copy.deepcopy((self.cash_flow_inputs, self.eligibility_rules,
+                                              self.delay_in_disbursal)))
+        for input_name in ('hold_cash', 'user_ratio', 'capital_inflow'):
+            for nbfc_id, value in overrides.get(input_name, {}).items():
+                if int(nbfc_id) in config.cash_flow_inputs:
+                    config.cash_flow_inputs[int(nbfc_id)][input_name] = value
+        for nbfc_id, value in overrides.get('delay_in_disbursal', {}).items():
+            config.delay_in_disbursal[int(nbfc_id)] = value
+        for nbfc_id, rule_values in overrides.get('eligibility', {}).items():
+            for rule in config.eligibility_rules:
+                if rule['nbfc_id'] == int(nbfc_id):
+                    rule.update(rule_values)
+        return config
+
+
+def get_eligibility_matrix(requests: np.ndarray, eligibility_rules: list, nbfc_index: dict) -> np.ndarray:
+    """
+    helper function to match every request against every eligibility rule at once, with the same conditions as
+    utils.common_helper.get_eligible_branches
+    :return: boolean array of shape (requests, nbfc's) in the column order of nbfc_index
+    """
+    eligible = np.zeros((len(requests), len(nbfc_index)), dtype=bool)
+    for rule in eligibility_rules:
+        column = nbfc_index.get(rule['nbfc_id'])
+        if column is None or not rule['should_assign'] or rule['min_age'] is None or rule['max_age'] is None:
+            continue
+        kyc_mask = sum(bit for kyc, bit in KYC_BITS.items() if rule[kyc])
+        eligible[:, column] |= (
+            (requests['loan_type'] == LOAN_TYPE_CODES.get(rule['loan_type'], -1))
+            & ((requests['kyc'] & kyc_mask) != 0)
+            & (requests['cibil_score'] >= rule['min_cibil_score'])
+            & (requests['tenure_days'] >= rule['min_loan_tenure'])
+            & (requests['tenure_days'] <= rule['max_loan_tenure'])
+            & (requests['amount'] >= rule['min_loan_amount']) & (requests['amount'] <= rule['max_loan_amount'])
+            & (requests['age'] >= rule['min_age']) & (requests['age'] <= rule['max_age'])
+        )
+    return eligible
+
+
+def select_nbfc(branches: list, balance: list, delay_in_disbursal: list, user_type: int, amount: float) -> int:
+    """
+    helper function replaying Common.get_nbfc_for_loan_to_be_booked on the in memory balances, the branch with
+    the longest delay in disbursal among the ones with enough balance wins, else the one the loan dents the least
+    :return: column of the selected nbfc
+    """
+    selected = [column for column in branches if balance[column][user_type] >= amount]
+    if selected:
+        return max(selected, key=lambda column: delay_in_disbursal[column])
+
+    def or_ratio(column):
+        available = balance[column][user_type]
+        return (available + amount) / available if available else math.inf
+    return min(branches, key=or_ratio)
+
+
+def replay_booking_requests(stream: BookingRequestStream, config: ReplayConfig) -> dict:
+    """
+    function to re-run the eligibility and allocation of every request of the stream against the config, entirely
+    in memory, starting from the available balance of the day before any booking
+    :return: {'requests': value, 'skipped_lines': value, 'rejected': value, 'changed': requests allocated to a
+    different nbfc than logged, 'nbfcs': {<nbfc_id>: {'loans', 'booked', 'available', 'remaining', 'utilization'}}}
+    """
+    requests = stream.requests
+    nbfc_ids = sorted(nbfc_id for nbfc_id, inputs in config.cash_flow_inputs.items() if inputs['hold_cash'] != 100)
+    nbfc_index = {nbfc_id: column for column, nbfc_id in enumerate(nbfc_ids)}
+    start_balance = np.array([get_available_cash_flow_split(config.cash_flow_inputs[nbfc_id])
+                              for nbfc_id in nbfc_ids], dtype=np.float64).reshape(-1, 3)
+
+    eligible_rows = get_eligibility_matrix(requests, config.eligibility_rules, nbfc_index).tolist()
+    balance = start_balance.tolist()
+    delay_in_disbursal = [config.delay_in_disbursal.get(nbfc_id) or 0 for nbfc_id in nbfc_ids]
+    allocated = np.full(len(requests), -1, dtype=np.int64)
+    booked_loans = {}
+
+    for row, (loan_id, user_type, amount, assigned_nbfc) in enumerate(zip(
+            requests['loan_id'].tolist(), requests['user_type'].tolist(), requests['amount'].tolist(),
+            requests['assigned_nbfc'].tolist())):
+        branches = [column for column, is_eligible in enumerate(eligible_rows[row]) if is_eligible]
+        if not branches:
+            continue
+
+        # a loan booked earlier in the day stays with its nbfc while it is eligible, like in the view
+        previous_booking = booked_loans.get(loan_id) if loan_id >= 0 else None
+        assigned_column = previous_booking[0] if previous_booking else nbfc_index.get(assigned_nbfc)
+        if assigned_column in branches and (previous_booking or balance[assigned_column][user_type] >= amount):
+            column = assigned_column
+        else:
+            column = select_nbfc(branches, balance, delay_in_disbursal, user_type, amount)
+
+        if previous_booking:
+            previous_column, previous_user_type, previous_amount = previous_booking
+            balance[previous_column][previous_user_type] += previous_amount
+            balance[previous_column][TOTAL_INDEX] += previous_amount
+        balance[column][user_type] -= amount
+        balance[column][TOTAL_INDEX] -= amount
+        if loan_id >= 0:
+            booked_loans[loan_id] = (column, user_type, amount)
+        allocated[row] = nbfc_ids[column]
+
+    end_balance = np.array(balance, dtype=np.float64).reshape(-1, 3)
+    booked = start_balance[:, TOTAL_INDEX] - end_balance[:, TOTAL_INDEX]
+    allocated_columns = np.searchsorted(nbfc_ids, allocated[allocated >= 0]) if nbfc_ids else np.array([], int)
+    loans = np.bincount(allocated_columns, minlength=len(nbfc_ids))
+
+    return {
+        'requests': len(requests),
+        'skipped_lines': stream.skipped,
+        'rejected': int((allocated < 0).sum()),
+        'changed': int((allocated != requests['logged_nbfc']).sum()),
+        'nbfcs': {
+            nbfc_id: {
+                'loans': int(loans[column]),
+                'booked': float(booked[column]),
+                'available': float(start_balance[column, TOTAL_INDEX]),
+                'remaining': float(end_balance[column, TOTAL_INDEX]),
+                'utilization': float(booked[column] / start_balance[column, TOTAL_INDEX])
+                if start_balance[column, TOTAL_INDEX] > 0 else None,
+            }
+            for column, nbfc_id in enumerate(nbfc_ids)
+        }
+    }
@@ -0,0 +1,41 @@
+import time
+
+from django.conf import settings
+from django_redis import get_redis_connection
+
+LOAN_RESERVATION_KEY = 'loan_reservations'
+
+
+def add_loan_reservation(loan_id: int, expiry_seconds: int = None) -> None:
+    """
+    helper function to track a booked 'I' (LAN) loan in the reservation sorted set, the score of the member is
+    the unix time at which the reservation expires, booking the same loan again pushes its expiry ahead
+    :param loan_id: primary key of models.LoanDetail
+    :param expiry_seconds: seconds after which the reservation expires, defaults to settings.LOAN_RESERVATION_EXPIRY
+    """
+    if expiry_seconds is None:
+        expiry_seconds = settings.LOAN_RESERVATION_EXPIRY
+    get_redis_connection('default').zadd(LOAN_RESERVATION_KEY, {loan_id: time.time() + expiry_seconds})
+
+
+def remove_loan_reservation(loan_id: int) -> None:
+    """
+    helper function to stop tracking a loan once it is no longer held, e.g. on loan applied (LAD)
+    :param loan_id: primary key of models.LoanDetail
+    """
+    get_redis_connection('default').zrem(LOAN_RESERVATION_KEY, loan_id)
+
+
+def pop_expired_reservations(batch_size: int = 100, now: float = None) -> list:
+    """
+    helper function to claim at most batch_size expired reservations from the sorted set, a member is only
+    returned to the caller that managed to remove it so concurrent workers never release the same loan twice
+    :param batch_size: maximum number of reservations to be claimed
+    :param now: unix time to be compared against the expiry, defaults to the current time
+    :return: list of models.LoanDetail primary keys whose reservation has expired
+    """
+    if now is None:
+        now = time.time()
+    redis_conn = get_redis_connection('default')
+    expired = redis_conn.zrangebyscore(LOAN_RESERVATION_KEY, '-inf', now, start=0, num=batch_size)
+    return [int(loan_id) for loan_id in expired if redis_conn.zrem(LOAN_RESERVATION_KEY, loan_id)]
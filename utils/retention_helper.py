@@ -0,0 +1,123 @@
+import gzip
+import json
+import os
+
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import F, Sum, Count
+from django.db.models.functions import TruncDate
+from cash_flow.models import (ProjectionCollectionData, LoanBookedLogs, CollectionLogs,
+                              ProjectionCollectionDailyRollup, LoanBookedLogsDailyRollup, CollectionLogsDailyRollup)
+from utils.etag_helper import bump_etag_version, CASH_FLOW_SCOPE
+
+# for every append heavy table: the column deciding the age of a row, the rollup model and the expressions
+# grouping and summing the archived rows into it
+RETENTION_POLICIES = {
+    'ProjectionCollectionData': {
+        'model': ProjectionCollectionData,
+        'date_field': 'collection_date',
+        'rollup_model': ProjectionCollectionDailyRollup,
+        'rollup_keys': {
+            'nbfc_id': F('nbfc_id'),
+            'collection_date': F('collection_date'),
+        },
+        'rollup_sums': ['amount', 'old_user_amount', 'new_user_amount'],
+    },
+    'LoanBookedLogs': {
+        'model': LoanBookedLogs,
+        'date_field': 'created_at',
+        'rollup_model': LoanBookedLogsDailyRollup,
+        'rollup_keys': {
+            'nbfc_id': F('loan__nbfc_id'),
+            'date': TruncDate('created_at'),
+            'request_type': F('request_type'),
+        },
+        'rollup_sums': ['amount'],
+    },
+    'CollectionLogs': {
+        'model': CollectionLogs,
+        'date_field': 'created_at',
+        'rollup_model': CollectionLogsDailyRollup,
+        'rollup_keys': {
+            'nbfc_id': F('collection__nbfc_id'),
+            'date': TruncDate('created_at'),
+        },
+        'rollup_sums': ['amount'],
+    },
+}
+
+
+def write_archive_file(table_name: str, rows: list) -> str:
+    """
+    helper function to export the raw rows of a chunk into a gzip compressed json lines file named after the
+    table and the id range of the chunk, so a chunk retried after a failure overwrites its own file
+    :param table_name: key of the table in RETENTION_POLICIES
+    :param rows: list of dicts as returned by QuerySet.values()
+    :return: path of the archive file
+    """
+    archive_directory = os.path.join(settings.ARCHIVE_ROOT, table_name, datetime.now().strftime('%Y-%m-%d'))
+    if not os.path.exists(archive_directory):
+        os.makedirs(archive_directory)
+
+    archive_file_path = os.path.join(archive_directory, f"{rows[0]['id']}-{rows[-1]['id']}.jsonl.gz")
+    with gzip.open(archive_file_path, 'wt', encoding='utf-8') as file:
+        for row in rows:
+            file.write(json.dumps(row, cls=DjangoJSONEncoder) + '\n')
+    return archive_file_path
+
+
+def rollup_chunk(policy: dict, chunk_ids: list) -> None:
+    """
+    helper function to add the daily totals of a chunk of rows into the rollup model of the table
+    :param policy: value from RETENTION_POLICIES
+    :param chunk_ids: primary keys of the rows of the chunk
+    """
+    key_alias = {f'key_{key}': expression for key, expression in policy['rollup_keys'].items()}
+    sum_alias = {f'sum_{field}': Sum(field) for field in policy['rollup_sums']}
+    groups = policy['model'].objects.filter(id__in=chunk_ids).order_by().values(**key_alias).annotate(
+        row_count=Count('id'), **sum_alias)
+
+    rollup_model = policy['rollup_model']
+    for group in groups:
+        lookup = {key: group[f'key_{key}'] for key in policy['rollup_keys']}
+        rollup_instance, _ = rollup_model.objects.get_or_create(**lookup)
+        increments = {field: F(field) + (group[f'sum_{field}'] or 0) for field in policy['rollup_sums']}
+        rollup_model.objects.filter(id=rollup_instance.id).update(row_count=F('row_count') + group['row_count'],
+                                                                  **increments)
+
+
+def archive_table(table_name: str, retention_days: int, chunk_size: int = None, today=None) -> int:
+    """
+    function to roll up, archive and delete the rows of a table older than the retention window, rows are
+    processed in chunks of chunk_size with every chunk rolled up and deleted in its own short transaction so
+    no long lock is held on the table
+    :param table_name: key of the table in RETENTION_POLICIES
+    :param retention_days: number of days of rows to be kept
+    :param chunk_size: number of rows per chunk, defaults to settings.DATA_RETENTION_CHUNK_SIZE
+    :param today: date the retention window is counted back from, defaults to the current date
+    :return: number of rows deleted
+    """
+    policy = RETENTION_POLICIES[table_name]
+    if chunk_size is None:
+        chunk_size = settings.DATA_RETENTION_CHUNK_SIZE
+    if not today:
+        today = datetime.now().date()
+    cutoff_date = today - timedelta(days=retention_days)
+
+    model = policy['model']
+    queryset = model.objects.filter(**{f"{policy['date_field']}__lt": cutoff_date}).order_by('id')
+    deleted = 0
+    while True:
+        chunk_ids = list(queryset.values_list('id', flat=True)[:chunk_size])
+        if not chunk_ids:
+            return deleted
+
+        rows = list(model.objects.filter(id__in=chunk_ids).order_by('id').values())
+        write_archive_file(table_name, rows)
+        with transaction.atomic():
+            rollup_chunk(policy, chunk_ids)
+            model.objects.filter(id__in=chunk_ids).delete()
+            bump_etag_version(CASH_FLOW_SCOPE)
+        deleted += len(chunk_ids)
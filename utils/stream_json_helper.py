@@ -0,0 +1,34 @@
+import logging
+
+import ijson
+
+logger = logging.getLogger(__name__)
+
+
+def iter_response_items(response, prefix: str = 'data', strict: bool = False):
+    """
+    helper function to walk the object at prefix of a streamed json response one key at a time, only the value
+    being yielded is held in memory instead of the whole payload
+    :param response: requests response fetched with stream=True
+    :param prefix: ijson prefix of the object to be walked, 'data' for {"data": {<nbfc_id>: value}}
+    :param strict: if an error status or a truncated or malformed body is to be raised instead of ending the walk,
+    for the callers that must not go on with part of the items (e.g. the stages of utils.pipeline_helper)
+    :return: generator of (key, value), the 'null' key is skipped, numbers are parsed as floats
+    :raise requests.HTTPError: if strict and the response has an error status
+    :raise ijson.JSONError: if strict and the body can not be parsed to the end
+    """
+    try:
+        if strict:
+            response.raise_for_status()
+        # raw is the undecoded socket stream, the gzip/deflate content encoding is to be undone while reading it
+        response.raw.decode_content = True
+        for key, value in ijson.kvitems(response.raw, prefix, use_float=True):
+            if key == 'null':
+                continue
+            yield key, value
+    except ijson.JSONError as e:
+        logger.warning('stopped parsing the response of %s: %s', response.url, e)
+        if strict:
+            raise
+    finally:
+        response.close()